@@ -1,22 +1,56 @@
+import sqlite3
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
 from config import config
 
 db = SQLAlchemy()
 login_manager = LoginManager()
 
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers (progress polls, page views) run while a timetable is saved;
+    synchronous=NORMAL is safe under WAL and makes bulk lesson writes much cheaper"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
 def create_app(config_name='development'):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    app.config['CONFIG_NAME'] = config_name  # so worker processes can rebuild the same app
     
     db.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     
+    from app.cache import LRUCache
+    from app.stats import RunTotals
+    app.extensions['timetable_cache'] = LRUCache(app.config['TIMETABLE_CACHE_BYTES'])
+    app.extensions['metrics_totals'] = RunTotals()
+    
     with app.app_context():
-        from app.models import School, Teacher, Subject, Class, Lesson, TimeSlot
+        from app.models import School, Teacher, Subject, Class, Lesson, TimeSlot, GenerationJob, GenerationRun
         db.create_all()
+        # create_all skips new columns and indexes on tables that already exist;
+        # columns added to existing tables must therefore be nullable
+        existing_columns = {
+            table.name: {c['name'] for c in inspect(db.engine).get_columns(table.name)}
+            for table in db.metadata.sorted_tables
+        }
+        with db.engine.begin() as conn:
+            for table in db.metadata.sorted_tables:
+                for column in table.columns:
+                    if column.name not in existing_columns[table.name]:
+                        column_type = column.type.compile(db.engine.dialect)
+                        conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
     
     # Register blueprints
     from app.routes import main_bp, auth_bp, school_bp, timetable_bp
@@ -25,4 +59,8 @@ def create_app(config_name='development'):
     app.register_blueprint(school_bp)
     app.register_blueprint(timetable_bp)
     
+    # CLI commands
+    from app.batch import generate_timetables_command
+    app.cli.add_command(generate_timetables_command)
+    
     return app
@@ -0,0 +1,68 @@
+from collections import defaultdict
+
+
+def weekly_periods(subject):
+    """Periods a week one class's lessons of a subject take (a double counts two)"""
+    doubles = subject.double_lessons_per_week
+    return doubles * 2 + max(subject.max_lessons_per_week - doubles * 2, 0)
+
+
+def teacher_candidates(snapshot, pairs):
+    """Teachers who may take each (class_id, subject_id) pair
+
+    A pair's candidates are the teachers assigned to that subject for that class. A
+    class with no assignment row of its own for the subject may have any teacher of
+    the subject. Pairs without any candidate are left out.
+    """
+    per_class = defaultdict(list)
+    for assignment in snapshot.assignments:
+        teachers = per_class[(assignment.class_id, assignment.subject_id)]
+        if assignment.teacher_id not in teachers:
+            teachers.append(assignment.teacher_id)
+
+    candidates = {}
+    for pair in pairs:
+        teachers = per_class.get(pair) or sorted(set(snapshot.teachers_by_subject.get(pair[1], ())))
+        if teachers:
+            candidates[pair] = teachers
+    return candidates
+
+
+def assign_teachers(snapshot, pairs, rng, load=None):
+    """One teacher per (class_id, subject_id) pair, spreading weekly periods evenly
+
+    All of a pair's lessons go to one teacher, so pairs are placed whole: the most
+    constrained pairs (fewest candidates), then the largest, each go to their least
+    loaded candidate, with ties broken by ``rng``. Pairs are then moved to another
+    candidate while that lowers the busier of the two teachers' loads, until no move
+    does. ``load`` holds periods teachers already teach (e.g. kept lessons).
+
+    Returns ({pair: teacher_id}, number of moves made).
+    """
+    candidates = teacher_candidates(snapshot, pairs)
+    periods = {pair: weekly_periods(snapshot.subjects[pair[1]]) for pair in candidates}
+    load = defaultdict(int, load or {})
+
+    order = sorted(candidates, key=lambda pair: (len(candidates[pair]), -periods[pair], pair))
+    chosen = {}
+    for pair in order:
+        least = min(load[teacher_id] for teacher_id in candidates[pair])
+        teacher_id = rng.choice([t for t in candidates[pair] if load[t] == least])
+        chosen[pair] = teacher_id
+        load[teacher_id] += periods[pair]
+
+    # Each move lowers the sum of squared loads, so this ends
+    moves = 0
+    moved = True
+    while moved:
+        moved = False
+        for pair in order:
+            teacher_id = chosen[pair]
+            target = min(candidates[pair], key=lambda t: load[t])
+            if load[target] + periods[pair] < load[teacher_id]:
+                load[teacher_id] -= periods[pair]
+                load[target] += periods[pair]
+                chosen[pair] = target
+                moves += 1
+                moved = True
+    return chosen, moves
@@ -0,0 +1,155 @@
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app import db
+from app.jobs import DEFAULT_HINT, create_generator, parse_hint
+from app.models import School
+
+# Engines the batch command can run; the portfolio and decomposed engines have their own process pools
+BATCH_ENGINES = ('greedy', 'cpsat', 'incremental')
+
+_worker_app = None  # Flask app of a batch worker process, built once by _init_worker
+
+
+def _init_worker(config_name):
+    """Worker process start-up: its own app, engine and connection pool"""
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app(config_name)
+
+
+def _generate_school(school_id, engine, hint, solver_workers):
+    """Worker process: generate and save one school's timetable in a fresh session"""
+    started = time.monotonic()
+    result = {'school_id': school_id, 'engine': engine, 'timetable_id': None, 'error': None}
+    with _worker_app.app_context():
+        try:
+            generator = create_generator(school_id, engine, _worker_app.config, hint=hint,
+                                         solver_workers=solver_workers)
+            timetable = generator.generate()
+            counters = generator.stats.counters
+            result['timetable_id'] = timetable.id
+            result['lessons_total'] = counters['lessons_total']
+            result['lessons_placed'] = counters['lessons_placed']
+        except Exception as e:
+            db.session.rollback()
+            result['error'] = str(e)
+        finally:
+            db.session.remove()
+    result['seconds'] = time.monotonic() - started
+    return result
+
+
+def generate_schools(school_ids, engine='greedy', workers=None, config_name=None, on_result=None,
+                     hint=DEFAULT_HINT):
+    """Generate timetables for many schools in parallel worker processes
+
+    Each worker builds its own app, so every school is generated and saved in a
+    separate database session. CP-SAT runs share SOLVER_NUM_WORKERS between the
+    batch workers, so parallel schools do not oversubscribe the CPUs. ``on_result``
+    is called with each school's result as it finishes; the results are returned in
+    ``school_ids`` order.
+    """
+    config_name = config_name or current_app.config['CONFIG_NAME']
+    workers = max(1, min(workers or current_app.config['BATCH_WORKERS'], len(school_ids) or 1))
+    solver_workers = max(1, current_app.config['SOLVER_NUM_WORKERS'] // workers)
+    results = {}
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(config_name,)
+    ) as executor:
+        futures = {
+            executor.submit(_generate_school, school_id, engine, hint, solver_workers): school_id
+            for school_id in school_ids
+        }
+        for future in as_completed(futures):
+            school_id = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:  # the worker process itself died
+                result = {'school_id': school_id, 'engine': engine, 'timetable_id': None,
+                          'error': str(e) or e.__class__.__name__, 'seconds': None}
+            results[school_id] = result
+            if on_result:
+                on_result(result)
+    return [results[school_id] for school_id in school_ids]
+
+
+def placement_rate(result):
+    if result.get('error') or not result.get('lessons_total'):
+        return None
+    return result['lessons_placed'] / result['lessons_total']
+
+
+def format_report(results, names):
+    """Plain-text summary table: duration and placement rate per school"""
+    lines = [f"{'School':<30} {'Seconds':>8} {'Placed':>13} {'Rate':>7}  Result"]
+    for result in results:
+        name = names.get(result['school_id'], f"#{result['school_id']}")[:30]
+        seconds = f"{result['seconds']:.2f}" if result['seconds'] is not None else '-'
+        rate = placement_rate(result)
+        if rate is None:
+            placed, rate_text = '-', '-'
+        else:
+            placed = f"{result['lessons_placed']}/{result['lessons_total']}"
+            rate_text = f'{rate:.1%}'
+        outcome = f"failed: {result['error']}" if result['error'] else f"timetable {result['timetable_id']}"
+        lines.append(f'{name:<30} {seconds:>8} {placed:>13} {rate_text:>7}  {outcome}')
+
+    done = [r for r in results if not r['error']]
+    total = sum(r.get('lessons_total', 0) for r in done)
+    placed = sum(r.get('lessons_placed', 0) for r in done)
+    summary = f'{len(done)} of {len(results)} schools generated'
+    if total:
+        summary += f', {placed}/{total} lessons placed ({placed / total:.1%})'
+    lines.append(summary)
+    return '\n'.join(lines)
+
+
+@click.command('generate-timetables')
+@click.argument('schools', nargs=-1, required=True)
+@click.option('--engine', type=click.Choice(BATCH_ENGINES), default='greedy', show_default=True)
+@click.option('--hint', type=click.Choice(('greedy', 'active', 'none')), default=DEFAULT_HINT, show_default=True,
+              help='CP-SAT starting point')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: BATCH_WORKERS)')
+@click.option('--output', type=click.Path(dir_okay=False), help='Also write the results as JSON')
+@with_appcontext
+def generate_timetables_command(schools, engine, hint, workers, output):
+    """Generate timetables for SCHOOLS (school ids, or "all") in parallel"""
+    if schools == ('all',):
+        school_ids = [s.id for s in School.query.order_by(School.id).all()]
+    else:
+        try:
+            school_ids = list(dict.fromkeys(int(s) for s in schools))
+        except ValueError:
+            raise click.BadParameter('expected school ids or "all"', param_hint='SCHOOLS')
+    names = {s.id: s.name for s in School.query.filter(School.id.in_(school_ids)).all()}
+    missing = [school_id for school_id in school_ids if school_id not in names]
+    if missing:
+        raise click.BadParameter(f"unknown school ids: {', '.join(map(str, missing))}", param_hint='SCHOOLS')
+    if not school_ids:
+        click.echo('No schools to generate')
+        return
+
+    def on_result(result):
+        status = 'failed' if result['error'] else 'done'
+        click.echo(f"{names[result['school_id']]}: {status}", err=True)
+
+    click.echo(f'Generating {len(school_ids)} timetables with the {engine} engine', err=True)
+    results = generate_schools(school_ids, engine, workers, on_result=on_result, hint=parse_hint(hint))
+    click.echo(format_report(results, names))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump([dict(r, school_name=names[r['school_id']], placement_rate=placement_rate(r)) for r in results],
+                      f, indent=2)
+    if any(r['error'] for r in results):
+        raise SystemExit(1)
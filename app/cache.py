@@ -0,0 +1,61 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+# One cached timetable page: its grid data and (when cacheable) the rendered HTML; ``version``
+# is the school's cache_version when it was built
+CachedView = namedtuple('CachedView', ['school_id', 'is_active', 'version', 'grid', 'lesson_count', 'context', 'html', 'etag'])
+
+# Rough per-cell overhead of the cached grid dicts, used for size accounting
+GRID_CELL_BYTES = 600
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache bounded by the total size of its values"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, size):
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def invalidate(self, predicate):
+        """Drop every entry for which predicate(key, value) is true"""
+        with self._lock:
+            for key in [k for k, (v, _) in self._entries.items() if predicate(k, v)]:
+                self._size -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+
+def cached_view_size(entry):
+    return len(entry.html or b'') + GRID_CELL_BYTES * len(entry.grid)
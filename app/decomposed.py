@@ -0,0 +1,179 @@
+import copy
+import multiprocessing
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from app.lessons import UNPLACED
+from app.local_search import LocalSearch
+from app.occupancy import OccupancyGrid
+from app.timetable_generator import TimetableGenerator
+
+
+def share_cells(demand, open_masks, days, periods_per_day):
+    """Share one teacher's or lab's cells out between the slot levels that use it
+
+    ``demand`` maps level -> periods the resource is needed for there. Cells go out two
+    consecutive periods at a time, so every level keeps room for double lessons; each
+    pair goes to the level with the most demand per cell given so far (highest
+    averages), among the levels that have those periods open. Returns level -> cells.
+    """
+    given = dict.fromkeys(demand, 0)
+    masks = dict.fromkeys(demand, 0)
+    usable = 0
+    for level in demand:
+        usable |= open_masks.get(level, 0)
+
+    for day_idx in range(len(days)):
+        for offset in range(0, periods_per_day, 2):
+            width = min(2, periods_per_day - offset)
+            remaining = ((1 << width) - 1) << (day_idx * periods_per_day + offset) & usable
+            while remaining:
+                eligible = [level for level in demand if open_masks.get(level, 0) & remaining]
+                level = max(eligible, key=lambda l: (demand[l] / (given[l] + 1), l))
+                taken = open_masks[level] & remaining
+                masks[level] |= taken
+                given[level] += OccupancyGrid.popcount(taken)
+                remaining &= ~taken
+    return masks
+
+
+def _solve_level(school_id, snapshot, lessons, level, blocked, reserved_load, options):
+    """Worker process: greedily place one slot level's lessons (no database access)
+
+    ``blocked`` holds the teacher and lab cells given to other levels, which are
+    marked busy before placement, and ``reserved_load`` the periods shared teachers
+    teach at other levels (HC1.3).
+    """
+    generator = TimetableGenerator(school_id, snapshot=snapshot, **options)
+    generator._load_data()
+    generator.lessons = lessons
+    generator._build_occupancy()
+    for teacher_id, mask in blocked['teachers'].items():
+        generator.occupancy.teachers[teacher_id] |= mask
+    for lab, mask in blocked['labs'].items():
+        generator.occupancy.labs[lab] |= mask
+    generator.teacher_weekly_load.update(reserved_load)
+
+    classes = snapshot.classes
+    items = [(pair, ids) for pair, ids in lessons.groups.items() if classes[pair[0]].slot_level == level]
+    generator._place_lessons(generator._order_lessons(items))
+
+    starts = lessons.starts
+    return {
+        'level': level,
+        'starts': [
+            (lesson, starts[lesson]) for _, ids in items for lesson in ids
+            if lessons.is_lead(lesson) and starts[lesson] != UNPLACED
+        ],
+        'stats': generator.stats.to_dict()
+    }
+
+
+class DecomposedTimetableGenerator(TimetableGenerator):
+    """Places each slot level's lessons in its own worker process, then merges them.
+
+    Classes of different levels never share a cell, so the levels only meet at
+    teachers and labs they both use. Before the workers start, each shared teacher's
+    and lab's cells are shared out between its levels (``share_cells``), and a shared
+    teacher's weekly load at the other levels is reserved, so the per-level results
+    merge without clashes. Lessons a level could not place then get a repair pass on
+    the merged grid, where cells reserved for another level but left unused are free
+    again: a greedy pass, then ejection chains (see app/local_search.py) for the rest.
+    Lessons are created (with their teachers and blocks) once, before the split.
+    """
+
+    engine = 'decomposed'
+
+    def __init__(self, school_id, max_workers=None, **kwargs):
+        super().__init__(school_id, **kwargs)
+        self.max_workers = max_workers
+
+    def _allocate_lessons(self):
+        """Solve the levels in parallel, merge their placements and repair what is left"""
+        self._build_occupancy()
+        store = self.lessons
+        classes = self.snapshot.classes
+        levels = sorted({classes[class_id].slot_level for class_id, _ in store.groups}, key=str)
+        if len(levels) < 2:
+            return super()._allocate_lessons()
+
+        with self.stats.phase('reserve_capacity'):
+            blocked, reserved_load = self._reserve_capacity(levels)
+        with self.stats.phase('solve_levels'):
+            results = self._solve_levels(levels, blocked, reserved_load)
+
+        counters = self.stats.counters
+        with self.stats.phase('merge_levels'):
+            for result in results:
+                self.stats.merge(result['stats'])
+                for lesson, start in result['starts']:
+                    level = classes[store.class_ids[lesson]].slot_level
+                    if self._unit_mask(lesson, level) >> start & 1:
+                        self._allocate_unit(lesson, start)
+                    else:
+                        counters['merge_conflicts'] += 1
+            unplaced = [
+                (pair, [lesson for lesson in ids if not store.is_placed(lesson)])
+                for pair, ids in self._order_lessons()
+            ]
+            unplaced = [(pair, ids) for pair, ids in unplaced if ids]
+            before = store.unplaced_count()
+            self._place_lessons(unplaced)
+            if store.unplaced_count():
+                # Ejection chains move a single blocking lesson out of the way, which greedy cannot
+                LocalSearch(self, seed=self.seed, max_iterations=0).run()
+            counters['merge_repaired'] += before - store.unplaced_count()
+        counters['levels_solved'] = len(results)
+        self._report_progress(len(store) - store.unplaced_count(), len(store))
+
+    def _reserve_capacity(self, levels):
+        """Cells each level may not use, per shared teacher and lab, and load reserved elsewhere"""
+        store = self.lessons
+        classes = self.snapshot.classes
+        teacher_demand = defaultdict(lambda: defaultdict(int))  # teacher_id -> level -> periods
+        lab_demand = defaultdict(lambda: defaultdict(int))  # lab -> level -> periods
+        for lesson in range(len(store)):
+            level = classes[store.class_ids[lesson]].slot_level
+            teacher_demand[store.teacher_ids[lesson]][level] += store.length(lesson)
+            if store.practicals[lesson]:
+                lab = self.snapshot.subjects[store.subject_ids[lesson]].lab
+                lab_demand[lab][level] += store.length(lesson)
+
+        lattice = self.lattice
+        full_mask = self.occupancy.full_mask
+        blocked = {level: {'teachers': {}, 'labs': {}} for level in levels}
+        reserved_load = {level: {} for level in levels}
+        shared = 0
+        for kind, demand_of in (('teachers', teacher_demand), ('labs', lab_demand)):
+            for resource, demand in demand_of.items():
+                if len(demand) < 2:
+                    continue
+                shared += 1
+                masks = share_cells(demand, lattice.open_masks, lattice.days, lattice.periods_per_day)
+                for level in demand:
+                    blocked[level][kind][resource] = full_mask & ~masks[level]
+                    if kind == 'teachers':
+                        reserved_load[level][resource] = sum(demand.values()) - demand[level]
+        self.stats.counters['shared_resources'] = shared
+        return blocked, reserved_load
+
+    def _solve_levels(self, levels, blocked, reserved_load):
+        """Run _solve_level for every level, in worker processes when more than one may run"""
+        options = {'seed': self.seed, 'ordering': self.ordering, 'top_k': self.top_k}
+        max_workers = min(len(levels), self.max_workers or os.cpu_count() or 1)
+        if max_workers < 2:
+            # Each level places on its own copy of the lesson store, as a worker process would
+            return [
+                _solve_level(self.school_id, self.snapshot, copy.deepcopy(self.lessons), level,
+                             blocked[level], reserved_load[level], options)
+                for level in levels
+            ]
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        with executor:
+            futures = [
+                executor.submit(_solve_level, self.school_id, self.snapshot, self.lessons, level,
+                                blocked[level], reserved_load[level], options)
+                for level in levels
+            ]
+            return [future.result() for future in futures]
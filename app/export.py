@@ -0,0 +1,187 @@
+import csv
+import io
+import tempfile
+from datetime import date, datetime, timedelta
+
+from app import db
+from app.models import Lesson, TimeSlot, Subject, Teacher, Class
+from app.lattice import lesson_day
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # optional dependency - only needed for XLSX export
+    Workbook = None
+
+EXPORT_COLUMNS = (
+    'Day', 'Period', 'Start', 'End', 'Class', 'Level', 'Subject', 'Subject Code', 'Teacher', 'Employee ID', 'Double'
+)
+
+# Rows fetched from the database cursor at a time
+EXPORT_BATCH_ROWS = 1000
+# Approximate size of each response chunk
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+DAY_OFFSETS = {'Monday': 0, 'Tuesday': 1, 'Wednesday': 2, 'Thursday': 3, 'Friday': 4}
+
+
+def lesson_rows(timetable_id, class_id=None, teacher_id=None):
+    """Yield a timetable's lessons as export rows from one ordered, streamed query
+
+    Rows are ordered by class (or by time for a single teacher), then by day and period, and
+    fetched from the cursor in batches so memory stays flat however big the export.
+    """
+    lessons = Lesson.__table__
+    slots = TimeSlot.__table__
+    subjects = Subject.__table__
+    teachers = Teacher.__table__
+    classes = Class.__table__
+
+    query = db.select(
+        lessons.c.id, lessons.c.day, slots.c.period, slots.c.start_time, slots.c.end_time, classes.c.name.label('class_name'),
+        classes.c.level, subjects.c.name.label('subject_name'), subjects.c.code,
+        teachers.c.name.label('teacher_name'), teachers.c.employee_id, lessons.c.is_double_lesson
+    ).select_from(
+        lessons.join(slots, lessons.c.time_slot_id == slots.c.id)
+        .join(subjects, lessons.c.subject_id == subjects.c.id)
+        .join(teachers, lessons.c.teacher_id == teachers.c.id)
+        .join(classes, lessons.c.class_id == classes.c.id)
+    ).where(lessons.c.timetable_id == timetable_id)
+
+    # Weekday order; lessons saved without a day are ordered by period alone, as they were laid out
+    day_order = db.case(DAY_OFFSETS, value=lessons.c.day, else_=0)
+    if class_id is not None:
+        query = query.where(lessons.c.class_id == class_id)
+    if teacher_id is not None:
+        query = query.where(lessons.c.teacher_id == teacher_id).order_by(
+            day_order, slots.c.period, classes.c.level, classes.c.name
+        )
+    else:
+        query = query.order_by(classes.c.level, classes.c.name, day_order, slots.c.period, subjects.c.name)
+
+    result = db.session.execute(query.execution_options(stream_results=True, max_row_buffer=EXPORT_BATCH_ROWS))
+    try:
+        for rows in result.partitions(EXPORT_BATCH_ROWS):
+            for row in rows:
+                yield row
+    finally:
+        result.close()
+
+
+def _row_values(row):
+    return (
+        lesson_day(row.day, row.period), row.period, row.start_time, row.end_time, row.class_name, row.level,
+        row.subject_name, row.code, row.teacher_name, row.employee_id, 'Yes' if row.is_double_lesson else 'No'
+    )
+
+
+def stream_csv(rows):
+    """CSV text in chunks of about EXPORT_CHUNK_BYTES"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(_row_values(row))
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_xlsx(rows, title='Timetable'):
+    """XLSX bytes in chunks
+
+    The workbook is written in openpyxl's write-only mode, which spools rows to disk
+    instead of keeping cells in memory, and the finished file is streamed back from a
+    temporary file.
+    """
+    if Workbook is None:
+        raise ValueError('XLSX export needs openpyxl: pip install openpyxl')
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title[:31])
+    sheet.append(EXPORT_COLUMNS)
+    for row in rows:
+        sheet.append(_row_values(row))
+
+    with tempfile.TemporaryFile() as f:
+        workbook.save(f)
+        f.seek(0)
+        while True:
+            chunk = f.read(EXPORT_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+
+def stream_ics(rows, calendar_name, term_start=None, weeks=None, stamp=None):
+    """iCalendar text: one weekly recurring event per lesson, in chunks of about EXPORT_CHUNK_BYTES
+
+    Events start in the week of ``term_start`` (default: this week) and repeat every
+    week, ``weeks`` times when given. Times are floating local times, as entered on
+    the time slots.
+    """
+    monday = (term_start or date.today())
+    monday -= timedelta(days=monday.weekday())
+    stamp = (stamp or datetime.utcnow()).strftime('%Y%m%dT%H%M%SZ')
+    rule = f'RRULE:FREQ=WEEKLY;COUNT={weeks}' if weeks else 'RRULE:FREQ=WEEKLY'
+
+    chunk = [_ics_lines(
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//SchoolTimetable//Timetable export//EN',
+        'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{_ics_text(calendar_name)}'
+    )]
+    size = 0
+    for row in rows:
+        day = monday + timedelta(days=DAY_OFFSETS[lesson_day(row.day, row.period)])
+        start, end = _ics_time(day, row.start_time), _ics_time(day, row.end_time)
+        if start is None or end is None:
+            continue  # time slot without a usable HH:MM time
+        event = _ics_lines(
+            'BEGIN:VEVENT',
+            f'UID:lesson-{row.id}@schooltimetable',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART:{start}',
+            f'DTEND:{end}',
+            rule,
+            f'SUMMARY:{_ics_text(f"{row.subject_name} - {row.class_name}")}',
+            f'DESCRIPTION:{_ics_text(f"{row.level}, period {row.period}")}',
+            'END:VEVENT'
+        )
+        chunk.append(event)
+        size += len(event)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    chunk.append(_ics_lines('END:VCALENDAR'))
+    yield ''.join(chunk)
+
+
+def _ics_time(day, hhmm):
+    try:
+        hours, minutes = (int(part) for part in hhmm.strip().split(':')[:2])
+        return datetime(day.year, day.month, day.day, hours, minutes).strftime('%Y%m%dT%H%M%S')
+    except (AttributeError, ValueError):
+        return None
+
+
+def _ics_text(value):
+    """Escape a TEXT value (RFC 5545 section 3.3.11)"""
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _ics_lines(*lines):
+    """CRLF-terminated content lines, folded at 75 octets"""
+    out = []
+    for line in lines:
+        encoded = line.encode('utf-8')
+        while len(encoded) > 75:
+            cut = 75
+            while cut and (encoded[cut] & 0xC0) == 0x80:  # don't split a UTF-8 character
+                cut -= 1
+            out.append(encoded[:cut].decode('utf-8'))
+            encoded = b' ' + encoded[cut:]
+        out.append(encoded.decode('utf-8'))
+    return '\r\n'.join(out) + '\r\n'
@@ -0,0 +1,274 @@
+from collections import defaultdict, namedtuple, deque
+
+from app.assignment import weekly_periods
+from app.occupancy import OccupancyGrid
+
+# Most periods a teacher may teach in a week (HC1.3)
+MAX_TEACHER_LOAD = 30
+
+# One capacity bound the school's data breaks; demand and capacity are in periods
+# (or double lessons for 'class_doubles')
+Violation = namedtuple('Violation', ['rule', 'name', 'demand', 'capacity', 'message'])
+
+
+def find_violations(generator):
+    """Every capacity bound the loaded data breaks, worked out before any lesson is placed.
+
+    Needs ``generator.snapshot`` and the open masks of ``_build_occupancy``. Each check
+    is a necessary condition, so a violation means some lessons cannot be placed by
+    any engine:
+
+    - no_time_slots: a class level without open lesson periods
+    - no_teacher: a subject offered to classes but assigned to no teacher
+    - class_periods / class_doubles: a class needs more periods, or more double
+      lessons, than its level has open (HC2.1, HC2.3); concurrent subjects are taught
+      in one block, so a group of them needs only as many as its largest subject
+    - lab_periods: a lab is needed for more periods than are open at the levels that
+      use it (HC4)
+    - teacher_periods: a group of subjects needs more periods than its teachers can
+      give, however the classes are shared out between them (HC1.1, HC1.3). This is a
+      max-flow bound: subjects send their periods to any assigned teacher, teachers
+      take at most min(MAX_TEACHER_LOAD, open periods)
+    """
+    snapshot = generator.snapshot
+    open_masks = generator.open_masks
+    open_cells = {level: OccupancyGrid.popcount(mask) for level, mask in open_masks.items()}
+    violations = []
+    block_of = {subject_id: group for group in snapshot.concurrent_groups for subject_id in group}
+
+    class_periods = defaultdict(int)
+    class_doubles = defaultdict(int)
+    block_periods = defaultdict(lambda: [0, 0])  # (class_id, concurrent group) -> most periods, doubles
+    lab_periods = defaultdict(lambda: defaultdict(int))  # lab -> slot level -> periods
+    subject_periods = defaultdict(int)
+    subject_levels = defaultdict(set)
+    unstaffed = defaultdict(int)  # subject_id -> classes it is offered to
+    for class_obj in snapshot.classes.values():
+        for subject in snapshot.subjects.values():
+            if not generator._is_subject_offered_for_class(subject, class_obj):
+                continue
+            if not snapshot.teachers_by_subject.get(subject.id):
+                unstaffed[subject.id] += 1
+                continue
+            doubles = subject.double_lessons_per_week
+            periods = weekly_periods(subject)
+            if subject.id in block_of:
+                block = block_periods[(class_obj.id, block_of[subject.id])]
+                block[0] = max(block[0], periods)
+                block[1] = max(block[1], doubles)
+            else:
+                class_periods[class_obj.id] += periods
+                class_doubles[class_obj.id] += doubles
+            subject_periods[subject.id] += periods
+            subject_levels[subject.id].add(class_obj.slot_level)
+            if subject.is_practical:
+                lab_periods[subject.lab][class_obj.slot_level] += periods
+
+    for (class_id, _), (periods, doubles) in block_periods.items():
+        class_periods[class_id] += periods
+        class_doubles[class_id] += doubles
+
+    for subject_id, class_count in sorted(unstaffed.items()):
+        subject = snapshot.subjects[subject_id]
+        violations.append(Violation(
+            'no_teacher', subject.name, class_count, 0,
+            f'{subject.name} is offered to {class_count} class(es) but no teacher is assigned to it'
+        ))
+
+    for class_obj in snapshot.classes.values():
+        name = f'{class_obj.level} {class_obj.name}'
+        periods = class_periods[class_obj.id]
+        if not periods:
+            continue
+        if not open_cells.get(class_obj.slot_level):
+            violations.append(Violation(
+                'no_time_slots', name, periods, 0, f'{name} has no open lesson periods for its level'
+            ))
+            continue
+        if periods > open_cells[class_obj.slot_level]:
+            violations.append(Violation(
+                'class_periods', name, periods, open_cells[class_obj.slot_level],
+                f'{name} needs {periods} periods a week but only {open_cells[class_obj.slot_level]} are open'
+            ))
+        pairs = _double_capacity(generator.double_start_masks[class_obj.slot_level])
+        if class_doubles[class_obj.id] > pairs:
+            violations.append(Violation(
+                'class_doubles', name, class_doubles[class_obj.id], pairs,
+                f'{name} needs {class_doubles[class_obj.id]} double lessons but only {pairs} fit in its open periods'
+            ))
+
+    for lab, by_level in sorted(lab_periods.items()):
+        # Check each level alone, then all of them together (the levels share one lab)
+        checks = [[level] for level in sorted(by_level)]
+        if len(by_level) > 1:
+            checks.append(sorted(by_level))
+        for levels in checks:
+            periods = sum(by_level[level] for level in levels)
+            mask = 0
+            for level in levels:
+                mask |= open_masks.get(level, 0)
+            capacity = OccupancyGrid.popcount(mask)
+            if periods > capacity:
+                violations.append(Violation(
+                    'lab_periods', lab, periods, capacity,
+                    f"{lab} is needed for {periods} periods a week ({', '.join(levels)}) but is open for {capacity}"
+                ))
+                break
+
+    violations.extend(_teacher_violations(snapshot, open_masks, subject_periods, subject_levels))
+    return violations
+
+
+def _double_capacity(double_start_mask):
+    """Most double lessons that fit side by side, taking start cells from the left"""
+    count = taken = 0
+    for bit in OccupancyGrid.iter_bits(double_start_mask):
+        if not taken >> bit & 3:
+            count += 1
+            taken |= 3 << bit
+    return count
+
+
+def _teacher_violations(snapshot, open_masks, subject_periods, subject_levels):
+    """Subject groups whose periods exceed what their teachers can teach (max-flow / min-cut)"""
+    eligible = {subject_id: sorted(set(snapshot.teachers_by_subject[subject_id])) for subject_id in subject_periods}
+    teacher_masks = defaultdict(int)
+    for subject_id, teacher_ids in eligible.items():
+        for level in subject_levels[subject_id]:
+            for teacher_id in teacher_ids:
+                teacher_masks[teacher_id] |= open_masks.get(level, 0)
+    capacity = {
+        teacher_id: min(MAX_TEACHER_LOAD, OccupancyGrid.popcount(mask)) for teacher_id, mask in teacher_masks.items()
+    }
+
+    remaining, taught_by = _max_flow(subject_periods, eligible, capacity)
+    if not any(remaining.values()):
+        return []
+
+    # Subjects and teachers still reachable from unmet demand form the minimum cut; each
+    # connected part of it is a group whose teachers are all full
+    reachable_subjects, reachable_teachers = set(), set()
+    queue = deque(subject_id for subject_id, periods in remaining.items() if periods)
+    reachable_subjects.update(queue)
+    while queue:
+        subject_id = queue.popleft()
+        for teacher_id in eligible[subject_id]:
+            if teacher_id in reachable_teachers:
+                continue
+            reachable_teachers.add(teacher_id)
+            for other in taught_by[teacher_id]:
+                if other not in reachable_subjects:
+                    reachable_subjects.add(other)
+                    queue.append(other)
+
+    subjects_of = defaultdict(list)  # teacher_id -> eligible subject ids
+    for subject_id, teacher_ids in eligible.items():
+        for teacher_id in teacher_ids:
+            subjects_of[teacher_id].append(subject_id)
+
+    violations = []
+    seen = set()
+    for start in sorted(reachable_subjects):
+        if start in seen:
+            continue
+        subjects, teachers = [], set()
+        stack = [start]
+        seen.add(start)
+        while stack:
+            subject_id = stack.pop()
+            subjects.append(subject_id)
+            for teacher_id in eligible[subject_id]:
+                teachers.add(teacher_id)
+                for other in subjects_of[teacher_id]:
+                    if other in reachable_subjects and other not in seen:
+                        seen.add(other)
+                        stack.append(other)
+        periods = sum(subject_periods[s] for s in subjects)
+        available = sum(capacity[t] for t in teachers)
+        if periods <= available:
+            continue
+        subject_names = ', '.join(sorted(snapshot.subjects[s].name for s in subjects))
+        teacher_names = ', '.join(sorted(snapshot.teachers[t].name for t in teachers))
+        violations.append(Violation(
+            'teacher_periods', subject_names, periods, available,
+            f"{subject_names} {'needs' if len(subjects) == 1 else 'need'} {periods} periods a week from "
+            f'{teacher_names}, who can teach at most {available}'
+        ))
+    return violations
+
+
+def _max_flow(demand, eligible, capacity):
+    """Send each subject's periods to its eligible teachers, up to their capacity
+
+    Returns (unmet periods per subject, subjects each teacher took periods from).
+    Augmenting paths alternate subject -> teacher -> subject (taking back periods a
+    teacher already holds), so the unmet total is the true max-flow deficit.
+    """
+    flow = defaultdict(int)  # (subject_id, teacher_id) -> periods
+    taught_by = defaultdict(set)  # teacher_id -> subject ids with flow
+    free = dict(capacity)
+    remaining = dict(demand)
+
+    # Greedy start: most periods go straight to the teacher with the most room
+    for subject_id in sorted(remaining, key=lambda s: len(eligible[s])):
+        for teacher_id in sorted(eligible[subject_id], key=lambda t: -free[t]):
+            sent = min(remaining[subject_id], free[teacher_id])
+            if sent:
+                flow[(subject_id, teacher_id)] += sent
+                taught_by[teacher_id].add(subject_id)
+                free[teacher_id] -= sent
+                remaining[subject_id] -= sent
+
+    for source in sorted(remaining):
+        while remaining[source]:
+            path = _augmenting_path(source, eligible, free, taught_by)
+            if path is None:
+                break
+            # path alternates subject, teacher, subject, ..., teacher (with free capacity)
+            sent = min(remaining[source], free[path[-1]])
+            for i in range(1, len(path) - 1, 2):
+                sent = min(sent, flow[(path[i + 1], path[i])])
+            for i in range(0, len(path) - 1, 2):
+                subject_id, teacher_id = path[i], path[i + 1]
+                flow[(subject_id, teacher_id)] += sent
+                taught_by[teacher_id].add(subject_id)
+                if i + 2 < len(path):
+                    back = (path[i + 2], teacher_id)
+                    flow[back] -= sent
+                    if not flow[back]:
+                        taught_by[teacher_id].discard(path[i + 2])
+            free[path[-1]] -= sent
+            remaining[source] -= sent
+    return remaining, taught_by
+
+
+def _augmenting_path(source, eligible, free, taught_by):
+    """Shortest subject/teacher path from ``source`` to a teacher with free capacity"""
+    parent = {('s', source): None}
+    queue = deque([source])
+    while queue:
+        subject_id = queue.popleft()
+        for teacher_id in eligible[subject_id]:
+            if ('t', teacher_id) in parent:
+                continue
+            parent[('t', teacher_id)] = ('s', subject_id)
+            if free[teacher_id] > 0:
+                path, node = [], ('t', teacher_id)
+                while node is not None:
+                    path.append(node[1])
+                    node = parent[node]
+                return path[::-1]
+            for other in taught_by[teacher_id]:
+                if ('s', other) not in parent:
+                    parent[('s', other)] = ('t', teacher_id)
+                    queue.append(other)
+    return None
+
+
+def summarize(violations, limit=1):
+    """One line for a job message: the count and the first few violations"""
+    text = f'{len(violations)} capacity problem(s) found before placement: '
+    text += '; '.join(violation.message for violation in violations[:limit])
+    if len(violations) > limit:
+        text += f' (and {len(violations) - limit} more)'
+    return text
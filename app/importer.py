@@ -0,0 +1,265 @@
+import csv
+import io
+from collections import namedtuple
+
+from sqlalchemy import bindparam
+
+from app import db
+from app.models import Teacher, Subject, Class, SubjectAssignment
+from app.snapshot import SLOT_LEVEL_FOR_CLASS_LEVEL, SLOT_LEVELS
+
+# Import kinds in dependency order (assignments refer to the other three), with their CSV columns
+IMPORT_COLUMNS = {
+    'teachers': ('name', 'employee_id'),
+    'subjects': ('name', 'code', 'max_lessons_per_week', 'double_lessons_per_week', 'offered_for'),
+    'classes': ('name', 'level'),
+    'assignments': ('employee_id', 'subject_code', 'class_name', 'class_level')
+}
+
+# Subject.offered_for values; 'both' covers every class level
+OFFERED_FOR = SLOT_LEVELS + ('both',)
+
+RowError = namedtuple('RowError', ['line', 'message'])
+
+
+class ImportReport:
+    """Counts and per-row errors of one import kind"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.errors = []  # RowError, line numbers as in the file (header is line 1)
+
+    def error(self, line, message):
+        self.errors.append(RowError(line, message))
+
+
+class SchoolImporter:
+    """Validates uploaded CSVs against a school's existing data and upserts them in one transaction.
+
+    Files are read row by row. Every row is checked in memory against the unique keys
+    already in the database and earlier rows of the upload (no query per row):
+
+    - teachers by ``employee_id`` (the name is updated)
+    - subjects by ``code`` (name and lessons per week are updated)
+    - classes by ``(name, level)``
+    - assignments by ``(teacher, subject, class)``, referring to the other three by
+      employee id, subject code and class name and level - including rows of the
+      same upload
+
+    Invalid rows are skipped and reported; ``commit`` writes the valid ones with bulk
+    inserts and updates in a single transaction.
+    """
+
+    def __init__(self, school_id):
+        self.school_id = school_id
+        self.reports = {}
+        self.teachers = {}  # employee_id -> (id or None, name)
+        self.subjects = {}  # code -> (id or None, name, max_lessons_per_week, double_lessons_per_week, offered_for)
+        self.classes = {}  # (name, level) -> id or None
+        self.assignments = set()  # (employee_id, subject_code, (class name, level))
+        self.pending = {kind: [] for kind in IMPORT_COLUMNS}  # rows to insert
+        self.updates = {kind: [] for kind in IMPORT_COLUMNS}  # rows to update
+        self._load_existing()
+
+    def _load_existing(self):
+        """The unique keys already in the database, one query per table"""
+        school_id = self.school_id
+        teacher_keys = {}
+        for t in Teacher.query.filter_by(school_id=school_id).all():
+            if t.employee_id:
+                self.teachers[t.employee_id] = (t.id, t.name)
+                teacher_keys[t.id] = t.employee_id
+        subject_keys = {}
+        for s in Subject.query.filter_by(school_id=school_id).all():
+            if s.code:
+                self.subjects[s.code] = (s.id, s.name, s.max_lessons_per_week, s.double_lessons_per_week, s.offered_for)
+                subject_keys[s.id] = s.code
+        class_keys = {}
+        for c in Class.query.filter_by(school_id=school_id).all():
+            self.classes[(c.name, c.level)] = c.id
+            class_keys[c.id] = (c.name, c.level)
+        for a in SubjectAssignment.query.filter_by(school_id=school_id).all():
+            key = (teacher_keys.get(a.teacher_id), subject_keys.get(a.subject_id), class_keys.get(a.class_id))
+            if None not in key:
+                self.assignments.add(key)
+
+    def read(self, kind, stream):
+        """Validate one uploaded CSV (a binary stream) row by row"""
+        if kind not in IMPORT_COLUMNS:
+            raise ValueError(f'Unknown import kind: {kind}')
+        report = self.reports[kind] = ImportReport(kind)
+        reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+        try:
+            # The header is the first non-blank row
+            header = next((row for row in reader if any(cell.strip() for cell in row)), [])
+        except (UnicodeDecodeError, csv.Error) as e:
+            report.error(1, f'Could not read the file: {e}')
+            return report
+        fieldnames = [name.strip().lower() for name in header]
+        missing = [c for c in IMPORT_COLUMNS[kind] if c not in fieldnames]
+        if missing:
+            report.error(reader.line_num or 1, f"Missing column(s): {', '.join(missing)}")
+            return report
+
+        check = getattr(self, f'_check_{kind}')
+        seen = {}
+        try:
+            for row in reader:
+                line = reader.line_num
+                row = dict(zip(fieldnames, row))
+                values = {c: (row.get(c) or '').strip() for c in IMPORT_COLUMNS[kind]}
+                if not any(values.values()):
+                    continue
+                try:
+                    key = check(values, report, seen.get)
+                except ValueError as e:
+                    report.error(line, str(e))
+                    continue
+                seen[key] = line
+        except (UnicodeDecodeError, csv.Error) as e:
+            report.error(reader.line_num, f'Could not read the file: {e}')
+        return report
+
+    def _check_teachers(self, values, report, seen):
+        name, employee_id = values['name'], values['employee_id']
+        if not name or not employee_id:
+            raise ValueError('name and employee_id are required')
+        if seen(employee_id):
+            raise ValueError(f'Duplicate employee_id {employee_id} (line {seen(employee_id)})')
+        existing = self.teachers.get(employee_id)
+        if existing is None:
+            self.pending['teachers'].append({'school_id': self.school_id, 'name': name, 'employee_id': employee_id})
+            report.created += 1
+        elif existing[1] != name:
+            self.updates['teachers'].append({'_id': existing[0], 'name': name})
+            report.updated += 1
+        else:
+            report.unchanged += 1
+        self.teachers[employee_id] = (existing[0] if existing else None, name)
+        return employee_id
+
+    def _check_subjects(self, values, report, seen):
+        name, code, offered_for = values['name'], values['code'], values['offered_for']
+        if not name or not code:
+            raise ValueError('name and code are required')
+        if seen(code):
+            raise ValueError(f'Duplicate code {code} (line {seen(code)})')
+        if offered_for not in OFFERED_FOR:
+            raise ValueError(f"offered_for must be one of: {', '.join(OFFERED_FOR)}")
+        try:
+            max_lessons = int(values['max_lessons_per_week'] or 4)
+            double_lessons = int(values['double_lessons_per_week'] or 0)
+        except ValueError:
+            raise ValueError('Lessons per week must be whole numbers')
+        if not 1 <= max_lessons <= 10 or not 0 <= double_lessons <= 5:
+            raise ValueError('max_lessons_per_week must be 1-10 and double_lessons_per_week 0-5')
+        if double_lessons * 2 > max_lessons:
+            raise ValueError('Double lessons need two periods each and exceed max_lessons_per_week')
+
+        existing = self.subjects.get(code)
+        if existing is None:
+            self.pending['subjects'].append({
+                'school_id': self.school_id, 'name': name, 'code': code, 'max_lessons_per_week': max_lessons,
+                'double_lessons_per_week': double_lessons, 'offered_for': offered_for
+            })
+            report.created += 1
+        elif existing[4] != offered_for:
+            raise ValueError(f'Subject {code} is offered for {existing[4]}; offered_for cannot be changed')
+        elif existing[1:4] != (name, max_lessons, double_lessons):
+            self.updates['subjects'].append({
+                '_id': existing[0], 'name': name, 'max_lessons_per_week': max_lessons,
+                'double_lessons_per_week': double_lessons
+            })
+            report.updated += 1
+        else:
+            report.unchanged += 1
+        self.subjects[code] = (existing[0] if existing else None, name, max_lessons, double_lessons, offered_for)
+        return code
+
+    def _check_classes(self, values, report, seen):
+        key = (values['name'], values['level'])
+        if not key[0]:
+            raise ValueError('name is required')
+        if key[1] not in SLOT_LEVEL_FOR_CLASS_LEVEL:
+            raise ValueError(f"level must be one of: {', '.join(SLOT_LEVEL_FOR_CLASS_LEVEL)}")
+        if seen(key):
+            raise ValueError(f'Duplicate class {key[1]} {key[0]} (line {seen(key)})')
+        if key in self.classes:
+            report.unchanged += 1
+        else:
+            self.pending['classes'].append({'school_id': self.school_id, 'name': key[0], 'level': key[1]})
+            self.classes[key] = None
+            report.created += 1
+        return key
+
+    def _check_assignments(self, values, report, seen):
+        employee_id, code = values['employee_id'], values['subject_code']
+        class_key = (values['class_name'], values['class_level'])
+        if employee_id not in self.teachers:
+            raise ValueError(f'Unknown teacher employee_id {employee_id!r}')
+        if code not in self.subjects:
+            raise ValueError(f'Unknown subject code {code!r}')
+        if class_key not in self.classes:
+            raise ValueError(f'Unknown class {class_key[1]} {class_key[0]}'.rstrip())
+        offered_for = self.subjects[code][4]
+        if offered_for != 'both' and SLOT_LEVEL_FOR_CLASS_LEVEL[class_key[1]] != offered_for:
+            raise ValueError(f'Subject {code} is not offered for {class_key[1]}')
+
+        key = (employee_id, code, class_key)
+        if seen(key):
+            raise ValueError(f'Duplicate assignment (line {seen(key)})')
+        if key in self.assignments:
+            report.unchanged += 1
+        else:
+            self.pending['assignments'].append(key)
+            self.assignments.add(key)
+            report.created += 1
+        return key
+
+    @property
+    def has_errors(self):
+        return any(report.errors for report in self.reports.values())
+
+    @property
+    def changed(self):
+        return any(report.created or report.updated for report in self.reports.values())
+
+    def commit(self):
+        """Write all valid rows with bulk statements in one transaction"""
+        try:
+            self._write(Teacher, 'teachers')
+            self._write(Subject, 'subjects')
+            self._write(Class, 'classes')
+            if self.pending['assignments']:
+                # New teachers, subjects and classes only got ids above
+                teacher_ids = {t.employee_id: t.id for t in Teacher.query.filter_by(school_id=self.school_id)}
+                subject_ids = {s.code: s.id for s in Subject.query.filter_by(school_id=self.school_id)}
+                class_ids = {(c.name, c.level): c.id for c in Class.query.filter_by(school_id=self.school_id)}
+                db.session.execute(SubjectAssignment.__table__.insert(), [
+                    {
+                        'school_id': self.school_id,
+                        'teacher_id': teacher_ids[employee_id],
+                        'subject_id': subject_ids[code],
+                        'class_id': class_ids[class_key]
+                    }
+                    for employee_id, code, class_key in self.pending['assignments']
+                ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _write(self, model, kind):
+        table = model.__table__
+        if self.pending[kind]:
+            db.session.execute(table.insert(), self.pending[kind])
+        rows = self.updates[kind]
+        if rows:
+            columns = [c for c in rows[0] if c != '_id']
+            db.session.execute(
+                table.update().where(table.c.id == bindparam('_id')).values({c: bindparam(c) for c in columns}),
+                rows
+            )
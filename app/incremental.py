@@ -0,0 +1,247 @@
+from collections import defaultdict
+
+from app.assignment import teacher_candidates, weekly_periods
+from app.lattice import lesson_day
+from app.models import Lesson, Timetable
+from app.snapshot import SchoolSnapshot
+from app.timetable_generator import TimetableGenerator
+
+
+class IncrementalTimetableGenerator(TimetableGenerator):
+    """Re-generates only the lessons a data edit touched, keeping the rest of the active timetable.
+
+    The snapshot stored with the active timetable's GenerationRun is diffed against the
+    current data. A (class, subject) pair is unpinned when:
+
+    - the subject's lessons, doubles, level or name changed, or the class's level changed
+    - its teacher is no longer assigned to the subject for that class
+    - the subject joined, left or moved between groups of concurrent subjects
+    - the class or subject is new
+
+    Every other lesson stays in its cell, and the unpinned lessons are re-placed around
+    them, so allocation work follows the size of the edit, not the school. Lessons the
+    active timetable left unplaced are not in it, so each unchanged pair is created up to
+    its required count again and the missing lessons are placed as well. The result is
+    saved as a new Timetable. A full generation is run instead when there is no active
+    timetable with a stored snapshot, or when the time slots changed.
+    """
+
+    engine = 'incremental'
+
+    def __init__(self, school_id, **kwargs):
+        super().__init__(school_id, **kwargs)
+        self.base_snapshot = None
+        self.base_lessons = []  # (class_id, subject_id, teacher_id, time_slot_id, day, is_double) of the active timetable
+        self.full_regeneration_reason = None
+        self.changed_pairs = set()
+        self.kept_lessons = []  # (lesson id, (day, period)) pinned to their old cell
+        self.shortfall = {}  # unchanged pair -> (doubles, singles) the active timetable did not place
+
+    def _load_data(self):
+        """Load the snapshot plus the active timetable and the snapshot it was built from"""
+        super()._load_data()
+
+        timetable = Timetable.query.filter_by(school_id=self.school_id, is_active=True).order_by(
+            Timetable.generated_at.desc(), Timetable.id.desc()
+        ).first()
+        run = timetable.generation_run if timetable else None
+        if run is None or not run.snapshot:
+            self.full_regeneration_reason = 'no active timetable with stored generation data'
+            return
+
+        base_snapshot = SchoolSnapshot.from_dict(run.snapshot)
+        if dict(base_snapshot.time_slots) != dict(self.snapshot.time_slots):
+            self.full_regeneration_reason = 'time slots changed'
+            return
+
+        self.base_snapshot = base_snapshot
+        self.base_lessons = [
+            (l.class_id, l.subject_id, l.teacher_id, l.time_slot_id, l.day, bool(l.is_double_lesson))
+            for l in Lesson.query.filter_by(timetable_id=timetable.id).order_by(Lesson.id).all()
+        ]
+
+    def _create_lessons(self):
+        """Lessons of changed pairs are created afresh; all others are rebuilt from the active timetable"""
+        if self.base_snapshot is None:
+            return super()._create_lessons()
+
+        self.changed_pairs = self._diff_pairs()
+        old_teacher = {}
+        kept_counts = defaultdict(lambda: [0, 0])  # pair -> [doubles, singles] kept in place
+        for class_id, subject_id, cell, is_double, teacher_id in self._previous_lessons():
+            pair = (class_id, subject_id)
+            old_teacher[pair] = teacher_id
+            if pair in self.changed_pairs:
+                continue
+            if not self._is_subject_offered_for_class(self.snapshot.subjects[subject_id], self.snapshot.classes[class_id]):
+                continue
+            lesson = self.lessons.add(
+                class_id, subject_id, teacher_id, is_double, self.snapshot.subjects[subject_id].is_practical
+            )
+            self.kept_lessons.append((lesson, cell))
+            kept_counts[pair][0 if is_double else 1] += 1
+        self.shortfall = self._shortfall(kept_counts)
+
+        # Keep a changed pair's teacher while they may still take it, and a short pair's
+        # kept teacher; the other pairs are assigned around the load of the lessons kept in place
+        load = defaultdict(int)
+        for lesson, _ in self.kept_lessons:
+            load[self.lessons.teacher_ids[lesson]] += self.lessons.length(lesson)
+        candidates = teacher_candidates(self.snapshot, self.changed_pairs)
+        unassigned = []
+        for pair in sorted(self.changed_pairs):
+            teacher_id = old_teacher.get(pair)
+            if teacher_id in candidates.get(pair, ()):
+                self.teacher_for[pair] = teacher_id
+                load[teacher_id] += weekly_periods(self.snapshot.subjects[pair[1]])
+            else:
+                unassigned.append(pair)
+        for pair, (doubles, singles) in sorted(self.shortfall.items()):
+            if pair in kept_counts:
+                self.teacher_for[pair] = old_teacher[pair]
+                load[old_teacher[pair]] += 2 * doubles + singles
+            else:
+                unassigned.append(pair)
+        self._assign_teachers(unassigned, load)
+
+        for class_id, subject_id in sorted(self.changed_pairs):
+            self._create_lessons_for(self.snapshot.classes[class_id], self.snapshot.subjects[subject_id])
+        for (class_id, subject_id), (doubles, singles) in sorted(self.shortfall.items()):
+            teacher_id = self.teacher_for.get((class_id, subject_id))
+            if teacher_id is None:
+                continue
+            is_practical = self.snapshot.subjects[subject_id].is_practical
+            for is_double, count in ((True, doubles), (False, singles)):
+                for _ in range(count):
+                    self.lessons.add(class_id, subject_id, teacher_id, is_double, is_practical)
+            self.stats.counters['lessons_refilled'] += doubles + singles
+        self._join_kept_blocks()
+        self._form_blocks(exclude={lesson for lesson, _ in self.kept_lessons})
+
+    def _shortfall(self, kept_counts):
+        """Lessons each unchanged pair needs beyond those kept, as pair -> (doubles, singles)
+
+        A pair the active timetable placed none of has nothing kept, so it needs all its lessons.
+        """
+        shortfall = {}
+        for class_obj in self.snapshot.classes.values():
+            for subject in self.snapshot.subjects.values():
+                pair = (class_obj.id, subject.id)
+                if pair in self.changed_pairs or not self._is_subject_offered_for_class(subject, class_obj):
+                    continue
+                kept_doubles, kept_singles = kept_counts.get(pair, (0, 0))
+                doubles = max(subject.double_lessons_per_week - kept_doubles, 0)
+                singles = max(subject.max_lessons_per_week - 2 * subject.double_lessons_per_week - kept_singles, 0)
+                if doubles or singles:
+                    shortfall[pair] = (doubles, singles)
+        return shortfall
+
+    def _join_kept_blocks(self):
+        """Kept lessons of one concurrent group sharing a class cell become a block again"""
+        store = self.lessons
+        group_of = {subject_id: group for group in self.snapshot.concurrent_groups for subject_id in group}
+        shared = defaultdict(list)
+        for lesson, cell in self.kept_lessons:
+            group = group_of.get(store.subject_ids[lesson])
+            if group is not None:
+                shared[(store.class_ids[lesson], cell, store.doubles[lesson], group)].append(lesson)
+        for members in shared.values():
+            if len(members) > 1:
+                store.join(members)
+
+    def _diff_pairs(self):
+        """(class_id, subject_id) pairs whose lessons must be re-placed"""
+        old, new = self.base_snapshot, self.snapshot
+        changed_subjects = {sid for sid, subject in new.subjects.items() if old.subjects.get(sid) != subject}
+        changed_classes = {cid for cid, class_obj in new.classes.items() if old.classes.get(cid) != class_obj}
+
+        # Kept lessons are re-joined into blocks by the current groups, so a subject whose
+        # group changed is re-placed whole (its old block partners share its class cell)
+        old_group = {subject_id: group for group in old.concurrent_groups for subject_id in group}
+        new_group = {subject_id: group for group in new.concurrent_groups for subject_id in group}
+        changed_subjects.update(
+            subject_id for subject_id in set(old_group) | set(new_group)
+            if old_group.get(subject_id) != new_group.get(subject_id)
+        )
+
+        pairs = set()
+        for subject_id in changed_subjects:
+            for class_obj in new.classes.values():
+                pairs.add((class_obj.id, subject_id))
+        for class_id in changed_classes:
+            for subject in new.subjects.values():
+                pairs.add((class_id, subject.id))
+
+        # Lessons whose teacher lost the subject for that class (or left the school)
+        if old.assignments != new.assignments:
+            candidates = teacher_candidates(new, {(l[0], l[1]) for l in self.base_lessons})
+            for class_id, subject_id, teacher_id, _, _, _ in self.base_lessons:
+                if teacher_id not in candidates.get((class_id, subject_id), ()):
+                    pairs.add((class_id, subject_id))
+
+        return {
+            (class_id, subject_id) for class_id, subject_id in pairs
+            if class_id in new.classes and subject_id in new.subjects
+            and self._is_subject_offered_for_class(new.subjects[subject_id], new.classes[class_id])
+        }
+
+    def _previous_lessons(self):
+        """Active timetable lessons still valid for the current data, doubles paired back into one lesson
+
+        Yields (class_id, subject_id, (day, start period), is_double, teacher_id).
+        """
+        slots = self.snapshot.time_slots
+        double_periods = defaultdict(list)
+        for class_id, subject_id, teacher_id, slot_id, day, is_double in self.base_lessons:
+            if class_id not in self.snapshot.classes or subject_id not in self.snapshot.subjects:
+                continue
+            if slot_id not in slots:
+                continue
+            period = slots[slot_id].period
+            day = lesson_day(day, period)
+            if is_double:
+                double_periods[(class_id, subject_id, teacher_id, day)].append(period)
+            else:
+                yield class_id, subject_id, (day, period), False, teacher_id
+
+        # A saved double is two rows in consecutive periods of one day
+        for (class_id, subject_id, teacher_id, day), periods in double_periods.items():
+            remaining = sorted(periods)
+            while len(remaining) >= 2:
+                first, second = remaining[0], remaining[1]
+                if second == first + 1:
+                    yield class_id, subject_id, (day, first), True, teacher_id
+                    remaining = remaining[2:]
+                else:
+                    remaining = remaining[1:]
+
+    def _allocate_lessons(self):
+        """Pin the kept lessons, then greedily place only the changed pairs' and the missing lessons"""
+        if self.base_snapshot is None:
+            return super()._allocate_lessons()
+
+        self._build_occupancy()
+        store = self.lessons
+        for lesson, (day, period) in self.kept_lessons:
+            if store.is_lead(lesson):
+                self._allocate_unit(lesson, self.lattice.bit(day, period))
+
+        pending = [
+            (pair, [lesson for lesson in store.groups[pair] if not store.is_placed(lesson)])
+            for pair in sorted(self.changed_pairs | set(self.shortfall)) if pair in store.groups
+        ]
+        self._place_lessons(self._order_lessons([(pair, ids) for pair, ids in pending if ids]))
+
+        self.stats.counters['lessons_kept'] = len(self.kept_lessons)
+        self.stats.counters['pairs_changed'] = len(self.changed_pairs)
+
+    @property
+    def summary(self):
+        """One line for the job page"""
+        if self.full_regeneration_reason:
+            return f'Full generation ran: {self.full_regeneration_reason}'
+        groups = self.lessons.groups
+        replaced = sum(len(groups[pair]) for pair in self.changed_pairs if pair in groups)
+        return (f'{replaced} lessons of {len(self.changed_pairs)} changed class/subject pairs re-placed, '
+                f"{self.stats.counters['lessons_refilled']} left unplaced last time retried, "
+                f'{len(self.kept_lessons)} kept in place')
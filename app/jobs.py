@@ -0,0 +1,296 @@
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.models import GenerationJob
+from app.timetable_generator import TimetableGenerator
+from app.timetable_generator_ortools import CPSATTimetableGenerator, HINT_SOURCES
+from app.portfolio import PortfolioTimetableGenerator, default_variants
+from app.incremental import IncrementalTimetableGenerator
+from app.decomposed import DecomposedTimetableGenerator
+from app.feasibility import summarize
+
+# Engines a job may run, with the name the job page shows for each
+ENGINE_LABELS = {
+    'greedy': 'Fast engine',
+    'cpsat': 'CP-SAT solver',
+    'portfolio': 'Portfolio engine',
+    'incremental': 'Incremental engine',
+    'decomposed': 'Decomposed engine'
+}
+ENGINES = tuple(ENGINE_LABELS)
+
+# Where CP-SAT runs take their solution hint from unless told otherwise (see HINT_SOURCES)
+DEFAULT_HINT = 'greedy'
+
+# Minimum seconds between progress writes from a running job
+PROGRESS_WRITE_INTERVAL = 0.5
+
+# Worker processes started by this process, by job id (reaped by dispatch_jobs)
+_workers = {}
+
+
+def submit_job(school_id, engine='greedy', hint=None, profile=False):
+    """Queue a timetable generation run and start it if a worker slot is free"""
+    job = GenerationJob(
+        school_id=school_id,
+        engine=engine if engine in ENGINES else 'greedy',
+        hint=hint,
+        profile=profile,
+        status='queued'
+    )
+    db.session.add(job)
+    db.session.commit()
+    dispatch_jobs()
+    return job
+
+
+def dispatch_jobs():
+    """Requeue jobs whose worker died, then start queued jobs up to the per-host cap
+
+    Job state lives in the database, so this can be called from any web worker (on
+    submit, on every status poll, and by a worker when it finishes) and picks up
+    jobs left behind by a restart.
+    """
+    config = current_app.config
+    _reap_workers()
+    _recover_stale_jobs(config)
+
+    host = socket.gethostname()
+    jobs = GenerationJob.__table__
+    running_here = db.select(db.func.count()).select_from(jobs).where(
+        jobs.c.status == 'running', jobs.c.host == host
+    ).scalar_subquery()
+    ctx = multiprocessing.get_context('spawn')
+
+    while True:
+        job = GenerationJob.query.filter_by(status='queued').order_by(GenerationJob.id).first()
+        if job is None:
+            break
+
+        # Claim in one statement so two web workers never start the same job or exceed the cap
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            jobs.update().where(
+                jobs.c.id == job.id,
+                jobs.c.status == 'queued',
+                running_here < config['MAX_CONCURRENT_GENERATIONS']
+            ).values(
+                status='running', host=host, pid=None, started_at=now, heartbeat_at=now,
+                attempts=jobs.c.attempts + 1
+            )
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            if GenerationJob.query.filter_by(status='running', host=host).count() >= config['MAX_CONCURRENT_GENERATIONS']:
+                break
+            continue
+
+        process = ctx.Process(target=run_job, args=(config['CONFIG_NAME'], job.id))
+        process.start()
+        _workers[job.id] = process
+        # Reap the worker as soon as it exits; it marks its job done first, so a poll may not see it exit
+        threading.Thread(target=process.join, daemon=True).start()
+        db.session.execute(jobs.update().where(jobs.c.id == job.id).values(pid=process.pid))
+        db.session.commit()
+
+
+def _recover_stale_jobs(config):
+    """Requeue (or fail after too many attempts) running jobs whose worker is gone"""
+    host = socket.gethostname()
+    stale_before = datetime.utcnow() - timedelta(seconds=config['JOB_STALE_AFTER'])
+
+    for job in GenerationJob.query.filter_by(status='running').all():
+        dead_here = job.host == host and job.pid and not _worker_alive(job)
+        silent = job.heartbeat_at is not None and job.heartbeat_at < stale_before
+        if not (dead_here or silent):
+            continue
+
+        if (job.attempts or 0) >= config['JOB_MAX_ATTEMPTS']:
+            job.status = 'failed'
+            job.error = 'Generation worker stopped unexpectedly'
+            job.finished_at = datetime.utcnow()
+        else:
+            job.status = 'queued'
+            job.host = None
+            job.pid = None
+    db.session.commit()
+
+
+def _reap_workers():
+    """Collect exit statuses of finished workers so they do not linger as zombies"""
+    multiprocessing.active_children()
+    for job_id, process in list(_workers.items()):
+        if not process.is_alive():
+            process.join(0)
+            del _workers[job_id]
+
+
+def _worker_alive(job):
+    """Whether a running job's worker process still exists
+
+    A worker started by this process is checked through its Process handle; an exited
+    one stays a zombie until reaped, which a signal-0 probe would take for alive.
+    """
+    process = _workers.get(job.id)
+    if process is not None and process.pid == job.pid:
+        return process.is_alive()
+    return _pid_alive(job.pid)
+
+
+def _pid_alive(pid):
+    if os.name != 'posix':
+        return True  # no cheap check elsewhere - rely on the heartbeat
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def parse_hint(value):
+    """Hint source from a form or command-line value; anything unknown (e.g. 'none') means no hint"""
+    return value if value in HINT_SOURCES else None
+
+
+def build_generator(job, config, progress_callback=None):
+    return create_generator(
+        job.school_id, job.engine, config, hint=job.hint, profile=bool(job.profile),
+        progress_callback=progress_callback
+    )
+
+
+def create_generator(school_id, engine, config, hint=DEFAULT_HINT, profile=False, progress_callback=None,
+                     solver_workers=None):
+    """Generator for one school and engine, set up from the app config
+
+    ``solver_workers`` overrides SOLVER_NUM_WORKERS for CP-SAT, e.g. when several
+    schools are solved side by side.
+    """
+    if engine == 'cpsat':
+        return CPSATTimetableGenerator(
+            school_id,
+            time_limit=config['SOLVER_TIME_LIMIT'],
+            num_workers=solver_workers or config['SOLVER_NUM_WORKERS'],
+            hint=hint,
+            progress_callback=progress_callback,
+            profile=profile
+        )
+    if engine == 'portfolio':
+        return PortfolioTimetableGenerator(
+            school_id,
+            variants=default_variants(config['PORTFOLIO_VARIANTS']),
+            deadline=config['PORTFOLIO_DEADLINE'],
+            max_workers=config['PORTFOLIO_WORKERS'],
+            solver_workers=config['SOLVER_NUM_WORKERS'],
+            progress_callback=progress_callback,
+            profile=profile,
+            local_search_seconds=config['LOCAL_SEARCH_SECONDS']
+        )
+    if engine == 'incremental':
+        return IncrementalTimetableGenerator(school_id, progress_callback=progress_callback, profile=profile)
+    if engine == 'decomposed':
+        return DecomposedTimetableGenerator(
+            school_id,
+            max_workers=config['LEVEL_WORKERS'],
+            progress_callback=progress_callback,
+            profile=profile,
+            local_search_seconds=config['LOCAL_SEARCH_SECONDS']
+        )
+    return TimetableGenerator(
+        school_id,
+        progress_callback=progress_callback,
+        profile=profile,
+        local_search_seconds=config['LOCAL_SEARCH_SECONDS']
+    )
+
+
+def run_job(config_name, job_id):
+    """Worker process entry point"""
+    from app import create_app
+
+    app = create_app(config_name)
+    with app.app_context():
+        job = GenerationJob.query.get(job_id)
+        if job is None or job.status != 'running':
+            return
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat, args=(db.engine, job_id, app.config['JOB_HEARTBEAT_INTERVAL'], stop), daemon=True
+        )
+        heartbeat.start()
+
+        progress = _ProgressWriter(db.engine, job_id)
+        try:
+            generator = build_generator(job, app.config, progress)
+            timetable = generator.generate()
+            job = GenerationJob.query.get(job_id)
+            job.status = 'done'
+            job.timetable_id = timetable.id
+            # Final totals from the run stats; the last progress report may predate repairs
+            job.lessons_placed = generator.stats.counters['lessons_placed']
+            job.lessons_total = generator.stats.counters['lessons_total']
+            if getattr(generator, 'hints_given', 0):
+                job.message = f'{generator.hints_kept} of {generator.hints_given} hinted lessons kept their slot'
+            elif job.engine == 'incremental':
+                job.message = generator.summary
+            if generator.feasibility:
+                note = summarize(generator.feasibility)
+                job.message = (f'{job.message}. {note}' if job.message else note)[:255]  # column length
+        except Exception as e:
+            db.session.rollback()
+            job = GenerationJob.query.get(job_id)
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+        # Hand the freed slot to the next queued job
+        dispatch_jobs()
+
+
+def _heartbeat(engine, job_id, interval, stop):
+    jobs = GenerationJob.__table__
+    while not stop.wait(interval):
+        try:
+            with engine.begin() as conn:
+                conn.execute(jobs.update().where(jobs.c.id == job_id).values(heartbeat_at=datetime.utcnow()))
+        except Exception:
+            pass  # database busy (e.g. the timetable is being saved) - try again next beat
+
+
+class _ProgressWriter:
+    """Generator progress callback that stores lessons placed on the job row (throttled)"""
+
+    def __init__(self, engine, job_id):
+        self.engine = engine
+        self.job_id = job_id
+        self.last_write = 0
+        self.lessons_placed = 0
+        self.lessons_total = 0
+
+    def __call__(self, lessons_placed, lessons_total):
+        self.lessons_placed = lessons_placed
+        self.lessons_total = lessons_total
+        now = time.monotonic()
+        if now - self.last_write < PROGRESS_WRITE_INTERVAL and lessons_placed < lessons_total:
+            return
+        self.last_write = now
+        jobs = GenerationJob.__table__
+        with self.engine.begin() as conn:
+            conn.execute(jobs.update().where(jobs.c.id == self.job_id).values(
+                lessons_placed=lessons_placed, lessons_total=lessons_total, heartbeat_at=datetime.utcnow()
+            ))
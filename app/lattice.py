@@ -0,0 +1,115 @@
+from array import array
+
+from app.snapshot import SLOT_LEVELS
+
+DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday')
+
+# HC2.5: lesson periods reserved for the whole school
+ASSEMBLY_CELLS = frozenset({('Monday', 1)})  # Monday period 1
+CLUB_DAY, CLUB_FROM_PERIOD = 'Wednesday', 7  # Wednesday afternoon
+
+# Fewest periods a day is laid out with (schools with shorter days keep the same grid)
+MIN_PERIODS_PER_DAY = 10
+
+
+def day_for_period(period):
+    """Day of a lesson saved before lessons stored their day (two periods per day, Monday first)"""
+    if period <= 2:
+        return 'Monday'
+    elif period <= 4:
+        return 'Tuesday'
+    elif period <= 6:
+        return 'Wednesday'
+    elif period <= 8:
+        return 'Thursday'
+    else:
+        return 'Friday'
+
+
+def lesson_day(day, period):
+    """Day a saved lesson falls on, for rows with or without a stored day"""
+    return day or day_for_period(period)
+
+
+class SlotLattice:
+    """Every day x period cell of the week, as integer index tables built once per run.
+
+    Each TimeSlot row is one period of a slot level and repeats on every day, so a level
+    has one cell per day and period. A cell's index is its OccupancyGrid bit
+    (``day_index * periods_per_day + period - 1``) and every table is keyed by it:
+
+    - ``slots_by_bit[level]``: the lesson TimeSlot of each lesson cell
+    - ``slot_ids[level]``: array of time slot ids by cell, -1 where there is no row
+    - ``break_masks``: break and lunch cells
+    - ``assembly_masks`` / ``club_masks``: lesson cells reserved for assembly and clubs (HC2.5)
+    - ``open_masks``: lesson cells lessons may take
+    - ``last_masks``: the last lesson period of each day
+    - ``double_start_masks``: open cells whose next period the same day is open too (HC2.3)
+    """
+
+    def __init__(self, time_slots, days=DAYS):
+        time_slots = list(time_slots)
+        self.days = tuple(days)
+        self.periods_per_day = max([slot.period for slot in time_slots] + [MIN_PERIODS_PER_DAY])
+        self.cell_count = len(self.days) * self.periods_per_day
+        self.slots_by_bit = {}
+        self.slot_ids = {}
+        self.break_masks = {}
+        self.assembly_masks = {}
+        self.club_masks = {}
+        self.open_masks = {}
+        self.last_masks = {}
+        self.double_start_masks = {}
+
+        by_level = {level: [] for level in SLOT_LEVELS}
+        for slot in time_slots:
+            by_level.setdefault(slot.level, []).append(slot)
+        for level, slots in by_level.items():
+            self._add_level(level, sorted(slots, key=lambda s: s.period))
+
+    def _add_level(self, level, slots):
+        ppd = self.periods_per_day
+        slot_ids = array('i', [-1]) * self.cell_count
+        by_bit = {}
+        break_mask = assembly_mask = club_mask = open_mask = last_mask = 0
+        last_period = max((slot.period for slot in slots if slot.slot_type == 'lesson'), default=0)
+
+        for day_idx, day in enumerate(self.days):
+            for slot in slots:
+                bit = day_idx * ppd + slot.period - 1
+                slot_ids[bit] = slot.id
+                if slot.slot_type != 'lesson':
+                    break_mask |= 1 << bit
+                    continue
+                by_bit[bit] = slot
+                if slot.period == last_period:
+                    last_mask |= 1 << bit
+                if (day, slot.period) in ASSEMBLY_CELLS:
+                    assembly_mask |= 1 << bit
+                elif day == CLUB_DAY and slot.period >= CLUB_FROM_PERIOD:
+                    club_mask |= 1 << bit
+                else:
+                    open_mask |= 1 << bit
+
+        # A double may start where the next period of the same day is open as well
+        day_starts = 0
+        for day_idx in range(len(self.days)):
+            day_starts |= ((1 << (ppd - 1)) - 1) << day_idx * ppd
+
+        self.slots_by_bit[level] = by_bit
+        self.slot_ids[level] = slot_ids
+        self.break_masks[level] = break_mask
+        self.assembly_masks[level] = assembly_mask
+        self.club_masks[level] = club_mask
+        self.open_masks[level] = open_mask
+        self.last_masks[level] = last_mask
+        self.double_start_masks[level] = open_mask & (open_mask >> 1) & day_starts
+
+    def bit(self, day, period):
+        """Cell index of a day and period"""
+        return self.days.index(day) * self.periods_per_day + period - 1
+
+    def cell(self, bit):
+        """(day, period) of a cell index"""
+        day_idx, offset = divmod(bit, self.periods_per_day)
+        return self.days[day_idx], offset + 1
@@ -0,0 +1,105 @@
+from array import array
+
+# LessonStore.starts value of a lesson without a cell
+UNPLACED = -1
+
+
+class LessonStore:
+    """Struct-of-arrays store of a generation run's lessons, indexed by lesson id.
+
+    Each lesson is one entry in the flat ``class_ids``, ``subject_ids``,
+    ``teacher_ids``, ``doubles`` and ``practicals`` arrays; a lesson id is its index.
+    A double lesson is one lesson covering its start cell and the next one.
+
+    The allocation is the ``starts`` array: the occupancy-grid bit each lesson
+    starts at, or UNPLACED. Saving and restoring an allocation is a copy of that one
+    array, and the whole store pickles as a few flat byte buffers (worker processes).
+
+    Lessons of concurrent subjects taught to a class at the same time form a block.
+    ``leads`` holds each lesson's block lead (its own id when it is not in a block);
+    engines place and release a lead together with all its ``members``.
+    """
+
+    def __init__(self):
+        self.class_ids = array('i')
+        self.subject_ids = array('i')
+        self.teacher_ids = array('i')
+        self.doubles = array('b')
+        self.practicals = array('b')
+        self.starts = array('i')
+        self.leads = array('i')
+        self.groups = {}  # (class_id, subject_id) -> lesson ids, in creation order
+        self.blocks = {}  # lead id -> member ids (lead first), for lessons in a block
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getstate__(self):
+        # Only the flat arrays are pickled; groups and blocks are rebuilt from them
+        state = dict(self.__dict__)
+        del state['groups']
+        del state['blocks']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.groups = {}
+        for lesson, key in enumerate(zip(self.class_ids, self.subject_ids)):
+            self.groups.setdefault(key, []).append(lesson)
+        self.blocks = {}
+        for lesson, lead in enumerate(self.leads):
+            if lead != lesson:
+                self.blocks.setdefault(lead, [lead]).append(lesson)
+
+    def add(self, class_id, subject_id, teacher_id, is_double, is_practical):
+        """Append an unplaced lesson; returns its id"""
+        lesson = len(self.starts)
+        self.class_ids.append(class_id)
+        self.subject_ids.append(subject_id)
+        self.teacher_ids.append(teacher_id)
+        self.doubles.append(1 if is_double else 0)
+        self.practicals.append(1 if is_practical else 0)
+        self.starts.append(UNPLACED)
+        self.leads.append(lesson)
+        self.groups.setdefault((class_id, subject_id), []).append(lesson)
+        return lesson
+
+    def join(self, members):
+        """Make unplaced lessons one block, led by the first"""
+        lead = members[0]
+        for lesson in members:
+            self.leads[lesson] = lead
+        self.blocks[lead] = list(members)
+        return lead
+
+    def members(self, lesson):
+        """Lessons placed together with a lead: its block, or just itself"""
+        return self.blocks.get(lesson) or (lesson,)
+
+    def is_lead(self, lesson):
+        return self.leads[lesson] == lesson
+
+    def length(self, lesson):
+        """Cells the lesson covers"""
+        return 2 if self.doubles[lesson] else 1
+
+    def is_placed(self, lesson):
+        return self.starts[lesson] != UNPLACED
+
+    def placed(self):
+        """Ids of placed lessons"""
+        return [lesson for lesson, start in enumerate(self.starts) if start != UNPLACED]
+
+    def units(self):
+        """Ids of lessons placed as one unit: block leads and lessons outside blocks"""
+        return [lesson for lesson, lead in enumerate(self.leads) if lead == lesson]
+
+    def unplaced_count(self):
+        return self.starts.count(UNPLACED)
+
+    def save_placement(self):
+        """Copy of the allocation"""
+        return array('i', self.starts)
+
+    def clear_placement(self):
+        self.starts = array('i', [UNPLACED]) * len(self.starts)
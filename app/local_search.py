@@ -0,0 +1,347 @@
+import math
+import random
+import time
+from collections import defaultdict
+
+from app.lessons import UNPLACED
+from app.occupancy import OccupancyGrid
+
+# Annealing temperature, in soft-score points, at the start and end of the budget
+START_TEMPERATURE = 5.0
+END_TEMPERATURE = 0.05
+
+# Default annealing budget (iterations) per placed lesson or block
+ITERATIONS_PER_UNIT = 30
+
+# With every lesson placed, annealing stops after this many iterations per unit
+# (at least MIN_STALL_ITERATIONS) without accepting an improving move
+STALL_ITERATIONS_PER_UNIT = 2
+MIN_STALL_ITERATIONS = 500
+
+
+class LocalSearch:
+    """Improves a finished greedy allocation in place.
+
+    First every unplaced lesson is repaired with an ejection chain: it takes a cell
+    held by one blocking lesson, and the blocker is re-placed the same way, up to
+    ``max_chain_depth`` deep. Then simulated annealing over move (lesson to another
+    free cell) and swap (two lessons of the same class trade cells) neighbourhoods
+    raises the soft score until ``time_limit`` seconds or ``max_iterations`` run
+    out, and the best allocation seen is kept. With every lesson placed it also stops
+    once ``stall_iterations`` pass without an improving move being accepted.
+
+    The score is tracked incrementally, so a move or swap is evaluated in O(1); it
+    always equals ``generator._allocation_soft_score()``. With a seed and
+    ``max_iterations`` the result is reproducible; a time budget alone is not.
+    Lessons are ids in ``generator.lessons``, and the best allocation is kept as a
+    copy of its ``starts`` array. A block of concurrent lessons moves as one unit,
+    identified by its lead.
+    """
+
+    def __init__(self, generator, seed=None, time_limit=5, max_iterations=None, max_chain_depth=3,
+                 stall_iterations=None):
+        self.gen = generator
+        self.random = random.Random(seed)
+        self.time_limit = time_limit
+        self.max_iterations = max_iterations
+        self.max_chain_depth = max_chain_depth
+        self.stall_iterations = stall_iterations  # None: scaled with the number of placed units
+        self.weights = generator.weights  # the school's soft-constraint weights, as in _allocation_soft_score
+
+        self.subject_cells = defaultdict(int)  # (class_id, day, subject_id) -> cells taught
+        self.science_count = defaultdict(int)  # (class_id, day) -> distinct sciences taught
+        self.owners = {}  # ('teacher' | 'class' | 'lab', id, bit) -> lead of the unit holding that cell
+        self.score = 0
+        self.store = generator.lessons
+        self.lessons = self.store.units()
+
+    def run(self):
+        """Repair then improve; returns counters for the run stats"""
+        started = time.monotonic()
+        # _track rebuilds the teacher bits lesson by lesson so each adjacency is counted once
+        for teacher_id in self.gen.occupancy.teachers:
+            self.gen.occupancy.teachers[teacher_id] = 0
+        starts = self.store.starts
+        for lesson in self.store.placed():
+            self._track(lesson, starts[lesson], 1)
+        score_before = self.score
+
+        repaired = 0
+        for lesson in self.lessons:
+            if starts[lesson] == UNPLACED and self._repair(lesson, self.max_chain_depth, {lesson}):
+                repaired += 1
+
+        iterations, accepted = self._anneal(started)
+        return {
+            'ls_repaired': repaired,
+            'ls_iterations': iterations,
+            'ls_moves_accepted': accepted,
+            'ls_score_gain': self.score - score_before
+        }
+
+    # -- incremental score -------------------------------------------------
+
+    def _lab(self, lesson):
+        store = self.store
+        return self.gen.snapshot.subjects[store.subject_ids[lesson]].lab if store.practicals[lesson] else None
+
+    def _track(self, lesson, start_bit, sign):
+        """Add (sign=1) or remove (sign=-1) a placed lesson's cells from the score state"""
+        occupancy = self.gen.occupancy
+        store = self.store
+        subject_id = store.subject_ids[lesson]
+        subject = self.gen.snapshot.subjects[subject_id]
+        teacher_id, class_id, lab = store.teacher_ids[lesson], store.class_ids[lesson], self._lab(lesson)
+        last_mask = self.gen.lattice.last_masks[self.gen.snapshot.classes[class_id].slot_level]
+        weights = self.weights
+        for bit in range(start_bit, start_bit + store.length(lesson)):
+            day, period = occupancy.cell(bit)
+            delta = 0
+            # SP1.1 / SP3.1: per-cell preferences
+            if subject.name == 'Mathematics' and period <= 4:
+                delta += weights['math_morning']
+            if not last_mask >> bit & 1 and subject.is_math_heavy:
+                delta += weights['heavy_not_last']
+
+            # SP1.3 / SP1.2: distinct subjects (and up to two sciences) per class-day
+            key = (class_id, day, subject_id)
+            if sign > 0:
+                first = self.subject_cells[key] == 0
+                self.subject_cells[key] += 1
+            else:
+                self.subject_cells[key] -= 1
+                first = self.subject_cells[key] == 0
+            if first:
+                delta += weights['subject_variety']
+                if subject.is_science:
+                    science_key = (class_id, day)
+                    before = min(self.science_count[science_key], 2)
+                    self.science_count[science_key] += sign
+                    delta += weights['science_spread'] * abs(min(self.science_count[science_key], 2) - before)
+
+            # SP2.1: adjacent periods of the same teacher on the same day
+            taught = occupancy.teachers[teacher_id]
+            if period > 1 and taught >> (bit - 1) & 1:
+                delta += weights['teacher_adjacent']
+            if period < occupancy.periods_per_day and taught >> (bit + 1) & 1:
+                delta += weights['teacher_adjacent']
+
+            self.score += sign * delta
+            cell_mask = 1 << bit
+            if sign > 0:
+                occupancy.teachers[teacher_id] |= cell_mask
+                lead = store.leads[lesson]
+                self.owners[('teacher', teacher_id, bit)] = lead
+                self.owners[('class', class_id, bit)] = lead
+                if lab is not None:
+                    self.owners[('lab', lab, bit)] = lead
+            else:
+                occupancy.teachers[teacher_id] &= ~cell_mask
+                # Members of a block share the class cell, so it may already be gone
+                self.owners.pop(('teacher', teacher_id, bit), None)
+                self.owners.pop(('class', class_id, bit), None)
+                if lab is not None:
+                    self.owners.pop(('lab', lab, bit), None)
+
+    def _place(self, lesson, bit):
+        """Place an unplaced unit at a start cell; returns the score change"""
+        before = self.score
+        # _track maintains the teacher bits itself (adjacency is read before each cell is set)
+        for member in self.store.members(lesson):
+            self._track(member, bit, 1)
+        self.gen._allocate_unit(lesson, bit)
+        return self.score - before
+
+    def _unplace(self, lesson):
+        """Take a placed unit out; returns (its start cell, score change)"""
+        before = self.score
+        store = self.store
+        bit = store.starts[lesson]
+        self.gen._release_unit(lesson)
+        members = store.members(lesson)
+        # _release_unit cleared the teacher bits; restore them so _track removes adjacency correctly
+        for member in members:
+            self.gen.occupancy.teachers[store.teacher_ids[member]] |= ((1 << store.length(member)) - 1) << bit
+        for member in members:
+            self._track(member, bit, -1)
+        return bit, self.score - before
+
+    def _feasible(self, lesson):
+        level = self.gen.snapshot.classes[self.store.class_ids[lesson]].slot_level
+        return self.gen._unit_mask(lesson, level)
+
+    # -- ejection chains ---------------------------------------------------
+
+    def _repair(self, lesson, depth, chain):
+        """Place ``lesson``, ejecting one blocking lesson and re-placing it recursively"""
+        mask = self._feasible(lesson)
+        if mask:
+            self._place(lesson, self._best_bit(lesson, mask))
+            return True
+        if depth == 0:
+            return False
+
+        store = self.store
+        class_id = store.class_ids[lesson]
+        level = self.gen.snapshot.classes[class_id].slot_level
+        starts = self.gen.open_masks.get(level, 0)
+        if store.doubles[lesson]:
+            starts &= self.gen.double_start_masks[level]
+        length = store.length(lesson)
+        resources = [('class', class_id)]
+        for member in store.members(lesson):
+            resources.append(('teacher', store.teacher_ids[member]))
+            resources.append(('lab', self._lab(member)))
+
+        candidates = []
+        for bit in OccupancyGrid.iter_bits(starts):
+            blockers = set()
+            for cell in range(bit, bit + length):
+                for kind, resource_id in resources:
+                    owner = self.owners.get((kind, resource_id, cell))
+                    if owner is not None:
+                        blockers.add(owner)
+            if len(blockers) == 1:
+                blocker = next(iter(blockers))
+                if blocker not in chain:
+                    candidates.append((bit, blocker))
+        self.random.shuffle(candidates)
+
+        for bit, blocker in candidates[:5]:
+            old_bit, _ = self._unplace(blocker)
+            if self._feasible(lesson) >> bit & 1:
+                self._place(lesson, bit)
+                if self._repair(blocker, depth - 1, chain | {blocker}):
+                    return True
+                self._unplace(lesson)
+            self._place(blocker, old_bit)
+        return False
+
+    def _best_bit(self, lesson, mask):
+        """Start cell with the best score change (ties broken by the seeded RNG)"""
+        best, best_delta = [], None
+        for bit in OccupancyGrid.iter_bits(mask):
+            delta = self._place(lesson, bit)
+            self._unplace(lesson)
+            if best_delta is None or delta > best_delta:
+                best, best_delta = [bit], delta
+            elif delta == best_delta:
+                best.append(bit)
+        return self.random.choice(best)
+
+    # -- simulated annealing -----------------------------------------------
+
+    def _anneal(self, started):
+        store = self.store
+        placed = [lesson for lesson in self.lessons if store.is_placed(lesson)]
+        if not placed:
+            return 0, 0
+        by_class = defaultdict(lambda: ([], []))  # class_id -> (singles, doubles)
+        for lesson in placed:
+            by_class[store.class_ids[lesson]][store.doubles[lesson]].append(lesson)
+        # An allocation with lessons still unplaced keeps annealing for its whole budget
+        stall_iterations = math.inf
+        if len(placed) == len(self.lessons):
+            stall_iterations = self.stall_iterations or max(
+                MIN_STALL_ITERATIONS, STALL_ITERATIONS_PER_UNIT * len(placed)
+            )
+
+        # best is None while the current allocation is the best seen; it is only
+        # copied when a worsening move is accepted from there
+        best_score = self.score
+        best = None
+        iterations = accepted = 0
+        last_improved = 0  # iteration of the last accepted move that raised the score
+        temperature = START_TEMPERATURE
+        while self.max_iterations is None or iterations < self.max_iterations:
+            if iterations - last_improved >= stall_iterations:
+                break
+            if iterations % 100 == 0:
+                elapsed = time.monotonic() - started
+                if elapsed >= self.time_limit:
+                    break
+                # Cool by iterations when they are capped, so seeded runs are reproducible
+                if self.max_iterations:
+                    progress = iterations / self.max_iterations
+                else:
+                    progress = elapsed / self.time_limit
+                temperature = START_TEMPERATURE * (END_TEMPERATURE / START_TEMPERATURE) ** progress
+            iterations += 1
+
+            lesson = self.random.choice(placed)
+            if self.random.random() < 0.5:
+                delta, undo, redo = self._try_move(lesson)
+            else:
+                partners = by_class[store.class_ids[lesson]][store.doubles[lesson]]
+                delta, undo, redo = self._try_swap(lesson, self.random.choice(partners))
+            if undo is None:
+                continue
+
+            if delta >= 0 or self.random.random() < math.exp(delta / temperature):
+                if delta < 0 and best is None:
+                    undo()
+                    best = self._save_placement()
+                    redo()
+                accepted += 1
+                if delta > 0:
+                    last_improved = iterations
+                if self.score > best_score:
+                    best_score = self.score
+                    best = None
+            else:
+                undo()
+
+        if best is not None and self.score < best_score:
+            self._restore_placement(placed, best)
+        return iterations, accepted
+
+    def _try_move(self, lesson):
+        """Move a lesson to a random other free cell; returns (score change, undo, redo)"""
+        old_bit, removed = self._unplace(lesson)
+        mask = self._feasible(lesson) & ~(1 << old_bit)
+        if not mask:
+            self._place(lesson, old_bit)
+            return 0, None, None
+        new_bit = self.random.choice(list(OccupancyGrid.iter_bits(mask)))
+        added = self._place(lesson, new_bit)
+
+        def undo():
+            self._unplace(lesson)
+            self._place(lesson, old_bit)
+
+        def redo():
+            self._unplace(lesson)
+            self._place(lesson, new_bit)
+        return removed + added, undo, redo
+
+    def _try_swap(self, first, second):
+        """Trade the cells of two lessons of the same class; returns (score change, undo, redo)"""
+        if first == second:
+            return 0, None, None
+        bit_a, removed_a = self._unplace(first)
+        bit_b, removed_b = self._unplace(second)
+        delta = removed_a + removed_b
+        if self._feasible(first) >> bit_b & 1:
+            delta += self._place(first, bit_b)
+            if self._feasible(second) >> bit_a & 1:
+                delta += self._place(second, bit_a)
+
+                def swap_to(first_bit, second_bit):
+                    self._unplace(first)
+                    self._unplace(second)
+                    self._place(first, first_bit)
+                    self._place(second, second_bit)
+                return delta, lambda: swap_to(bit_a, bit_b), lambda: swap_to(bit_b, bit_a)
+            self._unplace(first)
+        self._place(first, bit_a)
+        self._place(second, bit_b)
+        return 0, None, None
+
+    def _save_placement(self):
+        return self.store.save_placement()
+
+    def _restore_placement(self, placed, best):
+        for lesson in placed:
+            self._unplace(lesson)
+        for lesson in placed:
+            self._place(lesson, best[lesson])
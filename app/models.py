@@ -10,6 +10,8 @@ class School(UserMixin, db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(200), nullable=False)
     location = db.Column(db.String(200))
+    soft_weights = db.Column(db.JSON)  # soft-constraint weight overrides, see app/scoring.py
+    cache_version = db.Column(db.Integer, default=0)  # bumped when cached timetable pages go stale
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     
     teachers = db.relationship('Teacher', backref='school', lazy=True, cascade='all, delete-orphan')
@@ -64,19 +66,8 @@ class SubjectAssignment(db.Model):
     class_id = db.Column(db.Integer, db.ForeignKey('classes.id'), nullable=False)
     school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), nullable=False)
     
-    # Relationships - backrefs are created by the parent models
-    # Access the related objects via the foreign keys
-    @property
-    def teacher(self):
-        return Teacher.query.get(self.teacher_id)
-    
-    @property
-    def subject(self):
-        return Subject.query.get(self.subject_id)
-    
-    @property
-    def class_(self):
-        return Class.query.get(self.class_id)
+    # teacher and subject are backrefs from Teacher and Subject
+    class_ = db.relationship('Class', backref=db.backref('subject_assignments', lazy=True, cascade='all, delete-orphan'))
     
     __table_args__ = (db.UniqueConstraint('teacher_id', 'subject_id', 'class_id'),)
 
@@ -155,10 +146,17 @@ class Lesson(db.Model):
     subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
     teacher_id = db.Column(db.Integer, db.ForeignKey('teachers.id'), nullable=False)
     time_slot_id = db.Column(db.Integer, db.ForeignKey('time_slots.id'))
+    day = db.Column(db.String(10))  # 'Monday'...'Friday'; empty on lessons saved before days were stored
     timetable_id = db.Column(db.Integer, db.ForeignKey('timetables.id'))
     is_double_lesson = db.Column(db.Boolean, default=False)
     
     subject = db.relationship('Subject', backref='lessons')
+    
+    # Timetable views load one class's or one teacher's lessons at a time
+    __table_args__ = (
+        db.Index('ix_lessons_timetable_class', 'timetable_id', 'class_id'),
+        db.Index('ix_lessons_timetable_teacher', 'timetable_id', 'teacher_id'),
+    )
 
 class Timetable(db.Model):
     __tablename__ = 'timetables'
@@ -169,3 +167,52 @@ class Timetable(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     
     lessons = db.relationship('Lesson', backref='timetable', lazy=True)
+
+class GenerationJob(db.Model):
+    """Timetable generation run queued from the web UI and executed in a worker process"""
+    __tablename__ = 'generation_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), nullable=False)
+    engine = db.Column(db.String(20), nullable=False, default='greedy')  # one of jobs.ENGINES
+    hint = db.Column(db.String(20))  # CP-SAT warm start: 'greedy', 'active' or None
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'done', 'failed'
+    lessons_total = db.Column(db.Integer, default=0)
+    lessons_placed = db.Column(db.Integer, default=0)
+    timetable_id = db.Column(db.Integer, db.ForeignKey('timetables.id'))
+    error = db.Column(db.Text)
+    message = db.Column(db.String(255))
+    attempts = db.Column(db.Integer, default=0)
+    host = db.Column(db.String(255))  # Host and pid of the worker process running the job
+    pid = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    profile = db.Column(db.Boolean, default=False)  # capture a cProfile report with the run stats
+    
+    @property
+    def percent(self):
+        if self.status == 'done':
+            return 100
+        if not self.lessons_total:
+            return 0
+        return int(100 * (self.lessons_placed or 0) / self.lessons_total)
+
+class GenerationRun(db.Model):
+    """Timings and counters of the generation run that produced a timetable (see app/stats.py)"""
+    __tablename__ = 'generation_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    timetable_id = db.Column(db.Integer, db.ForeignKey('timetables.id'), nullable=False, index=True)
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), nullable=False)
+    engine = db.Column(db.String(20), nullable=False)
+    total_seconds = db.Column(db.Float)
+    lessons_total = db.Column(db.Integer, default=0)
+    lessons_placed = db.Column(db.Integer, default=0)
+    stats = db.Column(db.JSON)  # {'phases': {name: seconds}, 'counters': {...}, 'rejections': {rule: cells}}
+    snapshot = db.Column(db.JSON)  # SchoolSnapshot.to_dict() the timetable was built from
+    profile = db.Column(db.Text)  # cProfile report, when requested
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    
+    timetable = db.relationship('Timetable', backref=db.backref('generation_run', uselist=False, cascade='all, delete-orphan'))
@@ -0,0 +1,66 @@
+from collections import defaultdict
+
+
+class OccupancyGrid:
+    """Busy state for teachers, classes and labs as one integer bitmask each.
+
+    The week is laid out as a day x period grid; the cell for ``(day, period)`` is bit
+    ``day_index * periods_per_day + (period - 1)``, so consecutive periods on the same
+    day are adjacent bits and a double lesson is a two-bit mask.
+    """
+
+    def __init__(self, days, periods_per_day):
+        self.days = tuple(days)
+        self.periods_per_day = periods_per_day
+        self.day_index = {day: i for i, day in enumerate(self.days)}
+        self.row_mask = (1 << periods_per_day) - 1
+        self.full_mask = (1 << (len(self.days) * periods_per_day)) - 1
+
+        self.teachers = defaultdict(int)
+        self.classes = defaultdict(int)
+        self.labs = defaultdict(int)
+
+    def bit(self, day, period):
+        """Bit index of a grid cell"""
+        return self.day_index[day] * self.periods_per_day + (period - 1)
+
+    def cell(self, bit):
+        """(day, period) of a bit index"""
+        day_idx, offset = divmod(bit, self.periods_per_day)
+        return self.days[day_idx], offset + 1
+
+    def busy(self, teacher_id, class_id, lab=None):
+        """Cells where the teacher, the class or the lab is already taken"""
+        mask = self.teachers[teacher_id] | self.classes[class_id]
+        if lab is not None:
+            mask |= self.labs[lab]
+        return mask
+
+    def occupy(self, mask, teacher_id, class_id, lab=None):
+        self.teachers[teacher_id] |= mask
+        self.classes[class_id] |= mask
+        if lab is not None:
+            self.labs[lab] |= mask
+
+    def release(self, mask, teacher_id, class_id, lab=None):
+        self.teachers[teacher_id] &= ~mask
+        self.classes[class_id] &= ~mask
+        if lab is not None:
+            self.labs[lab] &= ~mask
+
+    def day_row(self, mask, day):
+        """Periods of one day as a bitmask (bit 0 = period 1)"""
+        return (mask >> (self.day_index[day] * self.periods_per_day)) & self.row_mask
+
+    @staticmethod
+    def popcount(mask):
+        """Number of set cells"""
+        return bin(mask).count('1')
+
+    @staticmethod
+    def iter_bits(mask):
+        """Yield set bit indexes in ascending order"""
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
@@ -0,0 +1,162 @@
+import multiprocessing
+import os
+import queue
+import time
+
+from app.timetable_generator import TimetableGenerator, LESSON_ORDERINGS
+from app.timetable_generator_ortools import CPSATTimetableGenerator, cp_model
+from app.stats import profiled
+
+TOP_K_WIDTHS = (1, 2, 3, 5)
+
+
+def default_variants(count, seed=0, include_cpsat=True):
+    """Spread ``count`` variants over seeds, orderings, top-k widths and engines
+
+    The first variant is the plain greedy setup (top_k 1, always the best cell), so the
+    portfolio is never worse than a single greedy run. One CP-SAT variant is added when
+    OR-Tools is installed.
+    """
+    variants = []
+    for i in range(count):
+        variants.append({
+            'engine': 'greedy',
+            'seed': seed + i,
+            'ordering': LESSON_ORDERINGS[i % len(LESSON_ORDERINGS)],
+            'top_k': TOP_K_WIDTHS[(i // len(LESSON_ORDERINGS)) % len(TOP_K_WIDTHS)]
+        })
+    if include_cpsat and cp_model is not None and variants:
+        variants[-1] = {'engine': 'cpsat', 'seed': seed + count - 1, 'ordering': 'most_lessons', 'top_k': 1}
+    return variants
+
+
+def _run_variant(school_id, snapshot, variant, time_limit, solver_workers, local_search_seconds=0):
+    """Worker process: allocate one variant from the snapshot (no database access)
+
+    Greedy variants get the same local-search pass as a plain greedy run.
+    """
+    options = {
+        'snapshot': snapshot,
+        'seed': variant['seed'],
+        'ordering': variant['ordering'],
+        'top_k': variant['top_k']
+    }
+    if variant['engine'] == 'cpsat':
+        generator = CPSATTimetableGenerator(
+            school_id, time_limit=time_limit, num_workers=solver_workers, hint='greedy', **options
+        )
+    else:
+        generator = TimetableGenerator(school_id, local_search_seconds=local_search_seconds, **options)
+
+    generator._load_data()
+    generator._create_lessons()
+    generator._allocate_lessons()
+    if generator.local_search_seconds:
+        with generator.stats.phase('local_search'):
+            generator._improve_allocation()
+
+    return {
+        'variant': variant,
+        'lessons': generator.lessons,  # the lesson store pickles as a few flat arrays
+        'unplaced': generator._unplaced_count(),
+        'lessons_total': len(generator.lessons),
+        'soft_score': generator._allocation_soft_score(),
+        'stats': generator.stats.to_dict()
+    }
+
+
+class PortfolioTimetableGenerator(TimetableGenerator):
+    """Races several generator variants in worker processes and keeps the best timetable.
+
+    Variants (see ``default_variants``) differ in seed, lesson ordering, top-k width and
+    engine. Results are ranked by unplaced lessons, then soft-constraint score. Only
+    variants finished by ``deadline`` seconds count, and the workers still running then
+    are terminated; the best is saved through the normal ``_save_timetable`` path.
+    """
+
+    engine = 'portfolio'
+
+    def __init__(self, school_id, variants=None, deadline=60, max_workers=None, solver_workers=1, **kwargs):
+        super().__init__(school_id, **kwargs)
+        self.variants = variants or default_variants(max_workers or os.cpu_count() or 1)
+        self.deadline = deadline
+        self.max_workers = max_workers or min(len(self.variants), os.cpu_count() or 1)
+        self.solver_workers = solver_workers
+        self.results = []
+        self.best_result = None
+        self.elapsed = None
+
+    def generate(self):
+        """Generate timetable by racing the variants"""
+        started = time.monotonic()
+        with profiled(self.stats, self.profile):
+            with self.stats.phase('validate'):
+                self._validate_hard_constraints_setup()
+            with self.stats.phase('load_data'):
+                self._load_data()
+            with self.stats.phase('feasibility'):
+                self.check_feasibility()
+            with self.stats.phase('race_variants'):
+                self.best_result = self._race_variants()
+            # The winner's start cells map to slots through the masks check_feasibility built
+            self.lessons = self.best_result['lessons']
+            self._record_placement()
+            with self.stats.phase('save_timetable'):
+                timetable = self._save_timetable()
+        self._save_run_stats(timetable, time.monotonic() - started)
+        return timetable
+
+    def _record_placement(self):
+        """Counters come from the winning variant's worker process"""
+        best = self.best_result
+        self.stats.merge(best['stats'])
+        self.stats.counters['lessons_total'] = best['lessons_total']
+        self.stats.counters['lessons_placed'] = best['lessons_total'] - best['unplaced']
+        self.stats.counters['lessons_unplaced'] = best['unplaced']
+        self.stats.counters['variants_finished'] = len(self.results)
+
+    def _race_variants(self):
+        started = time.monotonic()
+        # Leave CP-SAT and local search room to stop and ship their result back before the deadline
+        solver_time_limit = max(1, self.deadline * 0.8)
+        local_search_seconds = min(self.local_search_seconds, solver_time_limit)
+        finished = queue.Queue()  # results and errors, in the order variants finish
+        pool = multiprocessing.get_context('spawn').Pool(processes=self.max_workers)
+
+        errors = []
+        best = None
+        try:
+            for variant in self.variants:
+                pool.apply_async(
+                    _run_variant,
+                    (self.school_id, self.snapshot, variant, solver_time_limit, self.solver_workers,
+                     local_search_seconds),
+                    callback=finished.put, error_callback=finished.put
+                )
+            for _ in self.variants:
+                try:
+                    result = finished.get(timeout=max(0, self.deadline - (time.monotonic() - started)))
+                except queue.Empty:
+                    break  # keep whatever finished in time
+                if isinstance(result, Exception):
+                    errors.append(result)
+                    continue
+                self.results.append(result)
+                if best is None or self._rank(result) < self._rank(best):
+                    best = result
+                    self._report_progress(result['lessons_total'] - result['unplaced'], result['lessons_total'])
+        finally:
+            # Stop variants still running (a CP-SAT search would run on to its own time limit)
+            pool.terminate()
+            pool.join()
+
+        if best is None:
+            if errors:
+                raise errors[0]
+            raise ValueError(f"No portfolio variant finished within {self.deadline} seconds")
+        self.elapsed = time.monotonic() - started
+        return best
+
+    @staticmethod
+    def _rank(result):
+        return (result['unplaced'], -result['soft_score'])
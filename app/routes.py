@@ -1,8 +1,21 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+import hashlib
+import hmac
+from datetime import datetime
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, session, make_response, Response, stream_with_context, abort
 from flask_login import login_user, logout_user, login_required, current_user
 from app import db
-from app.models import School, Teacher, Class, Subject, SubjectAssignment, TimeSlot, Lesson, Timetable, StrokedSubjectGroup, StrokedGroupSubject, ConcurrentSubject
+from app.models import School, Teacher, Class, Subject, SubjectAssignment, TimeSlot, Lesson, Timetable, StrokedSubjectGroup, StrokedGroupSubject, ConcurrentSubject, GenerationJob, GenerationRun
+from app.jobs import submit_job, dispatch_jobs, parse_hint, DEFAULT_HINT, ENGINE_LABELS
+from app.cache import CachedView, cached_view_size
+from app.stats import prometheus_text
+from app.scoring import DEFAULT_WEIGHTS, WEIGHT_LABELS, resolve_weights
+from app import export
+from app.importer import SchoolImporter, IMPORT_COLUMNS
 from app.timetable_generator import TimetableGenerator
+from app.lattice import DAYS, lesson_day
+from app.snapshot import SLOT_LEVEL_FOR_CLASS_LEVEL
+from sqlalchemy.orm import joinedload
+from werkzeug.utils import secure_filename
 
 main_bp = Blueprint('main', __name__)
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
@@ -14,6 +27,30 @@ timetable_bp = Blueprint('timetable', __name__, url_prefix='/timetable')
 def index():
     return render_template('index.html')
 
+@main_bp.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint - totals over stored generation runs, no per-school labels"""
+    token = current_app.config['METRICS_TOKEN']
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain',
+                        headers={'WWW-Authenticate': 'Bearer'})
+    
+    # Only runs stored since the last scrape are read
+    totals = current_app.extensions['metrics_totals']
+    with totals.lock:
+        new_runs = db.session.query(GenerationRun.id, GenerationRun.engine, GenerationRun.stats).filter(
+            GenerationRun.id > totals.last_run_id
+        ).order_by(GenerationRun.id).yield_per(500)
+        for run_id, engine, stats in new_runs:
+            totals.add(run_id, engine, stats or {})
+        job_counts = dict(
+            db.session.query(GenerationJob.status, db.func.count(GenerationJob.id)).group_by(GenerationJob.status).all()
+        )
+        text = prometheus_text(totals, job_counts)
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
 @main_bp.route('/about')
 def about():
     return render_template('about.html')
@@ -88,6 +125,7 @@ def teachers():
             teacher = Teacher(school_id=current_user.id, name=name, employee_id=employee_id)
             db.session.add(teacher)
             db.session.commit()
+            _invalidate_timetable_cache(current_user.id)
             
             flash('Teacher added successfully', 'success')
         except Exception as e:
@@ -109,6 +147,7 @@ def delete_teacher(teacher_id):
     if teacher and teacher.school_id == current_user.id:
         db.session.delete(teacher)
         db.session.commit()
+        _invalidate_timetable_cache(current_user.id)
         flash('Teacher deleted', 'success')
     return redirect(url_for('school.teachers'))
 
@@ -136,6 +175,7 @@ def subjects():
             )
             db.session.add(subject)
             db.session.commit()
+            _invalidate_timetable_cache(current_user.id)
             
             flash('Subject added successfully', 'success')
         except Exception as e:
@@ -176,6 +216,7 @@ def edit_subject(subject_id):
             subject.double_lessons_per_week = double_lessons
             
             db.session.commit()
+            _invalidate_timetable_cache(current_user.id)
             flash('Subject updated successfully', 'success')
             return redirect(url_for('school.subjects'))
         except Exception as e:
@@ -194,6 +235,7 @@ def delete_subject(subject_id):
     if subject and subject.school_id == current_user.id:
         db.session.delete(subject)
         db.session.commit()
+        _invalidate_timetable_cache(current_user.id)
         flash('Subject deleted', 'success')
     return redirect(url_for('school.subjects'))
 
@@ -213,6 +255,7 @@ def classes():
             )
             db.session.add(class_obj)
             db.session.commit()
+            _invalidate_timetable_cache(current_user.id)
             
             flash('Class added successfully', 'success')
         except Exception as e:
@@ -234,6 +277,7 @@ def delete_class(class_id):
     if class_obj and class_obj.school_id == current_user.id:
         db.session.delete(class_obj)
         db.session.commit()
+        _invalidate_timetable_cache(current_user.id)
         flash('Class deleted', 'success')
     return redirect(url_for('school.classes'))
 
@@ -272,7 +316,11 @@ def assignments():
     teachers = Teacher.query.filter_by(school_id=current_user.id).all()
     subjects = Subject.query.filter_by(school_id=current_user.id).all()
     classes = Class.query.filter_by(school_id=current_user.id).all()
-    assignments = SubjectAssignment.query.filter_by(school_id=current_user.id).all()
+    assignments = SubjectAssignment.query.filter_by(school_id=current_user.id).options(
+        joinedload(SubjectAssignment.teacher),
+        joinedload(SubjectAssignment.subject),
+        joinedload(SubjectAssignment.class_)
+    ).all()
     
     return render_template('assignments.html', teachers=teachers, subjects=subjects, classes=classes, assignments=assignments)
 
@@ -324,6 +372,7 @@ def timeslots():
             )
             db.session.add(slot)
             db.session.commit()
+            _invalidate_timetable_cache(current_user.id)
             
             flash('Time slot added successfully', 'success')
         except Exception as e:
@@ -348,6 +397,7 @@ def delete_timeslot(slot_id):
     if slot and slot.school_id == current_user.id:
         db.session.delete(slot)
         db.session.commit()
+        _invalidate_timetable_cache(current_user.id)
         flash('Time slot deleted', 'success')
     return redirect(url_for('school.timeslots'))
 
@@ -439,7 +489,23 @@ def delete_stroked_group(group_id):
     if group and group.school_id == current_user.id:
         try:
             # Delete child records (stroked group subjects)
+            subject_ids = [gs.subject_id for gs in StrokedGroupSubject.query.filter_by(group_id=group_id).all()]
             StrokedGroupSubject.query.filter_by(group_id=group_id).delete()
+            
+            # Drop the group's concurrency pairs (which the generator blocks together)
+            # unless another stroked group still pairs the same subjects
+            still_paired = set()
+            for other in StrokedSubjectGroup.query.filter(
+                StrokedSubjectGroup.school_id == current_user.id, StrokedSubjectGroup.id != group_id
+            ).all():
+                other_ids = [gs.subject_id for gs in other.group_subjects]
+                still_paired.update((a, b) for a in other_ids for b in other_ids if a != b)
+            for subject_id1 in subject_ids:
+                for subject_id2 in subject_ids:
+                    if subject_id1 != subject_id2 and (subject_id1, subject_id2) not in still_paired:
+                        ConcurrentSubject.query.filter_by(
+                            school_id=current_user.id, subject_id=subject_id1, concurrent_subject_id=subject_id2
+                        ).delete()
             db.session.commit()
             
             # Now delete the group
@@ -451,21 +517,121 @@ def delete_stroked_group(group_id):
             flash(f'Error deleting stroked group: {str(e)}', 'danger')
     return redirect(url_for('school.stroked'))
 
+# Bulk CSV import
+@school_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def bulk_import():
+    importer = None
+    if request.method == 'POST':
+        uploads = [(kind, request.files.get(kind)) for kind in IMPORT_COLUMNS]
+        uploads = [(kind, f) for kind, f in uploads if f and f.filename]
+        if not uploads:
+            flash('Choose at least one CSV file to import', 'warning')
+            return redirect(url_for('school.bulk_import'))
+        
+        importer = SchoolImporter(current_user.id)
+        for kind, f in uploads:
+            importer.read(kind, f.stream)
+        
+        dry_run = bool(request.form.get('dry_run'))
+        if dry_run:
+            flash('Checked only - nothing was saved', 'warning')
+        elif importer.changed:
+            try:
+                importer.commit()
+                _invalidate_timetable_cache(current_user.id)
+                flash('Import saved' + (' - rows with errors were skipped' if importer.has_errors else ''),
+                      'warning' if importer.has_errors else 'success')
+            except Exception as e:
+                flash('Error saving import: ' + str(e), 'danger')
+        else:
+            flash('Nothing to change' + (' - see the errors below' if importer.has_errors else ''),
+                  'warning' if importer.has_errors else 'success')
+    
+    return render_template('import.html', importer=importer, columns=IMPORT_COLUMNS)
+
+# Soft-constraint weights
+@school_bp.route('/scoring', methods=['GET', 'POST'])
+@login_required
+def scoring():
+    school = current_user
+    if request.method == 'POST':
+        if request.form.get('reset'):
+            school.soft_weights = None
+        else:
+            try:
+                weights = {key: int(request.form.get(key, '').strip()) for key in DEFAULT_WEIGHTS}
+            except ValueError:
+                flash('Weights must be whole numbers', 'danger')
+                return redirect(url_for('school.scoring'))
+            if any(value < 0 or value > 100 for value in weights.values()):
+                flash('Weights must be between 0 and 100', 'danger')
+                return redirect(url_for('school.scoring'))
+            school.soft_weights = weights
+        db.session.commit()
+        flash('Scoring weights saved - they apply to the next generated timetable', 'success')
+        return redirect(url_for('school.scoring'))
+    
+    return render_template('scoring.html', weights=resolve_weights(school.soft_weights),
+                         defaults=DEFAULT_WEIGHTS, labels=WEIGHT_LABELS)
+
 # Timetable generation
 @timetable_bp.route('/generate', methods=['GET', 'POST'])
 @login_required
 def generate():
     if request.method == 'POST':
+        engine = request.form.get('engine', 'greedy')
+        hint = parse_hint(request.form.get('hint', DEFAULT_HINT))
+        profile = request.values.get('profile') in ('1', 'true', 'on')
         try:
-            generator = TimetableGenerator(current_user.id)
-            timetable = generator.generate()
-            flash('Timetable generated successfully', 'success')
-            return redirect(url_for('timetable.view_timetable', timetable_id=timetable.id))
+            job = submit_job(current_user.id, engine=engine, hint=hint, profile=profile)
+            return redirect(url_for('timetable.job_progress', job_id=job.id))
         except Exception as e:
+            db.session.rollback()
             flash(f'Error generating timetable: {str(e)}', 'danger')
             return redirect(url_for('timetable.generate'))
     
-    return render_template('generate_timetable.html')
+    # Capacity pre-check, so problems show up before a generation is started
+    problems = TimetableGenerator(current_user.id).check_feasibility()
+    return render_template('generate_timetable.html', problems=problems)
+
+@timetable_bp.route('/jobs/<int:job_id>')
+@login_required
+def job_progress(job_id):
+    job = GenerationJob.query.get(job_id)
+    if not job or job.school_id != current_user.id:
+        flash('Generation job not found', 'danger')
+        return redirect(url_for('timetable.generate'))
+    
+    return render_template('generation_progress.html', job=job,
+                           engine_label=ENGINE_LABELS.get(job.engine, job.engine))
+
+@timetable_bp.route('/jobs/<int:job_id>/status')
+@login_required
+def job_status(job_id):
+    job = GenerationJob.query.get(job_id)
+    if not job or job.school_id != current_user.id:
+        return jsonify({'error': 'not found'}), 404
+    
+    # Polling also restarts queued or orphaned jobs, e.g. after a web worker restart
+    if job.status in ('queued', 'running'):
+        dispatch_jobs()
+        db.session.refresh(job)
+        if job.status == 'done':
+            flash('Timetable generated successfully', 'success')
+            if job.message:
+                flash(job.message, 'info')
+    
+    return jsonify({
+        'id': job.id,
+        'status': job.status,
+        'percent': job.percent,
+        'lessons_placed': job.lessons_placed,
+        'lessons_total': job.lessons_total,
+        'error': job.error,
+        'message': job.message,
+        'timetable_url': url_for('timetable.view_timetable', timetable_id=job.timetable_id) if job.timetable_id else None
+    })
 
 @timetable_bp.route('/<int:timetable_id>/view')
 @login_required
@@ -475,7 +641,11 @@ def view_timetable(timetable_id):
         flash('Timetable not found', 'danger')
         return redirect(url_for('school.dashboard'))
     
-    return render_template('view_timetable.html', timetable=timetable)
+    def load():
+        grid, lesson_count = _lesson_grid(timetable.id)
+        return grid, lesson_count, _timetable_columns(timetable.school_id, grid)
+    
+    return _render_timetable_view(timetable, 'block', None, 'view_timetable.html', load)
 
 @timetable_bp.route('/<int:timetable_id>/teacher/<int:teacher_id>')
 @login_required
@@ -487,8 +657,16 @@ def teacher_timetable(timetable_id, teacher_id):
         flash('Not found', 'danger')
         return redirect(url_for('school.dashboard'))
     
-    lessons = Lesson.query.filter_by(timetable_id=timetable_id, teacher_id=teacher_id).all()
-    return render_template('teacher_timetable.html', teacher=teacher, lessons=lessons, timetable=timetable)
+    def load():
+        grid, lesson_count = _lesson_grid(timetable_id, teacher_id=teacher_id)
+        classes = sorted(
+            {cell['class_id']: {'id': cell['class_id'], 'name': cell['class_name'], 'level': cell['class_level']}
+             for cell in grid.values()}.values(),
+            key=lambda c: c['level']
+        )
+        return grid, lesson_count, dict(_timetable_columns(timetable.school_id, grid), classes=classes)
+    
+    return _render_timetable_view(timetable, 'teacher', teacher_id, 'teacher_timetable.html', load, teacher=teacher)
 
 @timetable_bp.route('/<int:timetable_id>/class/<int:class_id>')
 @login_required
@@ -500,8 +678,262 @@ def class_timetable(timetable_id, class_id):
         flash('Not found', 'danger')
         return redirect(url_for('school.dashboard'))
     
-    lessons = Lesson.query.filter_by(timetable_id=timetable_id, class_id=class_id).all()
-    return render_template('class_timetable.html', class_obj=class_obj, lessons=lessons, timetable=timetable)
+    def load():
+        grid, lesson_count = _lesson_grid(timetable_id, class_id=class_id)
+        slot_level = SLOT_LEVEL_FOR_CLASS_LEVEL.get(class_obj.level)
+        return grid, lesson_count, _timetable_columns(timetable.school_id, grid, slot_level)
+    
+    return _render_timetable_view(timetable, 'class', class_id, 'class_timetable.html', load, class_obj=class_obj)
+
+@timetable_bp.route('/<int:timetable_id>/stats')
+@login_required
+def timetable_stats(timetable_id):
+    timetable = Timetable.query.get(timetable_id)
+    if not timetable or timetable.school_id != current_user.id:
+        return jsonify({'error': 'not found'}), 404
+    
+    run = timetable.generation_run
+    if run is None:
+        return jsonify({'error': 'no stats recorded for this timetable'}), 404
+    stats = run.stats or {}
+    return jsonify({
+        'timetable_id': timetable.id,
+        'engine': run.engine,
+        'total_seconds': run.total_seconds,
+        'lessons_total': run.lessons_total,
+        'lessons_placed': run.lessons_placed,
+        'phases': stats.get('phases', {}),
+        'counters': stats.get('counters', {}),
+        'rejections': stats.get('rejections', {}),
+        'feasibility': stats.get('feasibility', []),
+        'profile_url': url_for('timetable.timetable_profile', timetable_id=timetable.id) if run.profile else None
+    })
+
+@timetable_bp.route('/<int:timetable_id>/profile')
+@login_required
+def timetable_profile(timetable_id):
+    timetable = Timetable.query.get(timetable_id)
+    if not timetable or timetable.school_id != current_user.id or not timetable.generation_run \
+            or not timetable.generation_run.profile:
+        return Response('No profile recorded for this timetable\n', status=404, mimetype='text/plain')
+    return Response(timetable.generation_run.profile, mimetype='text/plain')
+
+# Timetable export
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'ics': 'text/calendar'
+}
+
+@timetable_bp.route('/<int:timetable_id>/export.<fmt>')
+@login_required
+def export_timetable(timetable_id, fmt):
+    timetable = Timetable.query.get(timetable_id)
+    if not timetable or timetable.school_id != current_user.id:
+        flash('Timetable not found', 'danger')
+        return redirect(url_for('school.dashboard'))
+    return _export_response(timetable, fmt, f'timetable-{timetable.id}')
+
+@timetable_bp.route('/<int:timetable_id>/class/<int:class_id>/export.<fmt>')
+@login_required
+def export_class_timetable(timetable_id, class_id, fmt):
+    timetable = Timetable.query.get(timetable_id)
+    class_obj = Class.query.get(class_id)
+    if not timetable or timetable.school_id != current_user.id or not class_obj or class_obj.school_id != current_user.id:
+        flash('Not found', 'danger')
+        return redirect(url_for('school.dashboard'))
+    return _export_response(timetable, fmt, f'timetable-{timetable.id}-{class_obj.level}-{class_obj.name}',
+                            class_id=class_id)
+
+@timetable_bp.route('/<int:timetable_id>/teacher/<int:teacher_id>/export.<fmt>')
+@login_required
+def export_teacher_timetable(timetable_id, teacher_id, fmt):
+    timetable = Timetable.query.get(timetable_id)
+    teacher = Teacher.query.get(teacher_id)
+    if not timetable or timetable.school_id != current_user.id or not teacher or teacher.school_id != current_user.id:
+        flash('Not found', 'danger')
+        return redirect(url_for('school.dashboard'))
+    return _export_response(timetable, fmt, f'timetable-{timetable.id}-{teacher.name}',
+                            teacher_id=teacher_id, calendar_name=f'{teacher.name} - {current_user.name}')
+
+def _export_response(timetable, fmt, name, class_id=None, teacher_id=None, calendar_name=None):
+    """Stream a timetable export; the file is written while the lessons are read from the database
+    
+    ``.ics`` (teachers only) takes ``start=YYYY-MM-DD`` (the first week, default this
+    week) and ``weeks=N`` (default: repeat with no end) query parameters.
+    """
+    back = request.referrer or url_for('timetable.view_timetable', timetable_id=timetable.id)
+    if fmt not in EXPORT_MIMETYPES or (fmt == 'ics' and calendar_name is None):
+        flash(f'Unsupported export format: {fmt}', 'danger')
+        return redirect(back)
+    if fmt == 'xlsx' and export.Workbook is None:
+        flash('Excel export needs the openpyxl package', 'danger')
+        return redirect(back)
+    
+    rows = export.lesson_rows(timetable.id, class_id=class_id, teacher_id=teacher_id)
+    if fmt == 'csv':
+        body = export.stream_csv(rows)
+    elif fmt == 'xlsx':
+        body = export.stream_xlsx(rows, title=f'Timetable {timetable.id}')
+    else:
+        try:
+            term_start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else None
+            weeks = int(request.args['weeks']) if request.args.get('weeks') else None
+        except ValueError:
+            flash('Use start=YYYY-MM-DD and a whole number of weeks', 'danger')
+            return redirect(back)
+        body = export.stream_ics(rows, calendar_name, term_start=term_start, weeks=weeks, stamp=timetable.generated_at)
+    
+    filename = secure_filename(f'{name}.{fmt}') or f'timetable.{fmt}'
+    return Response(stream_with_context(body), mimetype=EXPORT_MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@timetable_bp.route('/<int:timetable_id>/activate', methods=['POST'])
+@login_required
+def activate_timetable(timetable_id):
+    timetable = Timetable.query.get(timetable_id)
+    if timetable and timetable.school_id == current_user.id:
+        Timetable.query.filter_by(school_id=current_user.id).update({'is_active': False})
+        timetable.is_active = True
+        db.session.commit()
+        _invalidate_timetable_cache(current_user.id)
+        flash('Timetable activated', 'success')
+    return redirect(url_for('timetable.list_timetables'))
+
+@timetable_bp.route('/<int:timetable_id>/delete', methods=['POST'])
+@login_required
+def delete_timetable(timetable_id):
+    timetable = Timetable.query.get(timetable_id)
+    if timetable and timetable.school_id == current_user.id:
+        Lesson.query.filter_by(timetable_id=timetable_id).delete()
+        GenerationJob.query.filter_by(timetable_id=timetable_id).update({'timetable_id': None})
+        db.session.delete(timetable)
+        db.session.commit()
+        _invalidate_timetable_cache(current_user.id, timetable_id)
+        flash('Timetable deleted', 'success')
+    return redirect(url_for('timetable.list_timetables'))
+
+def _render_timetable_view(timetable, view, entity_id, template, load, **context):
+    """Render a timetable page through the rendered-view cache, answering If-None-Match with 304
+    
+    Entries are keyed by (timetable_id, view, entity_id). The grid data is always
+    reused; the HTML is only cached and served when no flash messages are pending,
+    since those are rendered into the page. An entry built before the school's
+    cache_version was last bumped is stale, whichever web worker bumped it.
+    """
+    cache = current_app.extensions['timetable_cache']
+    key = (timetable.id, view, entity_id)
+    version = current_user.cache_version or 0
+    entry = cache.get(key)
+    if entry is not None and (entry.is_active != timetable.is_active or entry.version != version):
+        entry = None
+    
+    has_flashes = bool(session.get('_flashes'))
+    if entry is not None and entry.html is not None and not has_flashes:
+        response = make_response(entry.html)
+        response.set_etag(entry.etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+    
+    if entry is None:
+        grid, lesson_count, extra = load()
+    else:
+        grid, lesson_count, extra = entry.grid, entry.lesson_count, entry.context
+    
+    html = render_template(template, timetable=timetable, grid=grid, lesson_count=lesson_count,
+                           **extra, **context).encode('utf-8')
+    etag = hashlib.sha1(html).hexdigest()
+    entry = CachedView(timetable.school_id, timetable.is_active, version, grid, lesson_count, extra,
+                       None if has_flashes else html, None if has_flashes else etag)
+    cache.set(key, entry, cached_view_size(entry))
+    
+    response = make_response(html)
+    if not has_flashes:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+    return response
+
+def _invalidate_timetable_cache(school_id, timetable_id=None):
+    """Drop cached timetable pages of one timetable, or of every timetable of a school
+    
+    School-wide invalidation is used when teachers, classes, subjects or time slots
+    change, since their names, codes and times are rendered into the pages. The cache
+    lives in each web worker process, so school-wide invalidation also bumps the
+    school's cache_version: other workers then treat their entries as stale too.
+    A deleted timetable needs no bump, as its pages are never served again.
+    """
+    cache = current_app.extensions['timetable_cache']
+    if timetable_id is not None:
+        cache.invalidate(lambda key, entry: key[0] == timetable_id)
+    else:
+        School.query.filter_by(id=school_id).update(
+            {'cache_version': db.func.coalesce(School.cache_version, 0) + 1}, synchronize_session=False
+        )
+        db.session.commit()
+        cache.invalidate(lambda key, entry: entry.school_id == school_id)
+
+def _timetable_columns(school_id, grid, slot_level=None):
+    """Day rows and period columns of a timetable page, from the school's lesson time slots
+    
+    Periods are those of the lesson slots (of one slot level, for a class page) plus any
+    holding a saved lesson. A period's start and end time are shown when every slot
+    level has the same times for it, and are None otherwise.
+    """
+    query = TimeSlot.query.filter_by(school_id=school_id, slot_type='lesson')
+    if slot_level is not None:
+        query = query.filter_by(level=slot_level)
+    times = {}
+    for slot in query.all():
+        times.setdefault(slot.period, set()).add((slot.start_time, slot.end_time))
+    for _, _, period in grid:
+        times.setdefault(period, set())
+    
+    periods = []
+    for period, period_times in sorted(times.items()):
+        start, end = next(iter(period_times)) if len(period_times) == 1 else (None, None)
+        periods.append({'number': period, 'start': start, 'end': end})
+    return {'days': DAYS, 'periods': periods}
+
+def _lesson_grid(timetable_id, **filters):
+    """Load a timetable's lessons in one joined query and key them by (class_id, day, period)
+    
+    Concurrent lessons of a class share one cell, their subjects and teachers joined.
+    Returns the grid of plain cell dicts and the number of lessons loaded.
+    """
+    lessons = Lesson.query.filter_by(timetable_id=timetable_id, **filters).options(
+        joinedload(Lesson.subject),
+        joinedload(Lesson.teacher),
+        joinedload(Lesson.class_),
+        joinedload(Lesson.time_slot)
+    ).all()
+    
+    grid = {}
+    for lesson in lessons:
+        if lesson.time_slot is None:
+            continue
+        period = lesson.time_slot.period
+        key = (lesson.class_id, lesson_day(lesson.day, period), period)
+        if key in grid:
+            cell = grid[key]
+            cell['subject_code'] = f"{cell['subject_code']}/{lesson.subject.code}"
+            cell['subject_name'] = f"{cell['subject_name']} / {lesson.subject.name}"
+            cell['teacher_name'] = f"{cell['teacher_name']}, {lesson.teacher.name}"
+            continue
+        grid[key] = {
+            'class_id': lesson.class_id,
+            'class_name': lesson.class_.name,
+            'class_level': lesson.class_.level,
+            'subject_id': lesson.subject_id,
+            'subject_code': lesson.subject.code,
+            'subject_name': lesson.subject.name,
+            'teacher_id': lesson.teacher_id,
+            'teacher_name': lesson.teacher.name,
+            'start_time': lesson.time_slot.start_time,
+            'end_time': lesson.time_slot.end_time,
+            'is_double': lesson.is_double_lesson
+        }
+    return grid, len(lessons)
 
 @timetable_bp.route('/list')
 @login_required
@@ -0,0 +1,160 @@
+import numpy as np
+
+from app.occupancy import OccupancyGrid
+
+# Soft-constraint weights in score points; a school can override any of them (School.soft_weights)
+DEFAULT_WEIGHTS = {
+    'math_morning': 10,     # SP1.1: Mathematics in periods 1-4
+    'science_spread': 5,    # SP1.2: fewer than two sciences already taught to the class that day
+    'subject_variety': 5,   # SP1.3: subject not yet taught to the class that day
+    'teacher_adjacent': 8,  # SP2.1: next to the teacher's last lesson of the day
+    'heavy_not_last': 3     # SP3.1: maths-heavy subjects outside the last period of the day
+}
+
+# Below this many candidate cells the per-cell scalar score is cheaper than the array set-up
+MIN_VECTOR_CELLS = 8
+
+WEIGHT_LABELS = {
+    'math_morning': 'Mathematics in the morning',
+    'science_spread': 'Sciences spread across the week',
+    'subject_variety': 'No repeated subject in a day',
+    'teacher_adjacent': 'Teacher lessons back to back',
+    'heavy_not_last': 'Heavy subjects not in the last period'
+}
+
+
+def resolve_weights(overrides=None):
+    """DEFAULT_WEIGHTS with a school's stored overrides applied (unknown keys are ignored)"""
+    weights = dict(DEFAULT_WEIGHTS)
+    for key, value in (overrides or {}).items():
+        if key in weights and value is not None:
+            weights[key] = int(value)
+    return weights
+
+
+class SlotScorer:
+    """Scores every candidate start cell of a lesson with one batch of array operations.
+
+    The per-cell preferences (SP1.1, SP3.1) are a precomputed score vector per slot
+    level and subject.
+    The terms that depend on what is already placed (SP1.2, SP1.3) are worked out once
+    per day and broadcast to the cells of that day, and SP2.1 adds to the at most two
+    cells beside the teacher's last lesson of each day. The result equals
+    ``TimetableGenerator._calculate_soft_constraint_score`` for each cell, which is
+    still used when there are fewer than ``MIN_VECTOR_CELLS`` candidates.
+    """
+
+    def __init__(self, generator):
+        self.gen = generator
+        self.weights = generator.weights
+        occupancy = generator.occupancy
+        self.days = occupancy.days
+        self.periods_per_day = occupancy.periods_per_day
+        cell_count = len(self.days) * self.periods_per_day
+        self.cell_count = cell_count
+        self.cell_bytes = (cell_count + 7) // 8
+        self.day_of = np.arange(cell_count) // self.periods_per_day
+        period_of = np.arange(cell_count) % self.periods_per_day + 1
+        # Equal scores rank in period order (then by day), as in _rank_scalar
+        self.period_order = np.argsort(period_of, kind='stable')
+
+        morning = (period_of <= 4).astype(np.int64)
+        self.static = {}  # slot level -> subject id -> score vector
+        for level, last_mask in generator.lattice.last_masks.items():
+            not_last = 1 - self._mask_array(last_mask).astype(np.int64)
+            vectors = self.static[level] = {}
+            for subject in generator.snapshot.subjects.values():
+                vector = np.zeros(cell_count, dtype=np.int64)
+                if subject.name == 'Mathematics':
+                    vector += self.weights['math_morning'] * morning
+                if subject.is_math_heavy:
+                    vector += self.weights['heavy_not_last'] * not_last
+                vectors[subject.id] = vector
+
+    def _mask_array(self, mask):
+        """Bool array with one entry per cell of the grid, True where ``mask`` is set"""
+        packed = np.frombuffer(mask.to_bytes(self.cell_bytes, 'little'), dtype=np.uint8)
+        return np.unpackbits(packed, count=self.cell_count, bitorder='little').view(bool)
+
+    def cells(self, mask):
+        """Set bits of an occupancy mask as an index array, in period order (ties by day)"""
+        is_set = self._mask_array(mask)
+        return self.period_order[is_set[self.period_order]]
+
+    def scores(self, lesson):
+        """Soft-constraint score of placing ``lesson`` (a lesson store id) at each cell of the grid
+
+        A block lead scores the sum over its members, which are placed with it.
+        """
+        members = self.gen.lessons.members(lesson)
+        scores = self._member_scores(members[0])
+        for member in members[1:]:
+            scores += self._member_scores(member)
+        return scores
+
+    def _member_scores(self, lesson):
+        gen = self.gen
+        weights = self.weights
+        store = gen.lessons
+        class_id, subject_id = store.class_ids[lesson], store.subject_ids[lesson]
+        subject = gen.snapshot.subjects[subject_id]
+        daily_subjects = gen.class_daily_subjects[class_id]
+        taught = gen.occupancy.teachers[store.teacher_ids[lesson]]
+        periods_per_day = self.periods_per_day
+        row_mask = gen.occupancy.row_mask
+
+        day_bonus = []
+        adjacent = []  # cells next to the teacher's last lesson of a day
+        for i, day in enumerate(self.days):
+            today = daily_subjects[day]
+            bonus = 0
+            # SP1.3: Avoid repeating subject same day
+            if subject_id not in today:
+                bonus += weights['subject_variety']
+            # SP1.2: Sciences not all in one day
+            if subject.is_science and sum(1 for s in today if gen.snapshot.subjects[s].is_science) < 2:
+                bonus += weights['science_spread']
+            day_bonus.append(bonus)
+            # SP2.1: Avoid teacher gaps
+            last_period = (taught >> i * periods_per_day & row_mask).bit_length()
+            if last_period:
+                if last_period > 1:
+                    adjacent.append(i * periods_per_day + last_period - 2)
+                if last_period < periods_per_day:
+                    adjacent.append(i * periods_per_day + last_period)
+
+        level = gen.snapshot.classes[class_id].slot_level
+        scores = self.static[level][subject_id] + np.array(day_bonus)[self.day_of]
+        if adjacent:
+            scores[adjacent] += weights['teacher_adjacent']
+        return scores
+
+    def rank(self, lesson, mask, k=None):
+        """The best k feasible cells of ``mask``, best score first (ties in period order), and how many are feasible"""
+        if not mask & (mask - 1):
+            # Nothing to rank with zero or one feasible cell
+            cells = [mask.bit_length() - 1] if mask else []
+            return cells, len(cells)
+        if OccupancyGrid.popcount(mask) < MIN_VECTOR_CELLS:
+            return self._rank_scalar(lesson, mask, k)
+        cells = self.cells(mask)
+        order = (-self.scores(lesson)[cells]).argsort(kind='stable')
+        return cells[order[:k]].tolist(), len(cells)
+
+    def _rank_scalar(self, lesson, mask, k=None):
+        gen = self.gen
+        store = gen.lessons
+        class_id, subject_id, teacher_id = store.class_ids[lesson], store.subject_ids[lesson], store.teacher_ids[lesson]
+        subject = gen.snapshot.subjects[subject_id]
+        cells = sorted(OccupancyGrid.iter_bits(mask), key=lambda bit: bit % self.periods_per_day)
+        scores = {
+            bit: gen._calculate_soft_constraint_score(class_id, subject_id, teacher_id, bit, subject, lesson)
+            for bit in cells
+        }
+        for member in store.members(lesson)[1:]:
+            subject = gen.snapshot.subjects[store.subject_ids[member]]
+            for bit in cells:
+                scores[bit] += gen._calculate_soft_constraint_score(
+                    class_id, subject.id, store.teacher_ids[member], bit, subject, member
+                )
+        return sorted(cells, key=scores.get, reverse=True)[:k], len(cells)
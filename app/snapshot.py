@@ -0,0 +1,200 @@
+from collections import namedtuple, defaultdict
+from types import MappingProxyType
+
+from app.models import (
+    School, Teacher, Class, Subject, TimeSlot, SubjectAssignment,
+    ConcurrentSubject, StrokedSubjectGroup, StrokedGroupSubject
+)
+
+# Subject categories used by the constraint rules
+SCIENCE_SUBJECTS = frozenset({'Physics', 'Chemistry', 'Biology'})
+MATH_HEAVY_SUBJECTS = frozenset({'Mathematics', 'Physics', 'Chemistry'})
+PRACTICAL_SUBJECTS = frozenset({'Chemistry', 'Physics', 'Biology', 'Computer Science'})
+LAB_FOR_SUBJECT = {
+    'Chemistry': 'chem_lab',
+    'Physics': 'physics_lab',
+    'Biology': 'bio_lab',
+    'Computer Science': 'computer_lab'
+}
+
+# Class level -> time slot level
+SLOT_LEVEL_FOR_CLASS_LEVEL = {
+    'Grade 10': 'grade10-12',
+    'Grade 11': 'grade10-12',
+    'Grade 12': 'grade10-12',
+    'Form 3': 'form3-4',
+    'Form 4': 'form3-4'
+}
+SLOT_LEVELS = ('grade10-12', 'form3-4')
+
+SubjectInfo = namedtuple('SubjectInfo', [
+    'id', 'name', 'code', 'max_lessons_per_week', 'double_lessons_per_week', 'offered_for',
+    'is_practical', 'is_science', 'is_math_heavy', 'lab'
+])
+ClassInfo = namedtuple('ClassInfo', ['id', 'name', 'level', 'slot_level'])
+TeacherInfo = namedtuple('TeacherInfo', ['id', 'name', 'employee_id'])
+AssignmentInfo = namedtuple('AssignmentInfo', ['id', 'teacher_id', 'subject_id', 'class_id'])
+SlotInfo = namedtuple('SlotInfo', ['id', 'period', 'level', 'slot_type', 'start_time', 'end_time'])
+StrokedGroupInfo = namedtuple('StrokedGroupInfo', ['id', 'group_name', 'level', 'subject_ids'])
+
+
+def _connected_groups(pairs):
+    """Subjects linked by concurrency pairs, as sorted tuples of subject ids (connected components)"""
+    parent = {}
+
+    def root(subject_id):
+        parent.setdefault(subject_id, subject_id)
+        while parent[subject_id] != subject_id:
+            parent[subject_id] = parent[parent[subject_id]]
+            subject_id = parent[subject_id]
+        return subject_id
+
+    for first, second in pairs:
+        parent[root(first)] = root(second)
+    groups = defaultdict(list)
+    for subject_id in sorted(parent):
+        groups[root(subject_id)].append(subject_id)
+    return tuple(sorted(tuple(group) for group in groups.values()))
+
+
+class SchoolSnapshot:
+    """Immutable, indexed copy of everything the generators read from the database.
+
+    Built once per generation run so the allocation loop never touches the ORM.
+    """
+
+    def __init__(self, school_id, subjects, classes, teachers, assignments, time_slots,
+                 concurrent_pairs, stroked_groups, weights=None):
+        self.school_id = school_id
+        self.subjects = MappingProxyType(dict(subjects))
+        self.classes = MappingProxyType(dict(classes))
+        self.teachers = MappingProxyType(dict(teachers))
+        self.assignments = tuple(assignments)
+        self.time_slots = MappingProxyType(dict(time_slots))
+        self.concurrent_pairs = frozenset(concurrent_pairs)
+        self.stroked_groups = MappingProxyType(dict(stroked_groups))
+        self.weights = MappingProxyType(dict(weights or {}))  # the school's soft-constraint weight overrides
+
+        teachers_by_subject = defaultdict(list)
+        for assignment in self.assignments:
+            teachers_by_subject[assignment.subject_id].append(assignment.teacher_id)
+        self.teachers_by_subject = MappingProxyType(
+            {subject_id: tuple(ids) for subject_id, ids in teachers_by_subject.items()}
+        )
+
+        lesson_slots_by_level = {level: [] for level in SLOT_LEVELS}
+        for slot in sorted(self.time_slots.values(), key=lambda s: s.period):
+            if slot.slot_type == 'lesson':
+                lesson_slots_by_level.setdefault(slot.level, []).append(slot)
+        self.lesson_slots_by_level = MappingProxyType(
+            {level: tuple(slots) for level, slots in lesson_slots_by_level.items()}
+        )
+
+        self.stroked_subject_ids = frozenset(
+            subject_id for group in self.stroked_groups.values() for subject_id in group.subject_ids
+        )
+        self.concurrent_groups = _connected_groups(self.concurrent_pairs)
+
+    def __reduce__(self):
+        # Mapping proxies can't be pickled, so rebuild from plain dicts (used by worker processes)
+        return (SchoolSnapshot, (
+            self.school_id, dict(self.subjects), dict(self.classes), dict(self.teachers),
+            self.assignments, dict(self.time_slots), self.concurrent_pairs, dict(self.stroked_groups),
+            dict(self.weights)
+        ))
+
+    def to_dict(self):
+        """JSON-serialisable form, stored with each generation run for incremental re-generation"""
+        return {
+            'school_id': self.school_id,
+            'subjects': [list(s) for s in self.subjects.values()],
+            'classes': [list(c) for c in self.classes.values()],
+            'teachers': [list(t) for t in self.teachers.values()],
+            'assignments': [list(a) for a in self.assignments],
+            'time_slots': [list(t) for t in self.time_slots.values()],
+            'concurrent_pairs': sorted(list(p) for p in self.concurrent_pairs),
+            'stroked_groups': [list(g) for g in self.stroked_groups.values()],
+            'weights': dict(self.weights)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        subjects = (SubjectInfo(*row) for row in data['subjects'])
+        classes = (ClassInfo(*row) for row in data['classes'])
+        teachers = (TeacherInfo(*row) for row in data['teachers'])
+        time_slots = (SlotInfo(*row) for row in data['time_slots'])
+        stroked_groups = (
+            StrokedGroupInfo(g_id, name, level, tuple(subject_ids))
+            for g_id, name, level, subject_ids in data['stroked_groups']
+        )
+        return cls(
+            data['school_id'],
+            {s.id: s for s in subjects},
+            {c.id: c for c in classes},
+            {t.id: t for t in teachers},
+            [AssignmentInfo(*row) for row in data['assignments']],
+            {t.id: t for t in time_slots},
+            [tuple(p) for p in data['concurrent_pairs']],
+            {g.id: g for g in stroked_groups},
+            data.get('weights')
+        )
+
+    @classmethod
+    def load(cls, school_id):
+        """Load a school's data with one query per table"""
+        subjects = {}
+        for s in Subject.query.filter_by(school_id=school_id).order_by(Subject.id).all():
+            subjects[s.id] = SubjectInfo(
+                id=s.id,
+                name=s.name,
+                code=s.code,
+                max_lessons_per_week=s.max_lessons_per_week or 0,
+                double_lessons_per_week=s.double_lessons_per_week or 0,
+                offered_for=s.offered_for,
+                is_practical=s.name in PRACTICAL_SUBJECTS,
+                is_science=s.name in SCIENCE_SUBJECTS,
+                is_math_heavy=s.name in MATH_HEAVY_SUBJECTS,
+                lab=LAB_FOR_SUBJECT.get(s.name, 'general')
+            )
+
+        classes = {
+            c.id: ClassInfo(c.id, c.name, c.level, SLOT_LEVEL_FOR_CLASS_LEVEL.get(c.level))
+            for c in Class.query.filter_by(school_id=school_id).order_by(Class.id).all()
+        }
+
+        teachers = {
+            t.id: TeacherInfo(t.id, t.name, t.employee_id)
+            for t in Teacher.query.filter_by(school_id=school_id).order_by(Teacher.id).all()
+        }
+
+        assignments = [
+            AssignmentInfo(a.id, a.teacher_id, a.subject_id, a.class_id)
+            for a in SubjectAssignment.query.filter_by(school_id=school_id).order_by(SubjectAssignment.id).all()
+        ]
+
+        time_slots = {
+            t.id: SlotInfo(t.id, t.period, t.level, t.slot_type, t.start_time, t.end_time)
+            for t in TimeSlot.query.filter_by(school_id=school_id).all()
+        }
+
+        concurrent_pairs = {
+            (min(c.subject_id, c.concurrent_subject_id), max(c.subject_id, c.concurrent_subject_id))
+            for c in ConcurrentSubject.query.filter_by(school_id=school_id).all()
+        }
+
+        group_subject_ids = defaultdict(list)
+        rows = StrokedGroupSubject.query.join(
+            StrokedSubjectGroup, StrokedGroupSubject.group_id == StrokedSubjectGroup.id
+        ).filter(StrokedSubjectGroup.school_id == school_id).order_by(StrokedGroupSubject.id).all()
+        for gs in rows:
+            group_subject_ids[gs.group_id].append(gs.subject_id)
+        stroked_groups = {
+            g.id: StrokedGroupInfo(g.id, g.group_name, g.level, tuple(group_subject_ids[g.id]))
+            for g in StrokedSubjectGroup.query.filter_by(school_id=school_id).all()
+        }
+
+        school = School.query.get(school_id)
+        weights = school.soft_weights if school is not None else None
+
+        return cls(school_id, subjects, classes, teachers, assignments, time_slots,
+                   concurrent_pairs, stroked_groups, weights)
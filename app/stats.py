@@ -0,0 +1,139 @@
+import cProfile
+import io
+import pstats
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Hard-constraint rules in the order a candidate cell is checked against them; a
+# rejected cell is counted once, against the first rule it breaks
+HC_RULES = ('HC2.5', 'HC1.3', 'HC1.1', 'HC2.1', 'HC4', 'HC2.3')
+
+# Lines of cProfile output kept with a run
+PROFILE_LINES = 60
+
+
+class GenerationStats:
+    """Phase timings and allocation counters of one generation run"""
+
+    def __init__(self):
+        self.phases = {}  # phase -> seconds
+        self.counters = Counter()  # candidate_slots, no_feasible_slot, lessons_total, lessons_placed, ...
+        self.rejections = Counter()  # hard-constraint rule -> candidate cells rejected
+        self.profile = None  # cProfile report text, when profiling was requested
+        self.feasibility = []  # capacity violations found before allocation, as dicts
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block; repeated phases add up"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0) + seconds
+
+    def merge(self, other):
+        """Add another run's counters (e.g. from a worker process) - timings are kept"""
+        self.counters.update(other['counters'])
+        self.rejections.update(other['rejections'])
+
+    def to_dict(self):
+        return {
+            'phases': dict(self.phases),
+            'counters': dict(self.counters),
+            'rejections': dict(self.rejections),
+            'feasibility': list(self.feasibility)
+        }
+
+
+@contextmanager
+def profiled(stats, enabled=True):
+    """Run a block under cProfile and keep the top functions by cumulative time on ``stats``"""
+    if not enabled:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        stats.profile = out.getvalue()
+
+
+class RunTotals:
+    """Running totals over stored generation runs, for the metrics endpoint
+
+    Runs are added once each, in id order, so a scrape only reads the runs stored
+    since the previous one. Totals are per web worker process and start from zero
+    when it starts, which Prometheus treats as a counter reset.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()  # held while new runs are read and added
+        self.last_run_id = 0
+        self.run_counts = Counter()  # engine -> runs
+        self.phase_seconds = Counter()
+        self.phase_counts = Counter()
+        self.counters = Counter()
+        self.rejections = Counter()
+
+    def add(self, run_id, engine, stats):
+        self.last_run_id = max(self.last_run_id, run_id)
+        self.run_counts[engine] += 1
+        for phase, seconds in stats.get('phases', {}).items():
+            self.phase_seconds[phase] += seconds
+            self.phase_counts[phase] += 1
+        self.counters.update(stats.get('counters', {}))
+        self.rejections.update(stats.get('rejections', {}))
+
+
+def prometheus_text(totals, job_counts):
+    """Render generation metrics in the Prometheus text exposition format
+
+    ``totals`` is a RunTotals and ``job_counts`` maps job status -> number of jobs.
+    """
+    run_counts = totals.run_counts
+    phase_seconds = totals.phase_seconds
+    phase_counts = totals.phase_counts
+    counters = totals.counters
+    rejections = totals.rejections
+
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+    metric('timetable_generation_runs_total', 'counter', 'Finished timetable generation runs',
+           [((('engine', engine),), count) for engine, count in sorted(run_counts.items())])
+    lines.append('# HELP timetable_generation_phase_seconds Time spent in each generation phase')
+    lines.append('# TYPE timetable_generation_phase_seconds summary')
+    for phase in sorted(phase_seconds):
+        lines.append(f'timetable_generation_phase_seconds_sum{{phase="{phase}"}} {phase_seconds[phase]:.6f}')
+        lines.append(f'timetable_generation_phase_seconds_count{{phase="{phase}"}} {phase_counts[phase]}')
+    metric('timetable_generation_candidate_slots_total', 'counter', 'Feasible slots scored for lessons',
+           [((), counters['candidate_slots'])])
+    metric('timetable_generation_rejections_total', 'counter',
+           'Candidate cells rejected, by the first hard-constraint rule they break',
+           [((('rule', rule),), rejections[rule]) for rule in HC_RULES])
+    # Runs stored before the counter was renamed recorded the same event as 'fallbacks'
+    metric('timetable_generation_no_feasible_slot_total', 'counter',
+           'Lessons (or blocks) with no feasible slot left when the greedy pass reached them',
+           [((), counters['no_feasible_slot'] + counters['fallbacks'])])
+    metric('timetable_generation_lessons_placed_total', 'counter', 'Lessons placed',
+           [((), counters['lessons_placed'])])
+    metric('timetable_generation_lessons_unplaced_total', 'counter', 'Lessons left without a slot',
+           [((), counters['lessons_unplaced'])])
+    metric('timetable_generation_jobs', 'gauge', 'Generation jobs by status',
+           [((('status', status),), count) for status, count in sorted(job_counts.items())])
+    return '\n'.join(lines) + '\n'
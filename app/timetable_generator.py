@@ -1,47 +1,94 @@
 from app import db
-from app.models import (
-    School, Teacher, Class, Subject, TimeSlot, Lesson, Timetable,
-    SubjectAssignment, ConcurrentSubject, StrokedSubjectGroup, StrokedGroupSubject
+from app.models import School, Teacher, TimeSlot, Lesson, Timetable, SubjectAssignment, GenerationRun
+from app.snapshot import (
+    SchoolSnapshot, SCIENCE_SUBJECTS, MATH_HEAVY_SUBJECTS, PRACTICAL_SUBJECTS, LAB_FOR_SUBJECT
 )
+from app.occupancy import OccupancyGrid
+from app.stats import GenerationStats, profiled
+from app.local_search import LocalSearch, ITERATIONS_PER_UNIT
+from app.scoring import SlotScorer, resolve_weights
+from app.feasibility import find_violations
+from app.assignment import assign_teachers
+from app.lessons import LessonStore, UNPLACED
+from app.lattice import SlotLattice, DAYS
 from collections import defaultdict
+from sqlalchemy.orm import joinedload
+import heapq
+import math
 import random
+import time
+
+# Orders in which (class, subject) lesson groups are placed; 'most_constrained' re-orders
+# lesson by lesson as placements fill the grid
+LESSON_ORDERINGS = ('most_lessons', 'doubles_first', 'teacher_load', 'random', 'most_constrained')
 
 class TimetableGenerator:
-    def __init__(self, school_id):
+    engine = 'greedy'  # recorded on the GenerationRun
+    
+    def __init__(self, school_id, progress_callback=None, snapshot=None, seed=None,
+                 ordering='most_lessons', top_k=1, profile=False, local_search_seconds=0,
+                 local_search_iterations=None):
+        if ordering not in LESSON_ORDERINGS:
+            raise ValueError(f"Unknown lesson ordering: {ordering}")
         self.school_id = school_id
-        self.school = School.query.get(school_id)
-        self.lessons_needed = defaultdict(list)
+        self.progress_callback = progress_callback  # called as (lessons_placed, lessons_total)
+        # A preloaded snapshot lets the generator run without an app context (worker processes)
+        self.school = School.query.get(school_id) if snapshot is None else None
+        self.snapshot = snapshot  # SchoolSnapshot, built by _load_data
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.ordering = ordering
+        self.top_k = top_k  # each lesson takes one of its k best-scoring cells, picked by self.random
+        self.weights = resolve_weights()  # soft-constraint weights, the school's own once loaded
+        self.feasibility = []  # capacity violations found by check_feasibility
+        self.stats = GenerationStats()
+        self.profile = profile  # capture a cProfile report with the run stats
+        # Local-search improvement after the greedy pass (off when both are unset); the seconds
+        # cap it, and the iterations default to ITERATIONS_PER_UNIT per lesson or block
+        self.local_search_seconds = local_search_seconds
+        self.local_search_iterations = local_search_iterations
+        self.lessons = LessonStore()  # every required lesson and the cell it starts at
         self.assignments = defaultdict(list)
+        self.teacher_for = {}  # (class_id, subject_id) -> teacher chosen by _assign_teachers
         self.concurrent_subjects = set()
         self.stroked_subjects = set()
-        self.allocated_lessons = defaultdict(lambda: defaultdict(lambda: {}))  # class_id -> day -> period -> lesson
         
         # Tracking for constraints
         self.teacher_weekly_load = defaultdict(int)
-        self.teacher_daily_load = defaultdict(lambda: defaultdict(int))
         self.class_daily_subjects = defaultdict(lambda: defaultdict(set))
-        self.teacher_daily_schedule = defaultdict(lambda: defaultdict(set))  # teacher_id -> day -> period_ids
-        self.lab_usage = defaultdict(lambda: defaultdict(set))  # lab_type -> day -> periods
-        self.room_usage = defaultdict(lambda: defaultdict(set))
+        self.class_day_lessons = defaultdict(int)  # (class_id, day, subject_id) -> lessons placed
+        self.lattice = None  # SlotLattice: cell tables and static masks, built by _build_occupancy
+        self.occupancy = None  # OccupancyGrid: teacher/class/lab bitmasks, built by _build_occupancy
         
         # Subject categories for balancing
-        self.science_subjects = {'Physics', 'Chemistry', 'Biology'}
-        self.math_heavy = {'Mathematics', 'Physics', 'Chemistry'}
-        self.practical_subjects = {'Chemistry', 'Physics', 'Biology', 'Computer Science'}
+        self.science_subjects = SCIENCE_SUBJECTS
+        self.math_heavy = MATH_HEAVY_SUBJECTS
+        self.practical_subjects = PRACTICAL_SUBJECTS
         
         # Kenyan school schedule
-        self.days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-        self.assembly_period = 1  # Monday period 1
-        self.club_period = (3, 'Wednesday')  # Wednesday afternoon
-        self.games_period = (10, 'Friday')  # Friday last period
+        self.days = list(DAYS)  # assembly and club periods are in app/lattice.py
         
     def generate(self):
         """Generate timetable with comprehensive constraint handling"""
-        self._validate_hard_constraints_setup()
-        self._load_data()
-        self._create_lessons()
-        self._allocate_lessons()
-        timetable = self._save_timetable()
+        started = time.perf_counter()
+        with profiled(self.stats, self.profile):
+            with self.stats.phase('validate'):
+                self._validate_hard_constraints_setup()
+            with self.stats.phase('load_data'):
+                self._load_data()
+            with self.stats.phase('feasibility'):
+                self.check_feasibility()
+            with self.stats.phase('create_lessons'):
+                self._create_lessons()
+            with self.stats.phase('allocate_lessons'):
+                self._allocate_lessons()
+            if self.local_search_seconds or self.local_search_iterations:
+                with self.stats.phase('local_search'):
+                    self._improve_allocation()
+            self._record_placement()
+            with self.stats.phase('save_timetable'):
+                timetable = self._save_timetable()
+        self._save_run_stats(timetable, time.perf_counter() - started)
         return timetable
     
     def _validate_hard_constraints_setup(self):
@@ -58,64 +105,128 @@ class TimetableGenerator:
             raise ValueError("No time slots defined")
         
         # Check teacher load doesn't exceed max from start
+        assignments = SubjectAssignment.query.join(SubjectAssignment.teacher).filter(
+            Teacher.school_id == self.school_id
+        ).options(joinedload(SubjectAssignment.subject)).all()
+        weekly_loads = defaultdict(int)
+        for a in assignments:
+            weekly_loads[a.teacher_id] += a.subject.max_lessons_per_week
         for teacher in self.school.teachers:
-            assignments = SubjectAssignment.query.filter_by(teacher_id=teacher.id).all()
-            weekly_load = sum(a.subject.max_lessons_per_week for a in assignments)
+            weekly_load = weekly_loads[teacher.id]
             if weekly_load > 30:
                 raise ValueError(f"Teacher {teacher.name} exceeds max load (30): {weekly_load}")
     
     def _load_data(self):
-        """Load all school data"""
-        assignments = SubjectAssignment.query.filter_by(school_id=self.school_id).all()
-        for assignment in assignments:
-            self.assignments[assignment.subject_id].append(assignment.teacher_id)
-        
-        concurrent = ConcurrentSubject.query.filter_by(school_id=self.school_id).all()
-        for c in concurrent:
-            self.concurrent_subjects.add((min(c.subject_id, c.concurrent_subject_id),
-                                         max(c.subject_id, c.concurrent_subject_id)))
-        
-        stroked_groups = StrokedSubjectGroup.query.filter_by(school_id=self.school_id).all()
-        for group in stroked_groups:
-            group_subjects = StrokedGroupSubject.query.filter_by(group_id=group.id).all()
-            for gs in group_subjects:
-                self.stroked_subjects.add(gs.subject_id)
+        """Load all school data into an in-memory snapshot - no DB access after this"""
+        if self.snapshot is None:
+            self.snapshot = SchoolSnapshot.load(self.school_id)
+        self.weights = resolve_weights(self.snapshot.weights)
+        
+        for subject_id, teacher_ids in self.snapshot.teachers_by_subject.items():
+            self.assignments[subject_id].extend(teacher_ids)
+        
+        self.concurrent_subjects.update(self.snapshot.concurrent_pairs)
+        self.stroked_subjects.update(self.snapshot.stroked_subject_ids)
+    
+    def check_feasibility(self):
+        """Capacity bounds the school's data breaks (see app/feasibility.py), loading the data if needed
+        
+        Violations don't stop generation - the lessons they cover are left unplaced - but
+        they are recorded on the run stats so the cause is known before any solver runs.
+        """
+        if self.snapshot is None:
+            self._load_data()
+        self._build_occupancy()
+        self.feasibility = find_violations(self)
+        self.stats.feasibility = [violation._asdict() for violation in self.feasibility]
+        self.stats.counters['feasibility_violations'] = len(self.feasibility)
+        return self.feasibility
     
     def _create_lessons(self):
         """Create required lessons for each class-subject"""
-        for class_obj in self.school.classes:
-            for subject in self.school.subjects:
-                if not self._is_subject_offered_for_class(subject, class_obj):
-                    continue
-                
-                teacher_ids = self.assignments.get(subject.id, [])
-                if not teacher_ids:
+        self._assign_teachers([
+            (class_obj.id, subject.id)
+            for class_obj in self.snapshot.classes.values()
+            for subject in self.snapshot.subjects.values()
+            if self._is_subject_offered_for_class(subject, class_obj)
+        ])
+        for class_obj in self.snapshot.classes.values():
+            for subject in self.snapshot.subjects.values():
+                self._create_lessons_for(class_obj, subject)
+        self._form_blocks()
+    
+    def _assign_teachers(self, pairs, load=None):
+        """Choose the teacher of each (class, subject) pair before any placement (see app/assignment.py)
+        
+        The choice follows the per-class SubjectAssignment rows and balances weekly load,
+        so no teacher is pushed toward the load cap while colleagues of the same subject
+        have room.
+        """
+        chosen, moves = assign_teachers(self.snapshot, pairs, self.random, load)
+        self.teacher_for.update(chosen)
+        self.stats.counters['assignment_moves'] += moves
+    
+    def _form_blocks(self, exclude=()):
+        """Join lessons of concurrent subjects into blocks taught to a class at the same time
+        
+        Subjects linked by concurrency pairs (stroked groups add them) form a group. For
+        every class, the k-th double (and k-th single) lesson of each subject in the group
+        becomes one block, placed in one operation with every teacher busy at once. A
+        member is left out when it would share a teacher or lab with one already in the
+        block. Lessons in ``exclude`` stay separate.
+        """
+        store = self.lessons
+        blocks = 0
+        for class_id in self.snapshot.classes:
+            for group in self.snapshot.concurrent_groups:
+                options = []
+                for subject_id in group:
+                    lessons = [l for l in store.groups.get((class_id, subject_id), ()) if l not in exclude]
+                    if lessons:
+                        options.append(lessons)
+                if len(options) < 2:
                     continue
                 
-                teacher_id = random.choice(teacher_ids)
-                
-                # HC2.3: Respect double lesson requirements
-                num_lessons = subject.max_lessons_per_week
-                num_double_lessons = subject.double_lessons_per_week
-                num_single_lessons = num_lessons - (num_double_lessons * 2)
-                
-                for _ in range(num_double_lessons):
-                    self.lessons_needed[(class_obj.id, subject.id)].append({
-                        'class_id': class_obj.id,
-                        'subject_id': subject.id,
-                        'teacher_id': teacher_id,
-                        'is_double': True,
-                        'is_practical': subject.name in self.practical_subjects
-                    })
-                
-                for _ in range(num_single_lessons):
-                    self.lessons_needed[(class_obj.id, subject.id)].append({
-                        'class_id': class_obj.id,
-                        'subject_id': subject.id,
-                        'teacher_id': teacher_id,
-                        'is_double': False,
-                        'is_practical': subject.name in self.practical_subjects
-                    })
+                for is_double in (1, 0):
+                    columns = [[l for l in lessons if store.doubles[l] == is_double] for lessons in options]
+                    for k in range(max(len(column) for column in columns)):
+                        members, resources = [], set()
+                        for column in columns:
+                            if k >= len(column):
+                                continue
+                            lesson = column[k]
+                            lesson_resources = {('teacher', store.teacher_ids[lesson])}
+                            if store.practicals[lesson]:
+                                lesson_resources.add(('lab', self.snapshot.subjects[store.subject_ids[lesson]].lab))
+                            if resources & lesson_resources:
+                                continue
+                            resources |= lesson_resources
+                            members.append(lesson)
+                        if len(members) > 1:
+                            store.join(members)
+                            blocks += 1
+        self.stats.counters['blocks'] += blocks
+    
+    def _create_lessons_for(self, class_obj, subject, teacher_id=None):
+        """Add one class-subject's lessons to the lesson store (the teacher from _assign_teachers unless given)"""
+        if not self._is_subject_offered_for_class(subject, class_obj):
+            return
+        
+        if teacher_id is None:
+            teacher_id = self.teacher_for.get((class_obj.id, subject.id))
+        if teacher_id is None:
+            return
+        
+        # HC2.3: Respect double lesson requirements
+        num_lessons = subject.max_lessons_per_week
+        num_double_lessons = subject.double_lessons_per_week
+        num_single_lessons = num_lessons - (num_double_lessons * 2)
+        
+        for _ in range(num_double_lessons):
+            self.lessons.add(class_obj.id, subject.id, teacher_id, True, subject.is_practical)
+        
+        for _ in range(num_single_lessons):
+            self.lessons.add(class_obj.id, subject.id, teacher_id, False, subject.is_practical)
     
     def _is_subject_offered_for_class(self, subject, class_obj):
         """Check if subject is offered for class level"""
@@ -129,234 +240,428 @@ class TimetableGenerator:
     
     def _allocate_lessons(self):
         """Allocate lessons respecting hard constraints with soft optimization"""
+        self._build_occupancy()
+        self._place_lessons(self._order_lessons())
+    
+    def _place_lessons(self, sorted_lessons):
+        """Greedily place (class, subject) lesson groups around whatever is already occupied
+        
+        Groups are placed in the given order; with the 'most_constrained' ordering,
+        lessons are instead taken one at a time by fewest feasible cells left.
+        """
         time_slots_by_level = self._get_time_slots_by_level()
         class_to_slot_level = self._map_classes_to_slot_levels()
-        
-        # Sort by difficulty: prioritize subjects with many required lessons
-        sorted_lessons = sorted(
-            self.lessons_needed.items(),
-            key=lambda x: len(x[1]),
-            reverse=True
-        )
-        
+        store = self.lessons
+        units = []
         for (class_id, subject_id), lessons_list in sorted_lessons:
-            class_obj = Class.query.get(class_id)
-            subject = Subject.query.get(subject_id)
-            slot_level = class_to_slot_level.get(class_id)
-            time_slots = time_slots_by_level.get(slot_level, [])
-            
-            if not time_slots:
-                raise ValueError(f"No time slots for {class_obj.level}")
-            
-            # Allocate each lesson
-            for lesson in lessons_list:
-                allocated = False
-                
-                # Try to find best slot respecting hard constraints
-                slots_by_score = []
-                for slot in time_slots:
-                    if self._check_hard_constraints(class_id, subject_id, lesson['teacher_id'], slot, lesson['is_double']):
-                        # HC2: No lesson during break/lunch
-                        if slot.slot_type == 'lesson':
-                            score = self._calculate_soft_constraint_score(
-                                class_id, subject_id, lesson['teacher_id'], slot, subject, lesson
-                            )
-                            slots_by_score.append((slot, score))
-                
-                # Sort by score (higher is better) and try best options
-                slots_by_score.sort(key=lambda x: x[1], reverse=True)
-                
-                for slot, score in slots_by_score[:5]:  # Try top 5 options
-                    if self._allocate_to_slot(class_id, subject_id, lesson, slot):
-                        allocated = True
-                        break
-                
-                # Fallback: allocate to any valid slot
-                if not allocated:
-                    for slot in time_slots:
-                        if (slot.slot_type == 'lesson' and 
-                            self._check_hard_constraints(class_id, subject_id, lesson['teacher_id'], slot, lesson['is_double'])):
-                            if self._allocate_to_slot(class_id, subject_id, lesson, slot):
-                                allocated = True
-                                break
-    
-    def _check_hard_constraints(self, class_id, subject_id, teacher_id, time_slot, is_double):
-        """Check all hard constraints - return False if ANY violated"""
-        
-        # HC1.1: Teacher cannot teach two classes at same time
-        day = self._get_day_for_slot(time_slot)
-        period = time_slot.period
-        
-        if period in self.teacher_daily_schedule[teacher_id][day]:
-            return False
-        
-        # HC2.1: Stream cannot have two subjects in one period
-        if self.allocated_lessons[class_id][day].get(period) is not None:
-            return False
-        
-        # HC2.4: No lesson during break or lunch
-        if time_slot.slot_type != 'lesson':
+            if not time_slots_by_level.get(class_to_slot_level.get(class_id), []):
+                raise ValueError(f"No time slots for {self.snapshot.classes[class_id].level}")
+            # Block members go with their lead
+            units.extend(lesson for lesson in lessons_list if store.is_lead(lesson))
+        
+        # Progress covers every lesson, including those placed before this pass
+        lessons_total = len(store)
+        lessons_placed = lessons_total - store.unplaced_count()
+        self._report_progress(lessons_placed, lessons_total)
+        scorer = SlotScorer(self)
+        if self.ordering == 'most_constrained':
+            units = self._most_constrained_first(units)
+        
+        for lesson in units:
+            if self._place_unit(lesson, scorer):
+                lessons_placed += len(store.members(lesson))
+                self._report_progress(lessons_placed, lessons_total)
+    
+    def _place_unit(self, lesson, scorer):
+        """Place one lesson (or block) at one of its k best-scoring feasible cells; False when none is free
+        
+        With ``top_k`` above 1 the cell is a seeded pick weighted by rank (the best
+        cell is k times as likely as the k-th), so runs with different seeds differ.
+        """
+        counters = self.stats.counters
+        slot_level = self.snapshot.classes[self.lessons.class_ids[lesson]].slot_level
+        
+        # All cells respecting hard constraints, from one mask operation
+        mask = self._unit_mask(lesson, slot_level, self.stats.rejections)
+        scoring_started = time.perf_counter()
+        # Score every feasible cell at once and keep the best k options (higher is better)
+        ranked, feasible = scorer.rank(lesson, mask, self.top_k)
+        self.stats.add_time('slot_scoring', time.perf_counter() - scoring_started)
+        counters['candidate_slots'] += feasible
+        
+        if not ranked:
+            counters['no_feasible_slot'] += 1
             return False
+        if len(ranked) == 1:
+            bit = ranked[0]
+        else:
+            bit = self.random.choices(ranked, weights=range(len(ranked), 0, -1))[0]
+        return self._allocate_unit(lesson, bit)
+    
+    def _most_constrained_first(self, units):
+        """Yield units fewest feasible start cells first (DSatur), re-keying them as placements land
+        
+        Unplaced units sit in a heap keyed by their feasible cell count. A placement only
+        shrinks the cells of units sharing its class, a teacher or a lab, so only those
+        are re-counted - once per set of identical units (same class, length, teachers
+        and labs) - and outdated heap entries are skipped when popped. Ties keep the
+        order of ``units``.
+        """
+        store = self.lessons
+        classes = self.snapshot.classes
+        twins = defaultdict(list)  # (length, resources) -> units with the same feasible cells
+        twin_key = {}
+        users = defaultdict(set)  # ('class' | 'teacher' | 'lab', id) -> twin keys using it
+        for lesson in units:
+            resources = tuple(self._unit_resources(lesson))
+            twin_key[lesson] = (store.length(lesson), resources)
+            twins[twin_key[lesson]].append(lesson)
+            for resource in resources:
+                users[resource].add(twin_key[lesson])
+        
+        position = {lesson: i for i, lesson in enumerate(units)}
+        cells_left = {}
+        heap = []
+        for lessons in twins.values():
+            first = lessons[0]
+            count = OccupancyGrid.popcount(self._unit_mask(first, classes[store.class_ids[first]].slot_level))
+            for lesson in lessons:
+                cells_left[lesson] = count
+                heap.append((count, position[lesson], lesson))
+        heapq.heapify(heap)
+        
+        rekeyed = 0
+        while heap:
+            count, _, lesson = heapq.heappop(heap)
+            if cells_left.get(lesson) != count:
+                continue  # placed already, or re-keyed since
+            del cells_left[lesson]
+            _, resources = twin_key[lesson]
+            twins[twin_key[lesson]].remove(lesson)
+            yield lesson
+            
+            for key in set().union(*(users[resource] for resource in resources)):
+                others = twins[key]
+                if not others:
+                    continue
+                first = others[0]
+                count = OccupancyGrid.popcount(self._unit_mask(first, classes[store.class_ids[first]].slot_level))
+                if count != cells_left[first]:
+                    for other in others:
+                        cells_left[other] = count
+                        heapq.heappush(heap, (count, position[other], other))
+                    rekeyed += len(others)
+        self.stats.counters['lessons_rekeyed'] += rekeyed
+    
+    def _unit_resources(self, lesson):
+        """Class, teachers and labs a lesson (or block) holds while placed"""
+        store = self.lessons
+        resources = [('class', store.class_ids[lesson])]
+        for member in store.members(lesson):
+            resources.append(('teacher', store.teacher_ids[member]))
+            if store.practicals[member]:
+                resources.append(('lab', self.snapshot.subjects[store.subject_ids[member]].lab))
+        return resources
+    
+    def _order_lessons(self, items=None):
+        """(class, subject) lesson id groups in the order they should be placed (all groups by default)"""
+        items = list(self.lessons.groups.items() if items is None else items)
+        store = self.lessons
+        
+        if self.ordering == 'random':
+            self.random.shuffle(items)
+            return items
+        
+        if self.ordering == 'doubles_first':
+            # Doubles need two consecutive free cells, so place them while the grid is empty
+            key = lambda x: (sum(store.doubles[l] for l in x[1]), len(x[1]))
+        elif self.ordering == 'teacher_load':
+            # Busiest teachers first - they have the fewest free cells
+            demand = defaultdict(int)
+            for lesson in range(len(store)):
+                demand[store.teacher_ids[lesson]] += store.length(lesson)
+            key = lambda x: (demand[store.teacher_ids[x[1][0]]], len(x[1]))
+        else:
+            # Sort by difficulty: prioritize subjects with many required lessons
+            key = lambda x: len(x[1])
         
-        # HC2.5: Assembly period locked (Monday Period 1)
-        if day == 'Monday' and period == 1:
-            return False
+        return sorted(items, key=key, reverse=True)
+    
+    def _report_progress(self, lessons_placed, lessons_total):
+        if self.progress_callback:
+            self.progress_callback(lessons_placed, lessons_total)
+    
+    def _build_occupancy(self):
+        """Lay out the slot lattice (every day x period cell) and an empty occupancy grid over it
+        
+        HC2.5 (assembly, clubs) and HC2.3 (doubles in consecutive periods of one day) are
+        static masks of the lattice, built once per run.
+        """
+        if self.lattice is None:
+            self.lattice = SlotLattice(self.snapshot.time_slots.values(), self.days)
+        lattice = self.lattice
+        self.occupancy = OccupancyGrid(lattice.days, lattice.periods_per_day)
+        self.slots_by_bit = lattice.slots_by_bit
+        self.open_masks = lattice.open_masks
+        self.double_start_masks = lattice.double_start_masks
+    
+    def _feasible_mask(self, class_id, subject_id, teacher_id, slot_level, is_double, rejections=None):
+        """Bitmask of start cells where the lesson can go without breaking any hard constraint
         
-        # HC2.5: Wednesday afternoon reserved for clubs
-        if day == 'Wednesday' and period >= 7:
-            return False
+        When a ``rejections`` Counter is given, every lesson slot of the level that is
+        ruled out is counted against the first rule it breaks (see stats.HC_RULES).
+        """
+        length = 2 if is_double else 1
+        open_mask = self.open_masks.get(slot_level, 0)
+        if rejections is not None:
+            rejections['HC2.5'] += len(self.slots_by_bit.get(slot_level, ())) - OccupancyGrid.popcount(open_mask)
         
         # HC1.3: Teacher cannot exceed load
-        if self.teacher_weekly_load[teacher_id] >= 30:
-            return False
-        
-        # HC2.3: Double lesson must be consecutive
-        if is_double and period == 10:  # Last period can't start double
-            return False
-        
-        # HC4: Lab constraints - one class at a time per lab
-        subject = Subject.query.get(subject_id)
-        if subject.name in self.practical_subjects:
-            lab_type = self._get_lab_for_subject(subject.name)
-            if period in self.lab_usage[lab_type][day]:
-                return False
-        
-        return True
+        if self.teacher_weekly_load[teacher_id] + length > 30:
+            if rejections is not None:
+                rejections['HC1.3'] += OccupancyGrid.popcount(open_mask)
+            return 0
+        
+        # HC1.1 / HC2.1 / HC4: teacher, stream and lab each hold one lesson per cell
+        subject = self.snapshot.subjects[subject_id]
+        lab = subject.lab if subject.is_practical else None
+        free = open_mask & ~self.occupancy.busy(teacher_id, class_id, lab)
+        if rejections is not None:
+            teacher_busy = open_mask & self.occupancy.teachers[teacher_id]
+            class_busy = open_mask & self.occupancy.classes[class_id] & ~teacher_busy
+            rejections['HC1.1'] += OccupancyGrid.popcount(teacher_busy)
+            rejections['HC2.1'] += OccupancyGrid.popcount(class_busy)
+            rejections['HC4'] += OccupancyGrid.popcount(open_mask & ~free & ~teacher_busy & ~class_busy)
+        
+        # HC2.3: Double lesson needs this cell and the next one free
+        if is_double:
+            starts = free & (free >> 1) & self.double_start_masks[slot_level]
+            if rejections is not None:
+                rejections['HC2.3'] += OccupancyGrid.popcount(free & ~starts)
+            free = starts
+        return free
+    
+    def _unit_mask(self, lesson, slot_level, rejections=None):
+        """Start cells free for a lesson and, for a block lead, every member of its block at once"""
+        store = self.lessons
+        mask = self._feasible_mask(
+            store.class_ids[lesson], store.subject_ids[lesson], store.teacher_ids[lesson], slot_level,
+            store.doubles[lesson], rejections
+        )
+        for member in store.blocks.get(lesson, ())[1:]:
+            if not mask:
+                break
+            mask &= self._feasible_mask(
+                store.class_ids[member], store.subject_ids[member], store.teacher_ids[member], slot_level,
+                store.doubles[member]
+            )
+        return mask
     
-    def _calculate_soft_constraint_score(self, class_id, subject_id, teacher_id, time_slot, subject, lesson):
-        """Calculate quality score for this allocation"""
+    def _calculate_soft_constraint_score(self, class_id, subject_id, teacher_id, bit, subject, lesson):
+        """Calculate quality score for this allocation (reference for SlotScorer, which scores all cells at once)"""
+        weights = self.weights
         score = 0
-        day = self._get_day_for_slot(time_slot)
-        period = time_slot.period
+        day, period = self.occupancy.cell(bit)
+        last_mask = self.lattice.last_masks[self.snapshot.classes[class_id].slot_level]
         
         # SP1.1: Math preferably in morning (periods 1-4)
         if subject.name == 'Mathematics' and period <= 4:
-            score += 10
+            score += weights['math_morning']
         
         # SP1.2: Sciences not all in one day
-        if subject.name in self.science_subjects:
+        if subject.is_science:
             science_count = len([s for s in self.class_daily_subjects[class_id][day] 
-                               if Subject.query.get(s).name in self.science_subjects])
+                               if self.snapshot.subjects[s].is_science])
             if science_count < 2:
-                score += 5
+                score += weights['science_spread']
         
         # SP1.3: Avoid repeating subject same day
         if subject_id not in self.class_daily_subjects[class_id][day]:
-            score += 5
+            score += weights['subject_variety']
         
         # SP2.1: Avoid teacher gaps
-        if day in self.teacher_daily_schedule[teacher_id]:
-            periods_taught = sorted(self.teacher_daily_schedule[teacher_id][day])
-            if periods_taught and (period == periods_taught[-1] + 1 or period == periods_taught[-1] - 1):
-                score += 8
+        taught = self.occupancy.day_row(self.occupancy.teachers[teacher_id], day)
+        if taught:
+            last_period = taught.bit_length()
+            if period == last_period + 1 or period == last_period - 1:
+                score += weights['teacher_adjacent']
         
         # SP3.1: Avoid heavy subjects last period
-        if period != 10 and subject.name in self.math_heavy:
-            score += 3
+        if not last_mask >> bit & 1 and subject.is_math_heavy:
+            score += weights['heavy_not_last']
         
         return score
     
-    def _allocate_to_slot(self, class_id, subject_id, lesson, time_slot):
-        """Attempt to allocate lesson to slot"""
-        day = self._get_day_for_slot(time_slot)
-        period = time_slot.period
-        
-        # Allocate single lesson
-        self.allocated_lessons[class_id][day][period] = lesson
-        self.teacher_daily_schedule[lesson['teacher_id']][day].add(period)
-        self.teacher_weekly_load[lesson['teacher_id']] += 1
+    def _allocate_to_slot(self, lesson, bit):
+        """Place a lesson (id in the lesson store) at a start cell returned by _feasible_mask"""
+        store = self.lessons
+        class_id, subject_id, teacher_id = store.class_ids[lesson], store.subject_ids[lesson], store.teacher_ids[lesson]
+        day, _ = self.occupancy.cell(bit)
+        length = store.length(lesson)
+        
+        store.starts[lesson] = bit
+        self.teacher_weekly_load[teacher_id] += length
+        self.class_day_lessons[(class_id, day, subject_id)] += 1
         self.class_daily_subjects[class_id][day].add(subject_id)
         
-        # If double lesson, also allocate next period
-        if lesson['is_double']:
-            if period + 1 in self.allocated_lessons[class_id][day]:
-                return False  # Failed - next period occupied
-            
-            lesson_copy = lesson.copy()
-            self.allocated_lessons[class_id][day][period + 1] = lesson_copy
-            self.teacher_daily_schedule[lesson['teacher_id']][day].add(period + 1)
-            self.teacher_weekly_load[lesson['teacher_id']] += 1
-        
-        lesson['time_slot_id'] = time_slot.id
-        lesson['day'] = day
-        
-        # Update lab usage if practical
-        if lesson['is_practical']:
-            subject = Subject.query.get(subject_id)
-            lab = self._get_lab_for_subject(subject.name)
-            self.lab_usage[lab][day].add(period)
-            if lesson['is_double']:
-                self.lab_usage[lab][day].add(period + 1)
+        # Mark teacher, stream and (if practical) lab busy - a double covers this cell and the next
+        lab = self.snapshot.subjects[subject_id].lab if store.practicals[lesson] else None
+        self.occupancy.occupy(((1 << length) - 1) << bit, teacher_id, class_id, lab)
         
         return True
     
-    def _get_time_slots_by_level(self):
-        """Get time slots organized by level"""
-        result = {}
+    def _allocate_unit(self, lesson, bit):
+        """Place a lesson, or a block lead with all its members, at a start cell from _unit_mask"""
+        for member in self.lessons.members(lesson):
+            self._allocate_to_slot(member, bit)
+        return True
+    
+    def _release_unit(self, lesson):
+        """Undo _allocate_unit - block members share the class cell, so they are released together"""
+        for member in self.lessons.members(lesson):
+            self._release_lesson(member)
+    
+    def _release_lesson(self, lesson):
+        """Undo _allocate_to_slot for a placed lesson"""
+        store = self.lessons
+        class_id, subject_id, teacher_id = store.class_ids[lesson], store.subject_ids[lesson], store.teacher_ids[lesson]
+        bit = store.starts[lesson]
+        day, _ = self.occupancy.cell(bit)
+        length = store.length(lesson)
+        
+        store.starts[lesson] = UNPLACED
+        self.teacher_weekly_load[teacher_id] -= length
+        key = (class_id, day, subject_id)
+        self.class_day_lessons[key] -= 1
+        if not self.class_day_lessons[key]:
+            self.class_daily_subjects[class_id][day].discard(subject_id)
+        
+        lab = self.snapshot.subjects[subject_id].lab if store.practicals[lesson] else None
+        self.occupancy.release(((1 << length) - 1) << bit, teacher_id, class_id, lab)
+    
+    def _improve_allocation(self):
+        """Repair unplaced lessons and raise the soft score by local search (see app/local_search.py)"""
+        search = LocalSearch(
+            self,
+            seed=self.seed,
+            time_limit=self.local_search_seconds or math.inf,
+            max_iterations=self.local_search_iterations or ITERATIONS_PER_UNIT * len(self.lessons.units())
+        )
+        self.stats.counters.update(search.run())
+    
+    def _reset_allocation(self):
+        """Clear all placements so the lessons can be allocated again"""
+        self.lessons.clear_placement()
+        self.teacher_weekly_load = defaultdict(int)
+        self.class_daily_subjects = defaultdict(lambda: defaultdict(set))
+        self.class_day_lessons = defaultdict(int)
+        self._build_occupancy()
+    
+    def _record_placement(self):
+        """Store lesson totals of the finished allocation on the run stats"""
+        lessons_total = len(self.lessons)
+        unplaced = self._unplaced_count()
+        self.stats.counters['lessons_total'] = lessons_total
+        self.stats.counters['lessons_placed'] = lessons_total - unplaced
+        self.stats.counters['lessons_unplaced'] = unplaced
+    
+    def _unplaced_count(self):
+        """Number of required lessons that did not get a slot"""
+        return self.lessons.unplaced_count()
+    
+    def _allocation_soft_score(self):
+        """Soft-constraint score of the finished allocation (higher is better), for any engine"""
+        weights = self.weights
+        store = self.lessons
+        score = 0
+        subjects_by_day = defaultdict(set)  # (class_id, day) -> subjects taught
+        teacher_periods = defaultdict(set)  # (teacher_id, day) -> periods
+        
+        for lesson in store.placed():
+            subject = self.snapshot.subjects[store.subject_ids[lesson]]
+            last_mask = self.lattice.last_masks[self.snapshot.classes[store.class_ids[lesson]].slot_level]
+            start = store.starts[lesson]
+            for bit in range(start, start + store.length(lesson)):
+                day, period = self.occupancy.cell(bit)
+                teacher_periods[(store.teacher_ids[lesson], day)].add(period)
+                
+                # SP1.1: Math preferably in morning (periods 1-4)
+                if subject.name == 'Mathematics' and period <= 4:
+                    score += weights['math_morning']
+                # SP3.1: Avoid heavy subjects last period
+                if not last_mask >> bit & 1 and subject.is_math_heavy:
+                    score += weights['heavy_not_last']
+            subjects_by_day[(store.class_ids[lesson], day)].add(subject.id)
+        
+        for subject_ids in subjects_by_day.values():
+            # SP1.3: Avoid repeating subject same day
+            score += weights['subject_variety'] * len(subject_ids)
+            # SP1.2: Sciences not all in one day (up to two count)
+            sciences = sum(1 for subject_id in subject_ids if self.snapshot.subjects[subject_id].is_science)
+            score += weights['science_spread'] * min(sciences, 2)
         
-        for level, level_code in [('Grade 10', 'grade10-12'), ('Form 3', 'form3-4'), ('Form 4', 'form3-4')]:
-            slots = TimeSlot.query.filter_by(
-                school_id=self.school_id,
-                level=level_code,
-                slot_type='lesson'
-            ).order_by(TimeSlot.period).all()
-            result[level_code] = slots
+        # SP2.1: Avoid teacher gaps
+        for periods in teacher_periods.values():
+            score += weights['teacher_adjacent'] * sum(1 for period in periods if period + 1 in periods)
         
-        return result
+        return score
+    
+    def _get_time_slots_by_level(self):
+        """Get lesson time slots organized by level"""
+        return self.snapshot.lesson_slots_by_level
     
     def _map_classes_to_slot_levels(self):
         """Map class to appropriate time slot level"""
-        mapping = {}
-        for class_obj in self.school.classes:
-            if class_obj.level in ['Grade 10', 'Grade 11', 'Grade 12']:
-                mapping[class_obj.id] = 'grade10-12'
-            elif class_obj.level in ['Form 3', 'Form 4']:
-                mapping[class_obj.id] = 'form3-4'
-        return mapping
-    
-    def _get_day_for_slot(self, time_slot):
-        """Determine day from time slot"""
-        period = time_slot.period
-        if period <= 2:
-            return 'Monday'
-        elif period <= 4:
-            return 'Tuesday'
-        elif period <= 6:
-            return 'Wednesday'
-        elif period <= 8:
-            return 'Thursday'
-        else:
-            return 'Friday'
+        return {c.id: c.slot_level for c in self.snapshot.classes.values() if c.slot_level}
     
     def _get_lab_for_subject(self, subject_name):
         """Get lab type for subject"""
-        lab_map = {
-            'Chemistry': 'chem_lab',
-            'Physics': 'physics_lab',
-            'Biology': 'bio_lab',
-            'Computer Science': 'computer_lab'
-        }
-        return lab_map.get(subject_name, 'general')
+        return LAB_FOR_SUBJECT.get(subject_name, 'general')
     
     def _save_timetable(self):
-        """Save timetable to database"""
+        """Save timetable to database - all lessons go in one executemany insert (a double is two rows)"""
         timetable = Timetable(school_id=self.school_id, is_active=True)
         db.session.add(timetable)
         db.session.flush()
         
-        for class_id, days_dict in self.allocated_lessons.items():
-            for day, periods_dict in days_dict.items():
-                for period, lesson_data in periods_dict.items():
-                    lesson = Lesson(
-                        school_id=self.school_id,
-                        class_id=lesson_data['class_id'],
-                        subject_id=lesson_data['subject_id'],
-                        teacher_id=lesson_data['teacher_id'],
-                        time_slot_id=lesson_data.get('time_slot_id'),
-                        timetable_id=timetable.id,
-                        is_double_lesson=lesson_data['is_double']
-                    )
-                    db.session.add(lesson)
+        store = self.lessons
+        rows = []
+        for lesson in store.placed():
+            class_id = store.class_ids[lesson]
+            slots_by_bit = self.slots_by_bit[self.snapshot.classes[class_id].slot_level]
+            start = store.starts[lesson]
+            for bit in range(start, start + store.length(lesson)):
+                day, _ = self.occupancy.cell(bit)
+                rows.append({
+                    'school_id': self.school_id,
+                    'class_id': class_id,
+                    'subject_id': store.subject_ids[lesson],
+                    'teacher_id': store.teacher_ids[lesson],
+                    'time_slot_id': slots_by_bit[bit].id,
+                    'day': day,
+                    'timetable_id': timetable.id,
+                    'is_double_lesson': bool(store.doubles[lesson])
+                })
+        if rows:
+            db.session.execute(Lesson.__table__.insert(), rows)
         
         db.session.commit()
         return timetable
+    
+    def _save_run_stats(self, timetable, total_seconds):
+        """Store the run's timings, counters and input snapshot next to the timetable"""
+        counters = self.stats.counters
+        run = GenerationRun(
+            timetable_id=timetable.id,
+            school_id=self.school_id,
+            engine=self.engine,
+            total_seconds=total_seconds,
+            lessons_total=counters['lessons_total'],
+            lessons_placed=counters['lessons_placed'],
+            stats=self.stats.to_dict(),
+            snapshot=self.snapshot.to_dict() if self.snapshot is not None else None,
+            profile=self.stats.profile
+        )
+        db.session.add(run)
+        db.session.commit()
+        return run
@@ -1,47 +1,339 @@
-from ortools.sat.python import cp_model
-
-class TimetableGenerator:
-    def __init__(self, num_classes, num_slots, num_teachers):
-        self.num_classes = num_classes
-        self.num_slots = num_slots
-        self.num_teachers = num_teachers
-        self.model = cp_model.CpModel()
-        self.schedule = []
-
-    def create_variables(self):
-        for i in range(self.num_classes):
-            self.schedule.append([])
-            for j in range(self.num_slots):
-                # Create a binary variable for each class at each slot
-                self.schedule[i].append(self.model.NewBoolVar(f'class_{i}_slot_{j}'))
-
-    def add_constraints(self):
-        # Constraints to ensure that each class is scheduled in exactly one slot
-        for i in range(self.num_classes):
-            self.model.Add(sum(self.schedule[i]) == 1)
-
-        # Additional constraints can be added here based on school rules
-
-    def solve(self):
+from collections import defaultdict
+
+from app.lattice import lesson_day
+from app.lessons import UNPLACED
+from app.models import Lesson, Timetable
+from app.occupancy import OccupancyGrid
+from app.timetable_generator import TimetableGenerator
+
+try:
+    from ortools.sat.python import cp_model
+except ImportError:  # optional dependency - only needed for the CP-SAT engine
+    cp_model = None
+
+# Objective weight of one placed lesson; keeps placement ahead of any soft preference
+PLACED_LESSON_WEIGHT = 1000
+# Bonus for keeping a lesson where the previous active timetable had it
+STABILITY_BONUS = 20
+
+# Where solution hints come from: a greedy pass, the active timetable, or nothing
+HINT_SOURCES = ('greedy', 'active', None)
+
+
+class CPSATTimetableGenerator(TimetableGenerator):
+    """Exact timetable engine built on OR-Tools CP-SAT.
+
+    Uses the same snapshot, lessons and masks as the greedy generator but places all
+    lessons in one model, so lessons the greedy pass would drop still get a slot when
+    one exists. Every lesson (a block of concurrent lessons counts as one, holding
+    all its teachers) gets one bool per feasible start cell and:
+
+    - HC1.1 / HC2.1 / HC4: at most one lesson per teacher, class and lab in a cell
+    - HC2.3: doubles only start where the next period on the same day is open
+    - HC2.5: assembly and club periods are never offered (open masks)
+    - HC1.3: teacher weekly load <= 30 periods
+
+    The search is warm-started from ``hint``: ``'greedy'`` runs the greedy pass first,
+    ``'active'`` reuses the school's active timetable so a re-solve after a small edit
+    is fast and stays close to what was published.
+    """
+
+    engine = 'cpsat'
+
+    def __init__(self, school_id, time_limit=60, num_workers=8, hint='greedy', **kwargs):
+        if cp_model is None:
+            raise RuntimeError("The CP-SAT engine requires the 'ortools' package")
+        if hint not in HINT_SOURCES:
+            raise ValueError(f"Unknown hint source: {hint}")
+        super().__init__(school_id, **kwargs)
+        self.time_limit = time_limit
+        self.num_workers = num_workers
+        self.hint = hint
+        self.previous_lessons = []
+        self.solver_status = None
+        self.unplaced_lessons = 0
+        self.hints_given = 0
+        self.hints_kept = 0
+
+    def _load_data(self):
+        """Load the snapshot, plus the active timetable's lessons when warm-starting from it"""
+        super()._load_data()
+        if self.hint != 'active':
+            return
+        
+        timetable = Timetable.query.filter_by(school_id=self.school_id, is_active=True).order_by(
+            Timetable.generated_at.desc(), Timetable.id.desc()
+        ).first()
+        if timetable:
+            self.previous_lessons = [
+                (l.class_id, l.subject_id, l.time_slot_id, l.day, bool(l.is_double_lesson))
+                for l in Lesson.query.filter_by(timetable_id=timetable.id).order_by(Lesson.id).all()
+            ]
+
+    def _allocate_lessons(self):
+        """Build and solve the CP-SAT model, then apply the solution"""
+        lessons = self._ordered_lessons()
+        if self.hint == 'greedy':
+            with self.stats.phase('greedy_hint'):
+                super()._allocate_lessons()
+                hints = self._hints_from_allocation(lessons)
+                self._reset_allocation()
+        else:
+            self._build_occupancy()
+            hints = self._hints_from_previous_lessons(lessons) if self.hint == 'active' else {}
+
+        with self.stats.phase('build_model'):
+            model = cp_model.CpModel()
+            starts = self._add_lesson_variables(model, lessons)
+            self._add_hard_constraints(model, lessons, starts)
+
+            # Drop hints that point at cells the lesson can no longer use
+            hints = {i: bit for i, bit in hints.items() if bit in starts[i]}
+            hints = self._symmetric_hints(lessons, hints)
+            self.hints_given = len(hints)
+            repeats = self._add_objective(model, lessons, starts, hints if self.hint == 'active' else {})
+
+            # Hint every variable, so the solver can take the hint as a complete solution
+            hinted = {}
+            for i, lesson_vars in enumerate(starts):
+                hinted_bit = hints.get(i)
+                for bit, var in lesson_vars.items():
+                    hinted[var.Index()] = 1 if bit == hinted_bit else 0
+                    model.AddHint(var, hinted[var.Index()])
+            for repeat_var, day_vars in repeats:
+                model.AddHint(repeat_var, max(0, sum(hinted[var.Index()] for var in day_vars) - 1))
+
         solver = cp_model.CpSolver()
-        self.create_variables()
-        self.add_constraints()
-        status = solver.Solve(self.model)
-        return status
-
-    def print_solution(self):
-        for i in range(self.num_classes):
-            for j in range(self.num_slots):
-                if self.schedule[i][j].solution_value() == 1:
-                    print(f'Class {i} is scheduled in slot {j}')
-
-# Sample usage
-if __name__ == '__main__':
-    num_classes = 5  # Example number of classes
-    num_slots = 10   # Example number of time slots
-    num_teachers = 3  # Example number of teachers
-    timetable_generator = TimetableGenerator(num_classes, num_slots, num_teachers)
-    if timetable_generator.solve() == cp_model.OPTIMAL:
-        timetable_generator.print_solution()
-    else:
-        print('No solution found.')
+        solver.parameters.max_time_in_seconds = self.time_limit
+        solver.parameters.num_search_workers = self.num_workers
+        if self.seed is not None:
+            solver.parameters.random_seed = self.seed
+        with self.stats.phase('solve'):
+            if self.progress_callback:
+                sizes = [len(self.lessons.members(lesson)) for lesson in lessons]
+                status = solver.Solve(model, _PlacementProgress(starts, sizes, self._report_progress))
+            else:
+                status = solver.Solve(model)
+        self.solver_status = solver.StatusName(status)
+
+        if status == cp_model.UNKNOWN:
+            # Out of time before a first solution: keep the hint and fill in greedily
+            self._allocate_from_hints(lessons, hints)
+        elif status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            raise ValueError(f"CP-SAT found no timetable ({self.solver_status})")
+        else:
+            self.unplaced_lessons = 0
+            self.hints_kept = 0
+            for i, (lesson, lesson_vars) in enumerate(zip(lessons, starts)):
+                placed_bit = next((bit for bit, var in lesson_vars.items() if solver.BooleanValue(var)), None)
+                if placed_bit is None:
+                    self.unplaced_lessons += len(self.lessons.members(lesson))
+                    continue
+                if hints.get(i) == placed_bit:
+                    self.hints_kept += 1
+                self._allocate_unit(lesson, placed_bit)
+        self.stats.counters['hints_given'] = self.hints_given
+        self.stats.counters['hints_kept'] = self.hints_kept
+
+    def _allocate_from_hints(self, lessons, hints):
+        """Place every hinted lesson whose cell is still free, then the rest greedily"""
+        self.stats.counters['solver_fallbacks'] += 1
+        store = self.lessons
+        self.hints_kept = 0
+        for i, bit in hints.items():
+            lesson = lessons[i]
+            slot_level = self.snapshot.classes[store.class_ids[lesson]].slot_level
+            if self._unit_mask(lesson, slot_level) >> bit & 1:
+                self._allocate_unit(lesson, bit)
+                self.hints_kept += 1
+
+        remaining = [
+            (pair, [lesson for lesson in lessons_list if not store.is_placed(lesson)])
+            for pair, lessons_list in self._order_lessons()
+        ]
+        self._place_lessons([(pair, lessons_list) for pair, lessons_list in remaining if lessons_list])
+        self.unplaced_lessons = store.unplaced_count()
+
+    def _symmetry_key(self, lesson):
+        """Lessons with equal keys are interchangeable: same class, length, subjects and teachers"""
+        store = self.lessons
+        return (store.class_ids[lesson], store.doubles[lesson]) + tuple(
+            (store.subject_ids[member], store.teacher_ids[member]) for member in store.members(lesson)
+        )
+
+    def _symmetric_hints(self, lessons, hints):
+        """Move hints onto the first lessons of each set of interchangeable lessons
+
+        The model places interchangeable lessons in order (see _add_hard_constraints),
+        so a hint that places a later one while an earlier one stays empty would be
+        infeasible. The hinted cells are kept, only handed to the lessons in order.
+        """
+        chains = defaultdict(list)
+        for i, lesson in enumerate(lessons):
+            chains[self._symmetry_key(lesson)].append(i)
+
+        ordered = {}
+        for chain in chains.values():
+            cells = [hints[i] for i in chain if i in hints]
+            ordered.update(zip(chain, cells))
+        return ordered
+
+    def _ordered_lessons(self):
+        """Lesson ids of all groups in a stable order (same order as the greedy pass), block leads only"""
+        store = self.lessons
+        sorted_lessons = sorted(store.groups.items(), key=lambda x: len(x[1]), reverse=True)
+        return [lesson for _, lessons_list in sorted_lessons for lesson in lessons_list if store.is_lead(lesson)]
+
+    def _hints_from_allocation(self, lessons):
+        """Map lesson index -> start bit for every lesson placed by the greedy pass"""
+        starts = self.lessons.starts
+        return {i: starts[lesson] for i, lesson in enumerate(lessons) if starts[lesson] != UNPLACED}
+
+    def _hints_from_previous_lessons(self, lessons):
+        """Map lesson index -> start bit from the active timetable's Lesson rows
+
+        Lessons are matched on class, subject and single/double, not teacher, so a
+        swapped teacher still inherits the old slot. Saved doubles are two rows on
+        consecutive cells and are paired back into one start.
+        """
+        singles = defaultdict(list)
+        double_cells = defaultdict(set)
+        for class_id, subject_id, slot_id, day, is_double in self.previous_lessons:
+            slot = self.snapshot.time_slots.get(slot_id)
+            if slot is None or slot.slot_type != 'lesson':
+                continue
+            bit = self.lattice.bit(lesson_day(day, slot.period), slot.period)
+            if is_double:
+                double_cells[(class_id, subject_id)].add(bit)
+            else:
+                singles[(class_id, subject_id)].append(bit)
+
+        doubles = defaultdict(list)
+        for key, cells in double_cells.items():
+            for bit in sorted(cells):
+                if bit in cells and bit + 1 in cells:
+                    doubles[key].append(bit)
+                    cells.discard(bit)
+                    cells.discard(bit + 1)
+
+        store = self.lessons
+        hints = {}
+        for i, lesson in enumerate(lessons):
+            key = (store.class_ids[lesson], store.subject_ids[lesson])
+            previous = doubles[key] if store.doubles[lesson] else singles[key]
+            if previous:
+                hints[i] = previous.pop(0)
+        return hints
+
+    def _add_lesson_variables(self, model, lessons):
+        """One bool per (lesson, feasible start cell)"""
+        store = self.lessons
+        starts = []
+        for i, lesson in enumerate(lessons):
+            level = self.snapshot.classes[store.class_ids[lesson]].slot_level
+            mask = self.open_masks.get(level, 0)
+            if store.doubles[lesson]:
+                mask &= self.double_start_masks[level]
+            starts.append({
+                bit: model.NewBoolVar(f'lesson_{i}_cell_{bit}')
+                for bit in OccupancyGrid.iter_bits(mask)
+            })
+        return starts
+
+    def _add_hard_constraints(self, model, lessons, starts):
+        store = self.lessons
+        cell_users = defaultdict(list)  # (resource, cell) -> vars covering that cell
+        teacher_load = defaultdict(list)
+
+        for lesson, lesson_vars in zip(lessons, starts):
+            # Each lesson is placed at most once; unplaced lessons cost the objective
+            model.AddAtMostOne(lesson_vars.values())
+
+            length = store.length(lesson)
+            # A block holds the class once and every member's teacher and lab
+            resources = [('class', store.class_ids[lesson])]
+            for member in store.members(lesson):
+                resources.append(('teacher', store.teacher_ids[member]))
+                if store.practicals[member]:
+                    resources.append(('lab', self.snapshot.subjects[store.subject_ids[member]].lab))
+
+            for bit, var in lesson_vars.items():
+                for cell in range(bit, bit + length):
+                    for resource in resources:
+                        cell_users[(resource, cell)].append(var)
+                for member in store.members(lesson):
+                    teacher_load[store.teacher_ids[member]].append((var, length))
+
+        # HC1.1 / HC2.1 / HC4: one lesson per teacher, stream and lab per cell
+        for users in cell_users.values():
+            if len(users) > 1:
+                model.AddAtMostOne(users)
+
+        # HC1.3: Teacher cannot exceed load
+        for terms in teacher_load.values():
+            model.Add(sum(length * var for var, length in terms) <= 30)
+
+        # Identical lessons are interchangeable - place them in order to cut symmetric search
+        previous = {}
+        for lesson, lesson_vars in zip(lessons, starts):
+            key = self._symmetry_key(lesson)
+            if key in previous:
+                model.Add(sum(lesson_vars.values()) <= sum(previous[key].values()))
+            previous[key] = lesson_vars
+
+    def _add_objective(self, model, lessons, starts, stable_cells):
+        """Set the objective; returns the (repeats, day vars) pairs of SP1.3 so they can be hinted"""
+        store = self.lessons
+        terms = []
+        weights = self.weights
+        daily = defaultdict(list)  # (class_id, subject_id, day) -> vars
+
+        for i, (lesson, lesson_vars) in enumerate(zip(lessons, starts)):
+            subjects = [self.snapshot.subjects[store.subject_ids[member]] for member in store.members(lesson)]
+            last_mask = self.lattice.last_masks[self.snapshot.classes[store.class_ids[lesson]].slot_level]
+            for bit, var in lesson_vars.items():
+                day, period = self.occupancy.cell(bit)
+                score = 0
+                for subject in subjects:
+                    score += PLACED_LESSON_WEIGHT
+                    # SP1.1: Math preferably in morning (periods 1-4)
+                    if subject.name == 'Mathematics' and period <= 4:
+                        score += weights['math_morning']
+                    # SP3.1: Avoid heavy subjects last period
+                    if not last_mask >> bit & 1 and subject.is_math_heavy:
+                        score += weights['heavy_not_last']
+                    daily[(store.class_ids[lesson], subject.id, day)].append(var)
+                # Keep the new timetable close to the published one
+                if stable_cells.get(i) == bit:
+                    score += STABILITY_BONUS
+                terms.append(score * var)
+
+        # SP1.3: Avoid repeating subject same day
+        repeat_vars = []
+        for key, day_vars in daily.items():
+            if len(day_vars) > 1:
+                repeats = model.NewIntVar(0, len(day_vars), f'repeats_{key[0]}_{key[1]}_{key[2]}')
+                model.Add(repeats >= sum(day_vars) - 1)
+                terms.append(-weights['subject_variety'] * repeats)
+                repeat_vars.append((repeats, day_vars))
+
+        model.Maximize(sum(terms))
+        return repeat_vars
+
+
+if cp_model is not None:
+    class _PlacementProgress(cp_model.CpSolverSolutionCallback):
+        """Reports how many lessons each improving solution places, counting every member of a block"""
+
+        def __init__(self, starts, sizes, report):
+            super().__init__()
+            self.starts = starts
+            self.sizes = sizes  # lessons in each unit of ``starts``
+            self.report = report
+
+        def OnSolutionCallback(self):
+            placed = sum(
+                size for lesson_vars, size in zip(self.starts, self.sizes)
+                if any(self.BooleanValue(var) for var in lesson_vars.values())
+            )
+            self.report(placed, sum(self.sizes))
@@ -0,0 +1,381 @@
+"""Benchmark the timetable generator on synthetic schools.
+
+Builds schools of configurable size straight into a scratch SQLite database, runs
+``TimetableGenerator`` phase by phase, as ``generate()`` does, and reports time,
+query count and peak memory per phase plus the placement rate. Results are written as JSON so runs can be
+compared; ``--compare`` flags phases that got slower than a saved baseline.
+
+    python benchmark.py --streams 2 4 8 --repeat 3 --output bench.json
+    python benchmark.py --streams 2 4 8 --repeat 3 --compare bench.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+# name, code, lessons per week
+SUBJECT_CATALOG = [
+    ('Mathematics', 'MAT', 5),
+    ('English', 'ENG', 5),
+    ('Kiswahili', 'KIS', 4),
+    ('Physics', 'PHY', 4),
+    ('Chemistry', 'CHE', 4),
+    ('Biology', 'BIO', 4),
+    ('History', 'HIS', 3),
+    ('Geography', 'GEO', 3),
+    ('Computer Science', 'CS', 3),
+    ('Christian Religious Education', 'CRE', 3),
+    ('Business Studies', 'BST', 3),
+    ('Agriculture', 'AGR', 3),
+    ('French', 'FRE', 3),
+    ('Music', 'MUS', 2)
+]
+CLASS_LEVELS = {
+    'grade10-12': ('Grade 10', 'Grade 11', 'Grade 12'),
+    'form3-4': ('Form 3', 'Form 4')
+}
+PERIODS_PER_DAY = 10
+MAX_TEACHER_LOAD = 30
+
+# The phases of TimetableGenerator.generate(), in the order it runs them
+PHASES = (
+    'validate', 'load_data', 'feasibility', 'create_lessons', 'allocate_lessons', 'local_search', 'save_timetable'
+)
+
+# Phases faster than this (seconds) are too noisy to flag as regressions
+NOISE_FLOOR = 0.005
+
+
+def synthesize_school(db, streams, subjects=9, teachers_per_subject=2, stroked_groups=1, doubles=1):
+    """Insert a synthetic school and return its id
+
+    Every class level gets ``streams`` classes and the first ``subjects`` catalog
+    subjects. Practical subjects get ``doubles`` double lessons a week. Teachers per
+    subject are raised above ``teachers_per_subject`` when needed to keep every
+    teacher under the 30-period load cap.
+    """
+    from app.models import (
+        School, Teacher, Subject, Class, TimeSlot, SubjectAssignment,
+        StrokedSubjectGroup, StrokedGroupSubject, ConcurrentSubject
+    )
+    from app.snapshot import PRACTICAL_SUBJECTS
+
+    tag = uuid.uuid4().hex[:8]
+    school = School(name=f'Benchmark {tag}', email=f'{tag}@benchmark.invalid', location='Benchmark')
+    school.set_password(tag)
+    db.session.add(school)
+    db.session.commit()
+
+    def insert(model, rows):
+        if rows:
+            db.session.execute(model.__table__.insert(), rows)
+
+    # Ids are needed to wire assignments, so read them back after each bulk insert
+    def ids(model, **filters):
+        return [row.id for row in model.query.filter_by(school_id=school.id, **filters).order_by(model.id).all()]
+
+    catalog = SUBJECT_CATALOG[:subjects]
+    insert(TimeSlot, [
+        {
+            'school_id': school.id, 'period': period, 'level': slot_level, 'slot_type': 'lesson',
+            'start_time': _clock(8 * 60 + (period - 1) * 40), 'end_time': _clock(8 * 60 + period * 40)
+        }
+        for slot_level in CLASS_LEVELS
+        for period in range(1, PERIODS_PER_DAY + 1)
+    ])
+    insert(Subject, [
+        {
+            'school_id': school.id, 'name': name, 'code': f'{code}-{slot_level}',
+            'max_lessons_per_week': lessons, 'offered_for': slot_level,
+            'double_lessons_per_week': min(doubles, lessons // 2) if name in PRACTICAL_SUBJECTS else 0
+        }
+        for slot_level in CLASS_LEVELS
+        for name, code, lessons in catalog
+    ])
+    insert(Class, [
+        {'school_id': school.id, 'name': f'Stream {stream + 1}', 'level': level}
+        for levels in CLASS_LEVELS.values()
+        for level in levels
+        for stream in range(streams)
+    ])
+    db.session.flush()
+
+    subject_rows = Subject.query.filter_by(school_id=school.id).order_by(Subject.id).all()
+    class_ids = {
+        slot_level: [c.id for c in Class.query.filter(Class.school_id == school.id, Class.level.in_(levels)).order_by(Class.id)]
+        for slot_level, levels in CLASS_LEVELS.items()
+    }
+
+    teacher_rows = []
+    for subject in subject_rows:
+        classes = len(class_ids[subject.offered_for])
+        needed = math.ceil(classes * subject.max_lessons_per_week / MAX_TEACHER_LOAD)
+        for k in range(max(teachers_per_subject, needed)):
+            teacher_rows.append({
+                'school_id': school.id,
+                'name': f'{subject.name} Teacher {k + 1} ({subject.offered_for})',
+                'employee_id': f'{subject.code}-{k + 1}'
+            })
+    insert(Teacher, teacher_rows)
+    teacher_ids = iter(ids(Teacher))
+
+    # Classes are dealt round-robin to the subject's teachers
+    assignment_rows = []
+    for subject in subject_rows:
+        classes = class_ids[subject.offered_for]
+        needed = math.ceil(len(classes) * subject.max_lessons_per_week / MAX_TEACHER_LOAD)
+        subject_teachers = [next(teacher_ids) for _ in range(max(teachers_per_subject, needed))]
+        for i, class_id in enumerate(classes):
+            assignment_rows.append({
+                'school_id': school.id, 'subject_id': subject.id, 'class_id': class_id,
+                'teacher_id': subject_teachers[i % len(subject_teachers)]
+            })
+    insert(SubjectAssignment, assignment_rows)
+
+    # Stroked groups pair up the optional subjects at the end of the catalog
+    optional = [name for name, _, _ in catalog[6:]]
+    for slot_level in CLASS_LEVELS:
+        level_subjects = {s.name: s.id for s in subject_rows if s.offered_for == slot_level}
+        for g in range(min(stroked_groups, len(optional) // 2)):
+            names = optional[2 * g:2 * g + 2]
+            insert(StrokedSubjectGroup, [{
+                'school_id': school.id, 'group_name': '/'.join(names), 'level': slot_level
+            }])
+            group_id = ids(StrokedSubjectGroup, group_name='/'.join(names), level=slot_level)[0]
+            insert(StrokedGroupSubject, [
+                {'group_id': group_id, 'subject_id': level_subjects[name]} for name in names
+            ])
+            # As the stroked route does, the group's subjects are concurrent (scheduled as one block)
+            insert(ConcurrentSubject, [{
+                'school_id': school.id, 'subject_id': level_subjects[names[0]],
+                'concurrent_subject_id': level_subjects[names[1]]
+            }])
+
+    db.session.commit()
+    return school.id
+
+
+def _clock(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def run_once(db, school_id, seed, trace_memory=True, local_search_seconds=0):
+    """Run one generation phase by phase, as generate() does, and return its measurements"""
+    from sqlalchemy import event
+    from app.timetable_generator import TimetableGenerator
+
+    queries = [0]
+
+    def count_query(*args):
+        queries[0] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', count_query)
+    db.session.expire_all()
+    generator = TimetableGenerator(school_id, seed=seed, local_search_seconds=local_search_seconds)
+
+    def local_search():
+        # As in generate(), local search runs only when it has a budget
+        if generator.local_search_seconds or generator.local_search_iterations:
+            generator._improve_allocation()
+
+    steps = (
+        ('validate', generator._validate_hard_constraints_setup),
+        ('load_data', generator._load_data),
+        ('feasibility', generator.check_feasibility),
+        ('create_lessons', generator._create_lessons),
+        ('allocate_lessons', generator._allocate_lessons),
+        ('local_search', local_search),
+        ('save_timetable', generator._save_timetable)
+    )
+
+    phases = {}
+    try:
+        if trace_memory:
+            tracemalloc.start()
+        for name, step in steps:
+            queries_before = queries[0]
+            if trace_memory:
+                tracemalloc.reset_peak()
+            started = time.perf_counter()
+            step()
+            phases[name] = {
+                'seconds': time.perf_counter() - started,
+                'queries': queries[0] - queries_before,
+                'peak_memory_bytes': tracemalloc.get_traced_memory()[1] if trace_memory else None
+            }
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        event.remove(db.engine, 'before_cursor_execute', count_query)
+
+    lessons_total = len(generator.lessons)
+    lessons_placed = lessons_total - generator._unplaced_count()
+    return {
+        'seed': seed,
+        'phases': phases,
+        'total_seconds': sum(p['seconds'] for p in phases.values()),
+        'queries': sum(p['queries'] for p in phases.values()),
+        'peak_memory_bytes': max(p['peak_memory_bytes'] for p in phases.values()) if trace_memory else None,
+        'lessons_total': lessons_total,
+        'lessons_placed': lessons_placed,
+        'placement_rate': lessons_placed / lessons_total if lessons_total else 1.0
+    }
+
+
+def summarize(runs):
+    """Medians for timings, worst case for placement, memory and queries"""
+    summary = {
+        phase: statistics.median(run['phases'][phase]['seconds'] for run in runs)
+        for phase in PHASES
+    }
+    summary['total_seconds'] = statistics.median(run['total_seconds'] for run in runs)
+    summary['placement_rate'] = min(run['placement_rate'] for run in runs)
+    summary['queries'] = max(run['queries'] for run in runs)
+    memory = [run['peak_memory_bytes'] for run in runs if run['peak_memory_bytes'] is not None]
+    summary['peak_memory_bytes'] = max(memory) if memory else None
+    return summary
+
+
+def compare(results, baseline, threshold):
+    """Return human-readable regressions of ``results`` against a baseline report"""
+    baseline_cases = {json.dumps(case['fixture'], sort_keys=True): case['summary'] for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        before = baseline_cases.get(json.dumps(case['fixture'], sort_keys=True))
+        if before is None:
+            continue
+        after = case['summary']
+        label = ', '.join(f'{k}={v}' for k, v in case['fixture'].items())
+        for key in PHASES + ('total_seconds',):
+            if key not in before:
+                continue  # a phase the baseline's version did not time
+            if after[key] > before[key] * (1 + threshold) and after[key] - before[key] > NOISE_FLOOR:
+                regressions.append(f'[{label}] {key}: {before[key]:.3f}s -> {after[key]:.3f}s')
+        if after['placement_rate'] < before['placement_rate'] - 1e-9:
+            regressions.append(
+                f"[{label}] placement rate: {before['placement_rate']:.2%} -> {after['placement_rate']:.2%}"
+            )
+        if after['queries'] > before['queries']:
+            regressions.append(f"[{label}] queries: {before['queries']} -> {after['queries']}")
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--streams', type=int, nargs='+', default=[2, 4, 8],
+                        help='streams per class level; one benchmark case per value')
+    parser.add_argument('--subjects', type=int, default=9,
+                        help=f'subjects per level (max {len(SUBJECT_CATALOG)})')
+    parser.add_argument('--teachers-per-subject', type=int, default=2,
+                        help='minimum teachers per subject and level')
+    parser.add_argument('--stroked-groups', type=int, default=1, help='stroked groups per level')
+    parser.add_argument('--doubles', type=int, default=1, help='double lessons per practical subject')
+    parser.add_argument('--repeat', type=int, default=3, help='generation runs per case')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first run')
+    parser.add_argument('--local-search-seconds', type=float,
+                        help='local search budget per run (default: the LOCAL_SEARCH_SECONDS setting; 0 skips it)')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip tracemalloc (it slows allocation down noticeably)')
+    parser.add_argument('--database', help='SQLite file to build the schools in (default: a temporary file)')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', help='baseline JSON report to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown reported as a regression (default 0.2)')
+    args = parser.parse_args(argv)
+
+    if not 1 <= args.subjects <= len(SUBJECT_CATALOG):
+        parser.error(f'--subjects must be between 1 and {len(SUBJECT_CATALOG)}')
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    scratch = None
+    database = args.database
+    if database is None:
+        scratch = tempfile.TemporaryDirectory(prefix='timetable-benchmark-')
+        database = os.path.join(scratch.name, 'benchmark.db')
+    os.environ['BENCHMARK_DATABASE_URI'] = 'sqlite:///' + os.path.abspath(database)
+
+    from app import create_app, db
+
+    app = create_app('benchmark')
+    local_search_seconds = args.local_search_seconds
+    if local_search_seconds is None:
+        local_search_seconds = app.config['LOCAL_SEARCH_SECONDS']
+    report = {
+        'created_at': datetime.utcnow().isoformat() + 'Z',
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'memory_traced': not args.no_memory,
+        'local_search_seconds': local_search_seconds,
+        'cases': []
+    }
+    with app.app_context():
+        for streams in args.streams:
+            fixture = {
+                'streams': streams,
+                'subjects': args.subjects,
+                'teachers_per_subject': args.teachers_per_subject,
+                'stroked_groups': args.stroked_groups,
+                'doubles': args.doubles
+            }
+            school_id = synthesize_school(db, **fixture)
+            runs = [
+                run_once(db, school_id, args.seed + i, not args.no_memory, local_search_seconds)
+                for i in range(args.repeat)
+            ]
+            summary = summarize(runs)
+            report['cases'].append({'fixture': fixture, 'summary': summary, 'runs': runs})
+            print(
+                f"streams={streams}: {summary['total_seconds']:.3f}s, "
+                f"{summary['placement_rate']:.2%} placed, {summary['queries']} queries, "
+                + ', '.join(f'{phase} {summary[phase]:.3f}s' for phase in PHASES),
+                file=sys.stderr
+            )
+        db.engine.dispose()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if scratch is not None:
+        scratch.cleanup()
+
+    if baseline is not None:
+        if baseline.get('memory_traced') != report['memory_traced']:
+            print('warning: only one of the runs traced memory, so timings are not comparable', file=sys.stderr)
+        regressions = compare(report, baseline, args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}', file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,14 +6,58 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = 'your-secret-key-change-in-production'
     
+    # CP-SAT timetable engine
+    SOLVER_TIME_LIMIT = 60  # seconds
+    SOLVER_NUM_WORKERS = 8
+    
+    # Local search (ejection-chain repair + simulated annealing) after the greedy engine; 0 disables.
+    # Caps the annealing, which usually ends sooner (see ITERATIONS_PER_UNIT in app/local_search.py)
+    LOCAL_SEARCH_SECONDS = 2
+    
+    # Portfolio engine: variants raced in parallel worker processes
+    PORTFOLIO_VARIANTS = 8
+    PORTFOLIO_WORKERS = os.cpu_count() or 1
+    PORTFOLIO_DEADLINE = 60  # seconds
+    
+    # Decomposed engine: slot levels placed in parallel worker processes
+    LEVEL_WORKERS = os.cpu_count() or 1
+    
+    # /metrics is served only when a token is set, to scrapers sending "Authorization: Bearer <token>"
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    
+    # Rendered timetable pages kept in memory per web worker
+    TIMETABLE_CACHE_BYTES = 64 * 1024 * 1024
+    
+    # Background generation jobs
+    MAX_CONCURRENT_GENERATIONS = 2  # worker processes per host
+    JOB_HEARTBEAT_INTERVAL = 10  # seconds
+    JOB_STALE_AFTER = 120  # seconds without a heartbeat before a running job is requeued
+    JOB_MAX_ATTEMPTS = 3
+    
+    # `flask generate-timetables`: schools generated in parallel worker processes
+    BATCH_WORKERS = os.cpu_count() or 1
+    
 class DevelopmentConfig(Config):
     DEBUG = True
 
 class ProductionConfig(Config):
     DEBUG = False
 
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'  # in memory, one database per app
+    LOCAL_SEARCH_SECONDS = 0
+
+class BenchmarkConfig(Config):
+    # benchmark.py points this at a scratch database before creating the app
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'BENCHMARK_DATABASE_URI', 'sqlite:///' + os.path.join(Config.BASE_DIR, 'benchmark.db')
+    )
+
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'testing': TestingConfig,
+    'benchmark': BenchmarkConfig,
     'default': DevelopmentConfig
 }
@@ -0,0 +1,138 @@
+from collections import Counter
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app, db
+from benchmark import synthesize_school
+
+
+def pytest_addoption(parser):
+    parser.addoption('--run-slow', action='store_true', help='also run tests marked slow (benchmarks)')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'slow: benchmark tests, skipped unless --run-slow is given')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--run-slow'):
+        return
+    skip = pytest.mark.skip(reason='benchmark - run with --run-slow')
+    for item in items:
+        if 'slow' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+# Two synthetic schools (see benchmark.synthesize_school) that differ in every table's row count
+SCHOOL_SIZES = (
+    {'streams': 1, 'subjects': 3, 'teachers_per_subject': 1},
+    {'streams': 4, 'subjects': 9, 'teachers_per_subject': 3}
+)
+
+
+@pytest.fixture
+def schools(app):
+    """Ids of a small and a large school, for checking that statement counts do not grow"""
+    return [synthesize_school(db, **fixture) for fixture in SCHOOL_SIZES]
+
+
+@pytest.fixture
+def feasible_school(app):
+    """Id of a school without capacity violations where a plain greedy pass still leaves a lesson unplaced"""
+    return synthesize_school(db, streams=2, subjects=9, teachers_per_subject=2)
+
+
+@pytest.fixture
+def count_statements(app):
+    """Context manager counting the SQL statements run inside it
+
+        with count_statements() as statements:
+            ...
+        assert len(statements) == 3
+    """
+    @contextmanager
+    def count():
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        db.session.remove()  # start from an empty identity map, so nothing is already loaded
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    return count
+
+
+@pytest.fixture
+def login(app):
+    """Test client logged in as a school"""
+    def login_as(school_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(school_id)
+            session['_fresh'] = True
+        return client
+    return login_as
+
+
+@pytest.fixture
+def allocate(app):
+    """Runs a generator through lesson allocation, without local search or saving, and returns it"""
+    def run(generator):
+        generator._load_data()
+        generator.check_feasibility()
+        generator._create_lessons()
+        generator._allocate_lessons()
+        return generator
+    return run
+
+
+@pytest.fixture
+def placement_problems():
+    """Hard-constraint breaks in a generator's allocation, rebuilt from its lesson store
+
+    Returns a list of descriptions: a teacher, class or lab holding two lessons in one
+    cell (block members share their class cell), a lesson starting outside the open
+    cells of its level (a double outside the cells a double may start at) and a
+    teacher over the weekly load cap.
+    """
+    def problems(generator):
+        store = generator.lessons
+        lattice = generator.lattice
+        snapshot = generator.snapshot
+        held = Counter()
+        load = Counter()
+        found = []
+        for lesson in store.placed():
+            start = store.starts[lesson]
+            level = snapshot.classes[store.class_ids[lesson]].slot_level
+            allowed = lattice.double_start_masks[level] if store.doubles[lesson] else lattice.open_masks[level]
+            if not allowed >> start & 1:
+                found.append(f'lesson {lesson} starts at closed cell {start}')
+            cells = range(start, start + store.length(lesson))
+            load[store.teacher_ids[lesson]] += len(cells)
+            for bit in cells:
+                held[('teacher', store.teacher_ids[lesson], bit)] += 1
+                if store.practicals[lesson]:
+                    held[('lab', snapshot.subjects[store.subject_ids[lesson]].lab, bit)] += 1
+                if store.is_lead(lesson):
+                    held[('class', store.class_ids[lesson], bit)] += 1
+        found.extend(f'{kind} {key} holds {count} lessons at cell {bit}'
+                     for (kind, key, bit), count in held.items() if count > 1)
+        found.extend(f'teacher {teacher_id} teaches {periods} periods'
+                     for teacher_id, periods in load.items() if periods > 30)
+        return found
+    return problems
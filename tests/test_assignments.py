@@ -0,0 +1,23 @@
+from app.timetable_generator import TimetableGenerator
+
+
+def test_assignments_page_statements_do_not_grow_with_rows(schools, login, count_statements):
+    counts = []
+    for school_id in schools:
+        client = login(school_id)
+        with count_statements() as statements:
+            response = client.get('/school/assignments')
+        assert response.status_code == 200
+        counts.append(len(statements))
+
+    assert counts[0] == counts[1]
+
+
+def test_validation_statements_do_not_grow_with_assignments(schools, count_statements):
+    counts = []
+    for school_id in schools:
+        with count_statements() as statements:
+            TimetableGenerator(school_id)._validate_hard_constraints_setup()
+        counts.append(len(statements))
+
+    assert counts[0] == counts[1]
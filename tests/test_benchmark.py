@@ -0,0 +1,43 @@
+import time
+
+import pytest
+
+from app.timetable_generator import TimetableGenerator
+
+
+def _generator_with_lessons(school_id, count):
+    """A generator whose store holds ``count`` placed single lessons, spread over the open cells"""
+    generator = TimetableGenerator(school_id)
+    generator._load_data()
+    generator._build_occupancy()
+    snapshot = generator.snapshot
+    cells = {level: sorted(generator.slots_by_bit[level]) for level in generator.slots_by_bit}
+    assignments = snapshot.assignments
+    store = generator.lessons
+    for i in range(count):
+        assignment = assignments[i % len(assignments)]
+        lesson = store.add(assignment.class_id, assignment.subject_id, assignment.teacher_id, False, False)
+        level_cells = cells[snapshot.classes[assignment.class_id].slot_level]
+        store.starts[lesson] = level_cells[i // len(assignments) % len(level_cells)]
+    return generator
+
+
+# Saved lessons -> upper bound on _save_timetable seconds (generous, for slow CI machines)
+SAVE_BOUNDS = {1_000: 1, 10_000: 5, 50_000: 20}
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize('lessons', sorted(SAVE_BOUNDS))
+def test_save_timetable_benchmark(schools, count_statements, lessons):
+    generator = _generator_with_lessons(schools[0], lessons)
+
+    with count_statements() as statements:
+        started = time.perf_counter()
+        timetable = generator._save_timetable()
+        seconds = time.perf_counter() - started
+
+    print(f'\n_save_timetable: {lessons} lessons in {seconds:.3f}s, {len(statements)} statements')
+    assert len(timetable.lessons) == lessons
+    # The timetable row, then one executemany insert for every lesson
+    assert len(statements) == 2
+    assert seconds < SAVE_BOUNDS[lessons]
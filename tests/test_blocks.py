@@ -0,0 +1,47 @@
+import pytest
+
+from app.occupancy import OccupancyGrid
+from app.timetable_generator import TimetableGenerator
+
+
+def test_concurrent_subjects_are_placed_as_blocks(schools, allocate, placement_problems):
+    generator = allocate(TimetableGenerator(schools[1], seed=0))
+    store = generator.lessons
+    group_of = {subject_id: group for group in generator.snapshot.concurrent_groups for subject_id in group}
+
+    assert store.blocks
+    assert len(store.units()) == len(store) - sum(len(members) - 1 for members in store.blocks.values())
+    for members in store.blocks.values():
+        assert len({store.class_ids[member] for member in members}) == 1
+        assert len({group_of[store.subject_ids[member]] for member in members}) == 1
+        assert len({store.teacher_ids[member] for member in members}) == len(members)
+        assert len({store.starts[member] for member in members}) == 1
+    assert placement_problems(generator) == []
+
+
+def test_a_block_takes_one_class_period_for_all_its_members(schools, allocate):
+    generator = allocate(TimetableGenerator(schools[1], seed=0))
+    store = generator.lessons
+    class_id = store.class_ids[next(iter(store.blocks))]
+    units = [lesson for lesson in store.units() if store.class_ids[lesson] == class_id and store.is_placed(lesson)]
+    members = sum(len(store.members(lesson)) for lesson in units)
+
+    assert members > len(units)
+    assert OccupancyGrid.popcount(generator.occupancy.classes[class_id]) == sum(store.length(l) for l in units)
+
+
+def test_cpsat_progress_counts_every_block_member(feasible_school):
+    from app.timetable_generator_ortools import CPSATTimetableGenerator, cp_model
+    if cp_model is None:
+        pytest.skip('OR-Tools is not installed')
+    reports = []
+    generator = CPSATTimetableGenerator(
+        feasible_school, seed=0, time_limit=5, num_workers=1, progress_callback=lambda *report: reports.append(report)
+    )
+    generator.generate()
+
+    assert generator.solver_status in ('OPTIMAL', 'FEASIBLE')
+    assert len(generator.lessons.units()) < len(generator.lessons)
+    # The greedy hint reports first, then each solution CP-SAT finds, all counted in lessons
+    assert {total for _, total in reports} == {len(generator.lessons)}
+    assert reports[-1] == (generator.stats.counters['lessons_placed'], len(generator.lessons))
@@ -0,0 +1,35 @@
+from app import db
+from app.models import School, Teacher, TimeSlot
+from app.timetable_generator import TimetableGenerator
+
+
+def _timetable_page(client, timetable_id):
+    return client.get(f'/timetable/{timetable_id}/view').get_data(as_text=True)
+
+
+def test_time_slot_changes_invalidate_cached_pages(app, schools, login):
+    school_id = schools[0]
+    timetable_id = TimetableGenerator(school_id, seed=0).generate().id
+    client = login(school_id)
+    _timetable_page(client, timetable_id)
+    assert len(app.extensions['timetable_cache'])
+
+    slot = TimeSlot.query.filter_by(school_id=school_id, slot_type='lesson').order_by(TimeSlot.id.desc()).first()
+    client.post(f'/school/timeslot/{slot.id}/delete')
+
+    assert not len(app.extensions['timetable_cache'])
+
+
+def test_pages_cached_before_another_worker_invalidated_are_rebuilt(app, schools, login):
+    school_id = schools[0]
+    timetable_id = TimetableGenerator(school_id, seed=0).generate().id
+    client = login(school_id)
+    teacher = Teacher.query.filter_by(school_id=school_id).first()
+    assert teacher.name in _timetable_page(client, timetable_id)
+
+    # Another web worker renames the teacher: the database changes, this worker's cache does not
+    teacher.name = 'Renamed Teacher'
+    School.query.get(school_id).cache_version = 1
+    db.session.commit()
+
+    assert 'Renamed Teacher' in _timetable_page(client, timetable_id)
@@ -0,0 +1,37 @@
+from app.decomposed import DecomposedTimetableGenerator, share_cells
+from app.lattice import DAYS
+from app.occupancy import OccupancyGrid
+from app.timetable_generator import TimetableGenerator
+
+
+def test_share_cells_splits_a_resource_by_demand():
+    full = (1 << len(DAYS) * 10) - 1
+    masks = share_cells({'grade10-12': 30, 'form3-4': 10}, {'grade10-12': full, 'form3-4': full}, DAYS, 10)
+
+    assert masks['grade10-12'] & masks['form3-4'] == 0
+    assert masks['grade10-12'] | masks['form3-4'] == full
+    assert OccupancyGrid.popcount(masks['grade10-12']) > OccupancyGrid.popcount(masks['form3-4']) >= 10
+
+
+def test_levels_merge_without_clashes(schools, feasible_school, allocate, placement_problems):
+    for school_id in schools + [feasible_school]:
+        generator = allocate(DecomposedTimetableGenerator(school_id, seed=0, max_workers=1))
+
+        assert generator.stats.counters['levels_solved'] == 2
+        assert placement_problems(generator) == []
+
+
+def test_merged_placement_is_at_least_greedy(feasible_school, allocate, placement_problems):
+    greedy = allocate(TimetableGenerator(feasible_school, seed=0))
+    decomposed = allocate(DecomposedTimetableGenerator(feasible_school, seed=0, max_workers=1))
+
+    assert decomposed._unplaced_count() <= greedy._unplaced_count()
+    assert placement_problems(decomposed) == []
+
+
+def test_worker_processes_match_the_in_process_run(feasible_school, allocate, placement_problems):
+    in_process = allocate(DecomposedTimetableGenerator(feasible_school, seed=0, max_workers=1))
+    workers = allocate(DecomposedTimetableGenerator(feasible_school, seed=0, max_workers=2))
+
+    assert list(workers.lessons.starts) == list(in_process.lessons.starts)
+    assert placement_problems(workers) == []
@@ -0,0 +1,55 @@
+from app import db
+from app.models import Class, Subject, SubjectAssignment, TimeSlot
+from app.timetable_generator import TimetableGenerator
+
+
+def _violations(school_id):
+    return TimetableGenerator(school_id).check_feasibility()
+
+
+def test_feasible_school_has_no_violations(feasible_school):
+    generator = TimetableGenerator(feasible_school)
+
+    assert generator.check_feasibility() == []
+    assert generator.stats.counters['feasibility_violations'] == 0
+
+
+def test_over_subscribed_labs_are_reported_on_the_run(schools):
+    generator = TimetableGenerator(schools[1], seed=0)
+    generator.generate()
+    labs = [v for v in generator.feasibility if v.rule == 'lab_periods']
+
+    assert {v.name for v in labs} == {'bio_lab', 'chem_lab', 'physics_lab', 'computer_lab'}
+    assert all(v.demand > v.capacity for v in labs)
+    assert generator.stats.to_dict()['feasibility'] == [v._asdict() for v in generator.feasibility]
+
+
+def test_classes_with_too_few_open_periods_are_reported(schools):
+    TimeSlot.query.filter(TimeSlot.school_id == schools[0], TimeSlot.period > 2).delete()
+    db.session.commit()
+    violations = [v for v in _violations(schools[0]) if v.rule == 'class_periods']
+
+    assert len(violations) == Class.query.filter_by(school_id=schools[0]).count()
+    # Two periods on five days, less the Monday assembly
+    assert all(v.demand > v.capacity == 9 for v in violations)
+
+
+def test_subjects_without_teachers_are_reported(schools):
+    subject = Subject.query.filter_by(school_id=schools[0]).order_by(Subject.id).first()
+    SubjectAssignment.query.filter_by(subject_id=subject.id).delete()
+    db.session.commit()
+
+    assert [(v.rule, v.name) for v in _violations(schools[0])] == [('no_teacher', subject.name)]
+
+
+def test_teachers_over_the_load_cap_are_reported(feasible_school):
+    subject = Subject.query.filter_by(school_id=feasible_school, name='Mathematics', offered_for='grade10-12').one()
+    subject.max_lessons_per_week = 6
+    assignments = SubjectAssignment.query.filter_by(subject_id=subject.id).all()
+    for assignment in assignments:
+        assignment.teacher_id = assignments[0].teacher_id
+    db.session.commit()
+
+    assert [(v.rule, v.name, v.demand, v.capacity) for v in _violations(feasible_school)] == [
+        ('teacher_periods', 'Mathematics', 36, 30)
+    ]
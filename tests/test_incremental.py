@@ -0,0 +1,70 @@
+from collections import Counter, defaultdict
+
+from app import db
+from app.incremental import IncrementalTimetableGenerator
+from app.models import Class, Lesson, Subject
+from app.timetable_generator import TimetableGenerator
+
+
+def _cells_by_pair(timetable):
+    """(class_id, subject_id) -> sorted (teacher_id, time_slot_id, day) rows of a saved timetable"""
+    cells = defaultdict(list)
+    for lesson in Lesson.query.filter_by(timetable_id=timetable.id):
+        cells[(lesson.class_id, lesson.subject_id)].append((lesson.teacher_id, lesson.time_slot_id, lesson.day))
+    return {pair: sorted(rows) for pair, rows in cells.items()}
+
+
+def test_unchanged_school_keeps_every_slot(schools, placement_problems):
+    base = TimetableGenerator(schools[0], seed=0).generate()
+    generator = IncrementalTimetableGenerator(schools[0], seed=0)
+    timetable = generator.generate()
+
+    assert generator.changed_pairs == set()
+    assert _cells_by_pair(timetable) == _cells_by_pair(base)
+    assert placement_problems(generator) == []
+
+
+def test_one_subject_edit_only_moves_its_pairs(schools, placement_problems):
+    base = TimetableGenerator(schools[0], seed=0).generate()
+    subject = Subject.query.filter_by(school_id=schools[0]).order_by(Subject.id).first()
+    subject.max_lessons_per_week += 1
+    db.session.commit()
+    edited_pairs = {
+        (class_obj.id, subject.id) for class_obj in Class.query.filter_by(school_id=schools[0])
+        if class_obj.level.startswith('Grade')
+    }
+
+    generator = IncrementalTimetableGenerator(schools[0], seed=0)
+    timetable = generator.generate()
+
+    assert generator.changed_pairs == edited_pairs
+    before, after = _cells_by_pair(base), _cells_by_pair(timetable)
+    assert {pair: rows for pair, rows in after.items() if pair not in edited_pairs} == {
+        pair: rows for pair, rows in before.items() if pair not in edited_pairs
+    }
+    assert placement_problems(generator) == []
+    assert generator.stats.counters['lessons_placed'] == generator.stats.counters['lessons_total']
+
+
+def _contains(outer, inner):
+    """Whether every row of ``inner`` is also in ``outer``, pair by pair"""
+    return all(not Counter(rows) - Counter(outer.get(pair, ())) for pair, rows in inner.items())
+
+
+def test_lessons_the_base_left_unplaced_are_created_again(schools, placement_problems):
+    full = TimetableGenerator(schools[1], seed=0)
+    previous = full.generate()
+    assert full.stats.counters['lessons_placed'] < full.stats.counters['lessons_total']
+
+    # A second incremental run starts from the first one's timetable, still short of lessons
+    for _ in range(2):
+        generator = IncrementalTimetableGenerator(schools[1], seed=0)
+        timetable = generator.generate()
+        counters = generator.stats.counters
+
+        assert counters['lessons_total'] == full.stats.counters['lessons_total']
+        assert counters['lessons_placed'] >= full.stats.counters['lessons_placed']
+        assert counters['lessons_refilled'] == counters['lessons_total'] - len(generator.kept_lessons)
+        assert _contains(_cells_by_pair(timetable), _cells_by_pair(previous))
+        assert placement_problems(generator) == []
+        previous = timetable
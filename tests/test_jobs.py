@@ -0,0 +1,27 @@
+from app import db
+from app.jobs import ENGINE_LABELS, create_generator, parse_hint
+from app.models import GenerationJob
+
+
+def test_cpsat_generators_start_from_the_greedy_hint_by_default(app, schools):
+    generator = create_generator(schools[0], 'cpsat', app.config)
+
+    assert generator.hint == 'greedy'
+    assert generator.num_workers == app.config['SOLVER_NUM_WORKERS']
+
+
+def test_batch_solver_workers_override_the_config(app, schools):
+    generator = create_generator(schools[0], 'cpsat', app.config, hint=parse_hint('none'), solver_workers=2)
+
+    assert generator.hint is None
+    assert generator.num_workers == 2
+
+
+def test_job_pages_name_each_engine(app, schools, login):
+    client = login(schools[0])
+    for engine, label in ENGINE_LABELS.items():
+        job = GenerationJob(school_id=schools[0], engine=engine, status='done')
+        db.session.add(job)
+        db.session.commit()
+
+        assert f'Job #{job.id} ({label})' in client.get(f'/timetable/jobs/{job.id}').get_data(as_text=True)
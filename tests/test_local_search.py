@@ -0,0 +1,64 @@
+from app import db
+from app.local_search import ITERATIONS_PER_UNIT, LocalSearch
+from app.models import TimeSlot
+from app.timetable_generator import TimetableGenerator
+
+
+def test_repair_places_a_dropped_lesson(schools, allocate, placement_problems):
+    generator = allocate(TimetableGenerator(schools[1], seed=0))
+    store = generator.lessons
+    dropped = next(lesson for lesson in store.placed() if store.practicals[lesson] and store.is_lead(lesson))
+    generator._release_unit(dropped)
+    unplaced = generator._unplaced_count()
+
+    counters = LocalSearch(generator, seed=0, max_iterations=0).run()
+
+    assert store.is_placed(dropped)
+    assert generator._unplaced_count() <= unplaced - counters['ls_repaired']
+    assert placement_problems(generator) == []
+
+
+def test_ejection_chains_place_lessons_greedy_left_unplaced(schools, allocate, placement_problems):
+    # Five periods a day leave the greedy pass well short of room
+    TimeSlot.query.filter(TimeSlot.school_id == schools[1], TimeSlot.period > 5).delete()
+    db.session.commit()
+    generator = allocate(TimetableGenerator(schools[1], seed=0))
+    unplaced = generator._unplaced_count()
+
+    counters = LocalSearch(generator, seed=0, max_iterations=0).run()
+
+    assert counters['ls_repaired'] > 0
+    assert generator._unplaced_count() <= unplaced - counters['ls_repaired']
+    assert placement_problems(generator) == []
+
+
+def test_annealing_never_lowers_the_soft_score(schools, allocate, placement_problems):
+    for school_id in schools:
+        generator = allocate(TimetableGenerator(school_id, seed=0))
+        score = generator._allocation_soft_score()
+        placed = len(generator.lessons) - generator._unplaced_count()
+
+        search = LocalSearch(generator, seed=0, max_iterations=3000)
+        counters = search.run()
+
+        assert generator._allocation_soft_score() == search.score == score + counters['ls_score_gain']
+        assert counters['ls_score_gain'] >= 0
+        assert len(generator.lessons) - generator._unplaced_count() >= placed
+        assert placement_problems(generator) == []
+
+
+def test_annealing_stops_once_no_move_improves_a_complete_allocation(schools, allocate):
+    complete = allocate(TimetableGenerator(schools[0], seed=0))
+    short = allocate(TimetableGenerator(schools[1], seed=0))
+    assert complete._unplaced_count() == 0 < short._unplaced_count()
+
+    assert LocalSearch(complete, seed=0, max_iterations=100000).run()['ls_iterations'] < 100000
+    # Lessons are still unplaced after repair here, so the whole budget is used
+    assert LocalSearch(short, seed=0, max_iterations=3000).run()['ls_iterations'] == 3000
+
+
+def test_generate_scales_the_annealing_budget_with_the_lessons(schools):
+    generator = TimetableGenerator(schools[1], seed=0, local_search_seconds=60)
+    generator.generate()
+
+    assert generator.stats.counters['ls_iterations'] == ITERATIONS_PER_UNIT * len(generator.lessons.units())
@@ -0,0 +1,39 @@
+from app.timetable_generator import TimetableGenerator
+
+
+def _scrape(app, token='secret'):
+    return app.test_client().get('/metrics', headers={'Authorization': f'Bearer {token}'})
+
+
+def _sample(text, name):
+    return next(float(line.split()[-1]) for line in text.splitlines() if line.startswith(name + ' '))
+
+
+def test_metrics_are_off_without_a_token(app):
+    assert _scrape(app).status_code == 404
+
+
+def test_metrics_require_the_token(app):
+    app.config['METRICS_TOKEN'] = 'secret'
+
+    assert app.test_client().get('/metrics').status_code == 401
+    assert _scrape(app, token='wrong').status_code == 401
+
+
+def test_metrics_add_only_new_runs(app, schools, count_statements):
+    app.config['METRICS_TOKEN'] = 'secret'
+    TimetableGenerator(schools[0], seed=0).generate()
+    first = _scrape(app).get_data(as_text=True)
+
+    generator = TimetableGenerator(schools[1], seed=0)
+    generator.generate()
+    with count_statements() as statements:
+        second = _scrape(app).get_data(as_text=True)
+
+    placed = generator.stats.counters['lessons_placed']
+    assert _sample(second, 'timetable_generation_lessons_placed_total') == (
+        _sample(first, 'timetable_generation_lessons_placed_total') + placed
+    )
+    assert 'timetable_generation_runs_total{engine="greedy"} 2' in second
+    # The new runs and the job counts
+    assert len(statements) == 2
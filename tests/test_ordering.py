@@ -0,0 +1,43 @@
+from app.scoring import SlotScorer
+from app.timetable_generator import LESSON_ORDERINGS, TimetableGenerator
+
+
+def test_every_ordering_is_clash_free(schools, allocate, placement_problems):
+    for school_id in schools:
+        for ordering in LESSON_ORDERINGS:
+            generator = allocate(TimetableGenerator(school_id, seed=0, ordering=ordering))
+
+            assert placement_problems(generator) == [], ordering
+
+
+def test_most_constrained_places_at_least_greedy(feasible_school, allocate, placement_problems):
+    greedy = allocate(TimetableGenerator(feasible_school, seed=0))
+    generator = allocate(TimetableGenerator(feasible_school, seed=0, ordering='most_constrained'))
+
+    assert generator._unplaced_count() <= greedy._unplaced_count()
+    assert generator.stats.counters['lessons_rekeyed'] > 0
+    assert placement_problems(generator) == []
+
+
+def test_rank_keeps_the_best_k_cells_in_order(schools, allocate):
+    generator = allocate(TimetableGenerator(schools[1], seed=0))
+    store = generator.lessons
+    lesson = next(lesson for lesson in store.placed() if store.is_lead(lesson))
+    generator._release_unit(lesson)
+    level = generator.snapshot.classes[store.class_ids[lesson]].slot_level
+    mask = generator._unit_mask(lesson, level)
+    scorer = SlotScorer(generator)
+
+    ranked, feasible = scorer.rank(lesson, mask)
+    best, _ = scorer.rank(lesson, mask, 3)
+
+    assert feasible == len(ranked) > 3
+    assert best == ranked[:3]
+
+
+def test_top_k_above_one_varies_with_the_seed(schools, allocate):
+    def starts(seed, top_k):
+        return list(allocate(TimetableGenerator(schools[0], seed=seed, top_k=top_k)).lessons.starts)
+
+    assert starts(0, 1) == starts(1, 1)
+    assert starts(0, 3) != starts(1, 3)
@@ -0,0 +1,39 @@
+import pytest
+
+from app.portfolio import PortfolioTimetableGenerator, default_variants
+from app.timetable_generator import LESSON_ORDERINGS, TimetableGenerator
+from app.timetable_generator_ortools import cp_model
+
+
+def test_default_variants_start_from_plain_greedy():
+    variants = default_variants(len(LESSON_ORDERINGS) + 1, seed=7)
+
+    assert variants[0] == {'engine': 'greedy', 'seed': 7, 'ordering': 'most_lessons', 'top_k': 1}
+    assert {variant['ordering'] for variant in variants} == set(LESSON_ORDERINGS)
+    assert len({variant['seed'] for variant in variants}) == len(variants)
+    assert (variants[-1]['engine'] == 'cpsat') == (cp_model is not None)
+    assert all(variant['engine'] == 'greedy' for variant in default_variants(3, include_cpsat=False))
+
+
+def test_race_keeps_the_best_variant(feasible_school, allocate, placement_problems):
+    greedy = allocate(TimetableGenerator(feasible_school, seed=0))
+    portfolio = PortfolioTimetableGenerator(
+        feasible_school, seed=0, max_workers=2, variants=default_variants(4, include_cpsat=False)
+    )
+    portfolio.generate()
+    counters = portfolio.stats.counters
+
+    assert counters['variants_finished'] == 4
+    assert portfolio.best_result == min(portfolio.results, key=portfolio._rank)
+    assert counters['lessons_placed'] == len(portfolio.lessons) - portfolio._unplaced_count()
+    assert portfolio._unplaced_count() <= greedy._unplaced_count()
+    assert placement_problems(portfolio) == []
+
+
+def test_race_stops_at_the_deadline(feasible_school):
+    portfolio = PortfolioTimetableGenerator(
+        feasible_school, seed=0, max_workers=1, deadline=0.01, variants=default_variants(2, include_cpsat=False)
+    )
+
+    with pytest.raises(ValueError, match='No portfolio variant finished'):
+        portfolio.generate()
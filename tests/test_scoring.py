@@ -0,0 +1,45 @@
+from app import db
+from app.models import School
+from app.scoring import SlotScorer
+from app.timetable_generator import TimetableGenerator
+
+
+def _maths_periods(generator):
+    """Periods every placed Mathematics lesson covers"""
+    store = generator.lessons
+    periods = []
+    for lesson in store.placed():
+        if generator.snapshot.subjects[store.subject_ids[lesson]].name == 'Mathematics':
+            start = store.starts[lesson]
+            periods.extend(generator.occupancy.cell(bit)[1] for bit in range(start, start + store.length(lesson)))
+    return periods
+
+
+def test_vector_scores_match_the_scalar_score(schools, allocate):
+    generator = allocate(TimetableGenerator(schools[1], seed=0))
+    store = generator.lessons
+    scorer = SlotScorer(generator)
+    # Score each lesson against the grid of all the others
+    for lesson in list(store.placed())[:50]:
+        if not store.is_lead(lesson) or store.blocks.get(lesson):
+            continue
+        start = store.starts[lesson]
+        generator._release_unit(lesson)
+        subject = generator.snapshot.subjects[store.subject_ids[lesson]]
+        scores = scorer.scores(lesson)
+        for bit in range(scorer.cell_count):
+            assert scores[bit] == generator._calculate_soft_constraint_score(
+                store.class_ids[lesson], subject.id, store.teacher_ids[lesson], bit, subject, lesson
+            )
+        generator._allocate_unit(lesson, start)
+
+
+def test_school_weights_change_the_chosen_cells(schools, allocate):
+    default = allocate(TimetableGenerator(schools[0], seed=0))
+    School.query.get(schools[0]).soft_weights = {'math_morning': -20}
+    db.session.commit()
+    overridden = allocate(TimetableGenerator(schools[0], seed=0))
+
+    assert overridden.weights['math_morning'] == -20
+    assert all(period <= 4 for period in _maths_periods(default))
+    assert all(period > 4 for period in _maths_periods(overridden))
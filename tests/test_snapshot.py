@@ -0,0 +1,50 @@
+from app.snapshot import SchoolSnapshot
+from app.timetable_generator import TimetableGenerator
+
+
+def test_snapshot_loads_with_one_query_per_table(schools, count_statements):
+    counts = []
+    for school_id in schools:
+        with count_statements() as statements:
+            snapshot = SchoolSnapshot.load(school_id)
+        counts.append(len(statements))
+
+    assert counts[0] == counts[1]
+    assert len(snapshot.classes) == 5 * 4
+
+
+def test_allocation_runs_without_database_access(schools, count_statements):
+    generator = TimetableGenerator(schools[1], seed=0)
+    generator._load_data()
+
+    with count_statements() as statements:
+        generator._create_lessons()
+        generator._allocate_lessons()
+
+    assert statements == []
+    assert generator._unplaced_count() < len(generator.lessons)
+
+
+def test_save_timetable_statements_do_not_grow_with_lessons(schools, count_statements):
+    counts = []
+    for school_id in schools:
+        generator = TimetableGenerator(school_id, seed=0)
+        generator._load_data()
+        generator._create_lessons()
+        generator._allocate_lessons()
+        with count_statements() as statements:
+            generator._save_timetable()
+        counts.append(len(statements))
+
+    assert counts[0] == counts[1]
+
+
+def test_generate_statements_do_not_grow_with_school_size(schools, count_statements):
+    counts = []
+    for school_id in schools:
+        with count_statements() as statements:
+            timetable = TimetableGenerator(school_id, seed=0).generate()
+        counts.append(len(statements))
+        assert timetable.lessons
+
+    assert counts[0] == counts[1]
@@ -0,0 +1,44 @@
+from collections import Counter
+
+from app import db
+from app.assignment import teacher_candidates, weekly_periods
+from app.models import Subject, SubjectAssignment
+from app.timetable_generator import TimetableGenerator
+
+
+def _assigned(school_id, seed=0):
+    generator = TimetableGenerator(school_id, seed=seed)
+    generator._load_data()
+    generator._create_lessons()
+    return generator
+
+
+def test_teachers_follow_the_per_class_assignments(feasible_school):
+    generator = _assigned(feasible_school)
+    candidates = teacher_candidates(generator.snapshot, generator.teacher_for)
+
+    assert generator.teacher_for
+    for pair, teacher_id in generator.teacher_for.items():
+        assert candidates[pair] == [teacher_id]
+
+
+def test_classes_without_their_own_row_are_shared_out_evenly(feasible_school):
+    subject = Subject.query.filter_by(school_id=feasible_school, name='Mathematics', offered_for='grade10-12').one()
+    rows = SubjectAssignment.query.filter_by(subject_id=subject.id).order_by(SubjectAssignment.class_id).all()
+    kept = {rows[0].teacher_id: rows[0], rows[1].teacher_id: rows[1]}
+    for row in rows:
+        if row not in kept.values():
+            db.session.delete(row)
+    db.session.commit()
+
+    for seed in range(3):
+        generator = _assigned(feasible_school, seed)
+        load = Counter()
+        for (class_id, subject_id), teacher_id in generator.teacher_for.items():
+            if subject_id == subject.id:
+                load[teacher_id] += weekly_periods(subject)
+                if class_id in {row.class_id for row in kept.values()}:
+                    assert kept[teacher_id].class_id == class_id
+
+        assert set(load) == set(kept)
+        assert load[rows[0].teacher_id] == load[rows[1].teacher_id] == len(rows) * weekly_periods(subject) // 2
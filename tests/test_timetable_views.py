@@ -0,0 +1,46 @@
+from app import db
+from app.models import Class, Lesson, TimeSlot
+from app.timetable_generator import TimetableGenerator
+
+
+def _add_periods(school_id, *periods):
+    for level in ('grade10-12', 'form3-4'):
+        for period in periods:
+            db.session.add(TimeSlot(school_id=school_id, period=period, level=level, slot_type='lesson',
+                                    start_time=f'{period + 6:02d}:00', end_time=f'{period + 6:02d}:40'))
+    db.session.commit()
+
+
+def test_pages_show_the_schools_own_periods_and_times(schools, login):
+    school_id = schools[1]
+    _add_periods(school_id, 11, 12)
+    timetable = TimetableGenerator(school_id, seed=0).generate()
+    late = Lesson.query.filter(Lesson.timetable_id == timetable.id, Lesson.time_slot.has(period=12)).first()
+    assert late is not None
+    client = login(school_id)
+
+    page = client.get(f'/timetable/{timetable.id}/view').get_data(as_text=True)
+    assert 'P12' in page and '18:00-18:40' in page
+
+    page = client.get(f'/timetable/{timetable.id}/teacher/{late.teacher_id}').get_data(as_text=True)
+    assert 'P12' in page
+
+    page = client.get(f'/timetable/{timetable.id}/class/{late.class_id}').get_data(as_text=True)
+    assert '18:00<br>18:40' in page
+    assert page.count('class="lesson-subject"') == len(
+        {(l.day, l.time_slot_id) for l in Lesson.query.filter_by(timetable_id=timetable.id, class_id=late.class_id)}
+    )
+
+
+def test_period_times_are_left_out_where_levels_differ(schools, login):
+    school_id = schools[0]
+    TimeSlot.query.filter_by(school_id=school_id, level='form3-4', period=1).update({'start_time': '07:30'})
+    db.session.commit()
+    timetable = TimetableGenerator(school_id, seed=0).generate()
+    client = login(school_id)
+
+    page = client.get(f'/timetable/{timetable.id}/view').get_data(as_text=True)
+    assert '07:30' not in page and '08:00-08:40' not in page
+    form_class = Class.query.filter_by(school_id=school_id, level='Form 3').first()
+    page = client.get(f'/timetable/{timetable.id}/class/{form_class.id}').get_data(as_text=True)
+    assert '07:30<br>08:40' in page